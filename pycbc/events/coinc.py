@@ -25,7 +25,7 @@
 coincident triggers.
 """
 
-import numpy, logging, pycbc.pnutils, copy, lal
+import numpy, logging, pycbc.pnutils, copy, lal, itertools
 from pycbc.detector import Detector
 
 
@@ -153,6 +153,233 @@ def calculate_n_louder(bstat, fstat, dec, skip_background=False):
         return fore_n_louder
 
 
+def _chunks(length, chunk_size):
+    """Return the start and end of each chunk of an array"""
+    starts = numpy.arange(0, length, chunk_size)
+    return zip(starts, numpy.minimum(starts + chunk_size, length))
+
+
+def calculate_n_louder_chunked(bstat, fstat, dec, back_cum_num=None,
+                               chunk_size=2**22, tmpdir=None):
+    """ Calculate for each foreground event the number of background events
+    that are louder than it, reading the background a chunk at a time.
+
+    This gives the same numbers as `calculate_n_louder` while holding at
+    most a few chunks of the background in memory, so the background can
+    be read directly from hdf datasets. The foreground numbers only need a
+    single pass over the background. The cumulative numbers of the
+    background are found by an external merge sort, with the sorted runs
+    held in temporary memory mapped files.
+
+    Parameters
+    ----------
+    bstat: numpy.ndarray or h5py.Dataset
+        Array of the background statistic values
+    fstat: numpy.ndarray or scalar
+        Array of the foreground statistic values or single value
+    dec: numpy.ndarray or h5py.Dataset
+        Array of the decimation factors for the background statistics
+    back_cum_num: array-like, optional
+        An array, or h5py.Dataset, of the same length as the background
+        to write the cumulative array of background triggers to.
+    chunk_size: int, optional
+        The number of background events to read at once.
+    tmpdir: str, optional
+        The directory of the temporary files of the merge sort.
+
+    Returns
+    -------
+    fore_n_louder: numpy.ndarray
+        The number of background triggers above each foreground trigger
+    """
+    scalar = numpy.ndim(fstat) == 0
+    fstat = numpy.array(fstat, ndmin=1)
+    fsort = fstat.argsort()
+    fsorted = fstat[fsort]
+
+    # Sum the decimation factors of the background between each pair of
+    # consecutive foreground values, and track the quietest background
+    weights = numpy.zeros(len(fstat) + 1, dtype=dec.dtype)
+    bmin = dmin = None
+    for start, end in _chunks(len(bstat), chunk_size):
+        b = bstat[start:end]
+        d = dec[start:end]
+        nbin = numpy.searchsorted(fsorted, b, side='right')
+        weights += numpy.bincount(nbin, weights=d,
+                                  minlength=len(weights)).astype(dec.dtype)
+        low = b.argmin()
+        if bmin is None or b[low] < bmin:
+            bmin, dmin = b[low], d[low]
+    total = weights.sum()
+
+    # Number of background events at least as loud as each foreground event
+    fore_n_louder = numpy.zeros(len(fstat), dtype=dec.dtype)
+    fore_n_louder[fsort] = weights[::-1].cumsum()[::-1][1:]
+
+    # If the foreground is quieter than all the background, the quietest
+    # background event is not counted, as in calculate_n_louder
+    if bmin is not None:
+        fore_n_louder[fstat <= bmin] = total - dmin
+
+    if back_cum_num is not None:
+        _back_n_louder_chunked(bstat, dec, total, back_cum_num, chunk_size,
+                               tmpdir)
+
+    return fore_n_louder[0] if scalar else fore_n_louder
+
+
+def _back_n_louder_chunked(bstat, dec, total, back_cum_num, chunk_size,
+                           tmpdir):
+    """ Write the cumulative array of background triggers, sorting the
+    background by an external merge sort
+    """
+    import tempfile, shutil
+    tmpdir = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        size = len(bstat)
+
+        def tmp_array(name, dtype):
+            return numpy.memmap('%s/%s' % (tmpdir, name), mode='w+',
+                                dtype=dtype, shape=(max(size, 1),))
+
+        # Sort each chunk into a run
+        rstat = tmp_array('stat', bstat.dtype)
+        rdec = tmp_array('dec', dec.dtype)
+        ridx = tmp_array('index', numpy.int64)
+        runs = list(_chunks(size, chunk_size))
+        for start, end in runs:
+            b = bstat[start:end]
+            sort = b.argsort(kind='mergesort')
+            rstat[start:end] = b[sort]
+            rdec[start:end] = dec[start:end][sort]
+            ridx[start:end] = sort + start
+
+        # Merge the runs, reading a block of each at a time
+        out = tmp_array('n_louder', dec.dtype)
+        block = max(chunk_size // max(len(runs), 1), 1)
+        heads = [start for start, _ in runs]
+        bufs = [None] * len(runs)
+        done = dec.dtype.type(0)
+        while True:
+            for i, (head, (_, end)) in enumerate(zip(heads, runs)):
+                if (bufs[i] is None or len(bufs[i][0]) == 0) and head < end:
+                    last = min(head + block, end)
+                    bufs[i] = (rstat[head:last], rdec[head:last],
+                               ridx[head:last])
+                    heads[i] = last
+
+            loaded = [i for i, buf in enumerate(bufs)
+                      if buf is not None and len(buf[0])]
+            if not loaded:
+                break
+
+            # Everything up to the last value read from a run that is not
+            # fully read is known to be in its sorted place
+            limits = [bufs[i][0][-1] for i in loaded
+                      if heads[i] < runs[i][1]]
+            limit = min(limits) if limits else None
+
+            stat, d, idx = [], [], []
+            for i in loaded:
+                num = len(bufs[i][0]) if limit is None else \
+                    numpy.searchsorted(bufs[i][0], limit, side='right')
+                stat.append(bufs[i][0][:num])
+                d.append(bufs[i][1][:num])
+                idx.append(bufs[i][2][:num])
+                bufs[i] = tuple(x[num:] for x in bufs[i])
+
+            stat = numpy.concatenate(stat)
+            sort = stat.argsort(kind='mergesort')
+            d = numpy.concatenate(d)[sort]
+            idx = numpy.concatenate(idx)[sort]
+
+            # The decimated number of background events louder than each
+            cum = d.cumsum() + done
+            out[idx] = total - cum
+            done = cum[-1]
+
+        for start, end in _chunks(size, chunk_size):
+            back_cum_num[start:end] = out[start:end]
+        del rstat, rdec, ridx, out
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+class BackgroundNLouder(object):
+    """ The number of background events louder than foreground events, or
+    than each background event, as given by `calculate_n_louder`, kept up
+    to date as background events are removed.
+
+    The background is sorted once and the decimation factors of the
+    remaining events are summed with a Fenwick tree, so removing events
+    does not sort the background again.
+    """
+
+    def __init__(self, bstat, dec):
+        """
+        Parameters
+        ----------
+        bstat: numpy.ndarray
+            Array of the background statistic values
+        dec: numpy.ndarray
+            Array of the decimation factors for the background statistics
+        """
+        sort = bstat.argsort()
+        self.bstat = bstat[sort]
+        self.dec = dec[sort]
+        # The sorted position of each background event
+        self.position = sort.argsort()
+        self.alive = numpy.ones(len(sort), dtype=bool)
+        self.first = 0
+        self.total = self.dec.sum()
+        self.tree = _FenwickTree(self.dec)
+
+    def remove(self, idx):
+        """ Remove background events
+
+        Parameters
+        ----------
+        idx: numpy.ndarray
+            The indices of the events to remove, in the background given
+            initially
+        """
+        pos = numpy.unique(self.position[idx])
+        pos = pos[self.alive[pos]]
+        self.alive[pos] = False
+        self.total -= self.dec[pos].sum()
+        self.tree.add(pos, -self.dec[pos])
+        if self.first < len(self.alive) and not self.alive[self.first]:
+            remaining = numpy.flatnonzero(self.alive[self.first:])
+            # Past the end once every background event has been removed
+            self.first = self.first + remaining[0] if len(remaining) \
+                else len(self.alive)
+
+    def foreground(self, fstat):
+        """ Return the number of remaining background events louder than
+        each foreground event, as `calculate_n_louder` would
+        """
+        if self.first == len(self.dec):
+            # No background remains
+            return numpy.zeros(numpy.shape(fstat), dtype=self.dec.dtype)
+        left = numpy.searchsorted(self.bstat, fstat, side='left')
+        quieter = self.tree.prefix(left - 1)
+        n_louder = self.total - quieter
+        # Where no remaining background is quieter, the first one is not
+        # counted, as in calculate_n_louder
+        return numpy.where(quieter == 0, self.total - self.dec[self.first],
+                           n_louder)
+
+    def background(self):
+        """ Return the number of remaining background events louder than
+        each remaining background event, in the order of the background
+        given initially
+        """
+        dec = numpy.where(self.alive, self.dec, 0)
+        n_louder = dec[::-1].cumsum()[::-1] - dec
+        pos = self.position[self.alive[self.position]]
+        return n_louder[pos]
+
+
 def timeslide_durations(start1, start2, end1, end2, timeslide_offsets):
     """ Find the coincident time for each timeslide.
 
@@ -186,6 +413,103 @@ def timeslide_durations(start1, start2, end1, end2, timeslide_offsets):
     return numpy.array(durations)
 
 
+def _time_coincidence_ranges(t1, t2, window, slide_step=0):
+    """Return the sorted order of the t1 triggers, and for each of them the
+    range of matching positions into an array of t2 trigger indices.
+    """
+    if slide_step:
+        fold1 = t1 % slide_step
+        fold2 = t2 % slide_step
+    else:
+        fold1 = t1
+        fold2 = t2
+
+    sort1 = fold1.argsort()
+    sort2 = fold2.argsort()
+    fold1 = fold1[sort1]
+    fold2 = fold2[sort2]
+
+    if slide_step and len(fold1) and len(fold2):
+        # Triggers folded near the start or end of the slide interval can
+        # be coincident with triggers folded near the other end, so the
+        # folded t2 times are extended by the ones which are within a
+        # window of the edges, moved by one interval
+        lower = fold2 - slide_step
+        lower_start = numpy.searchsorted(lower, fold1[0] - window)
+        upper = fold2 + slide_step
+        upper_end = numpy.searchsorted(upper, fold1[-1] + window,
+                                       side='right')
+        fold2 = numpy.concatenate([lower[lower_start:], fold2,
+                                   upper[:upper_end]])
+        sort2 = numpy.concatenate([sort2[lower_start:], sort2,
+                                   sort2[:upper_end]])
+
+    left = numpy.searchsorted(fold2, fold1 - window)
+    right = numpy.searchsorted(fold2, fold1 + window)
+    return sort1, sort2, left, right
+
+
+def time_coincidence_chunks(t1, t2, window, slide_step=0, max_pairs=2**22):
+    """ Find coincidences by time window, in chunks of bounded size
+
+    The coincidences are the same, and in the same order, as the ones
+    returned by `time_coincidence`, but are generated in chunks of at most
+    `max_pairs` coincidences, unless a single t1 trigger has more matches.
+
+    Parameters
+    ----------
+    t1 : numpy.ndarray
+        Array of trigger times from the first detector
+    t2 : numpy.ndarray
+        Array of trigger times from the second detector
+    window : float
+        Coincidence window maximum time difference, arbitrary units (usually s)
+    slide_step : float (default 0)
+        If calculating background coincidences, the interval between background
+        slides, arbitrary units (usually s)
+    max_pairs : int, optional
+        The maximum number of coincidences in each chunk. If None, all
+        coincidences are returned in a single chunk.
+
+    Yields
+    ------
+    idx1 : numpy.ndarray
+        Array of indices into the t1 array for coincident triggers
+    idx2 : numpy.ndarray
+        Array of indices into the t2 array
+    slide : numpy.ndarray
+        Array of slide ids
+    """
+    sort1, sort2, left, right = _time_coincidence_ranges(t1, t2, window,
+                                                         slide_step)
+    counts = right - left
+    total = numpy.cumsum(counts)
+    if max_pairs is None:
+        max_pairs = total[-1] if len(total) else 0
+
+    start = 0
+    while True:
+        done = total[start - 1] if start else 0
+        end = numpy.searchsorted(total, done + max_pairs, side='right')
+        end = min(max(end, start + 1), len(sort1))
+
+        idx1 = numpy.repeat(sort1[start:end], counts[start:end])
+        idx2 = sort2[_segment_positions(left[start:end], counts[start:end])]
+
+        if slide_step:
+            diff = t1[idx1] / slide_step - t2[idx2] / slide_step
+            slide = numpy.rint(diff)
+        else:
+            slide = numpy.zeros(len(idx1))
+
+        yield (idx1.astype(numpy.uint32), idx2.astype(numpy.uint32),
+               slide.astype(numpy.int32))
+
+        start = end
+        if start >= len(sort1):
+            break
+
+
 def time_coincidence(t1, t2, window, slide_step=0):
     """ Find coincidences by time window
 
@@ -201,6 +525,43 @@ def time_coincidence(t1, t2, window, slide_step=0):
         If calculating background coincidences, the interval between background
         slides, arbitrary units (usually s)
 
+    Returns
+    -------
+    idx1 : numpy.ndarray
+        Array of indices into the t1 array for coincident triggers
+    idx2 : numpy.ndarray
+        Array of indices into the t2 array
+    slide : numpy.ndarray
+        Array of slide ids
+    """
+    return next(time_coincidence_chunks(t1, t2, window, slide_step,
+                                        max_pairs=None))
+
+
+def _grouped_time_coincidence(t1, group1, t2, group2, window,
+                               slide_step=0):
+    """ Find coincidences by time window between triggers of the same group
+
+    This is `time_coincidence` applied to every group (for example every
+    template) at once. Triggers are only paired with triggers which have
+    the same group id.
+
+    Parameters
+    ----------
+    t1 : numpy.ndarray
+        Array of trigger times from the first detector
+    group1 : numpy.ndarray
+        Array of non-negative integer group ids of the t1 triggers
+    t2 : numpy.ndarray
+        Array of trigger times from the second detector
+    group2 : numpy.ndarray
+        Array of non-negative integer group ids of the t2 triggers
+    window : float
+        Coincidence window maximum time difference, arbitrary units (usually s)
+    slide_step : float (default 0)
+        If calculating background coincidences, the interval between background
+        slides, arbitrary units (usually s)
+
     Returns
     -------
     idx1 : numpy.ndarray
@@ -213,30 +574,37 @@ def time_coincidence(t1, t2, window, slide_step=0):
     if slide_step:
         fold1 = t1 % slide_step
         fold2 = t2 % slide_step
+        span = slide_step
     else:
-        fold1 = t1
-        fold2 = t2
+        tmin = min(t1.min() if len(t1) else 0, t2.min() if len(t2) else 0)
+        fold1 = t1 - tmin
+        fold2 = t2 - tmin
+        span = max(fold1.max() if len(t1) else 0,
+                   fold2.max() if len(t2) else 0)
+
+    # Offset each group so that no window can reach into another group
+    spacing = 4 * span + 2 * window + 1
+    group2 = numpy.array(group2)
+    if slide_step:
+        fold2 = numpy.concatenate([fold2 - slide_step, fold2,
+                                   fold2 + slide_step])
+        group2 = numpy.concatenate([group2, group2, group2])
+    fold1 = fold1 + numpy.array(group1) * spacing
+    fold2 = fold2 + group2 * spacing
 
     sort1 = fold1.argsort()
     sort2 = fold2.argsort()
     fold1 = fold1[sort1]
     fold2 = fold2[sort2]
 
-    if slide_step:
-        # FIXME explain this
-        fold2 = numpy.concatenate([fold2 - slide_step, fold2, fold2 + slide_step])
-        sort2 = numpy.concatenate([sort2, sort2, sort2])
-
     left = numpy.searchsorted(fold2, fold1 - window)
     right = numpy.searchsorted(fold2, fold1 + window)
 
-    idx1 = numpy.repeat(sort1, right - left)
-    idx2 = [sort2[l:r] for l, r in zip(left, right)]
-
-    if len(idx2) > 0:
-        idx2 = numpy.concatenate(idx2)
-    else:
-        idx2 = numpy.array([], dtype=numpy.int64)
+    # Expand each [left, right) range of matches without a python loop
+    counts = right - left
+    idx1 = numpy.repeat(sort1, counts)
+    start = numpy.repeat(left - (numpy.cumsum(counts) - counts), counts)
+    idx2 = sort2[start + numpy.arange(len(idx1))] % max(len(t2), 1)
 
     if slide_step:
         diff = ((t1 / slide_step)[idx1] - (t2 / slide_step)[idx2])
@@ -247,6 +615,85 @@ def time_coincidence(t1, t2, window, slide_step=0):
     return idx1.astype(numpy.uint32), idx2.astype(numpy.uint32), slide.astype(numpy.int32)
 
 
+def _grouped_time_multi_coincidence(times, groups, ifos, windows,
+                                     slide_step=0):
+    """ Find multi detector coincidences between triggers of the same group
+
+    This follows `time_multi_coincidence`, but only triggers which have
+    the same group id (for example the same template) can be coincident,
+    so that the coincidences of many groups are found at once.
+
+    Parameters
+    ----------
+    times: dict of numpy.ndarrays
+        Dictionary keyed by ifo of single ifo trigger times
+    groups: dict of numpy.ndarrays
+        Dictionary keyed by ifo of the non-negative integer group ids of the
+        triggers
+    ifos: list of strs
+        The ifos to find coincidences between. The first is the pivot ifo,
+        to which time shifts are applied, and the second is the fixed ifo.
+    windows: dict of floats
+        Coincidence window keyed by every (ifo, ifo) pair
+    slide_step: float
+        Interval between time slides
+
+    Returns
+    -------
+    ids: dict of arrays of int
+        Dictionary keyed by ifo with ids of trigger times forming
+        coincidences.
+    slide: array of int
+        Slide ids of coincident triggers in pivot ifo
+    """
+    pivot, fixed = ifos[0], ifos[1]
+    pivot_id, fix_id, slide = _grouped_time_coincidence(
+        times[pivot], groups[pivot], times[fixed], groups[fixed],
+        windows[pivot, fixed], slide_step=slide_step)
+    group = groups[fixed][fix_id]
+
+    ctimes = {fixed: times[fixed][fix_id],
+              pivot: times[pivot][pivot_id] - slide_step * slide}
+    ids = {fixed: fix_id, pivot: pivot_id}
+    if not len(slide):
+        for ifo in ifos[2:]:
+            ids[ifo] = numpy.array([], dtype=numpy.uint32)
+    if len(ifos) == 2 or not len(slide):
+        return ids, slide
+
+    # Offset each group so that no window can reach into another group
+    nonempty = [times[ifo] for ifo in ifos if len(times[ifo])]
+    tmin = min(t.min() for t in nonempty)
+    span = max(t.max() for t in nonempty) - tmin
+    spacing = span + 2 * max(windows.values()) + 1
+
+    for ifo1 in ifos[2:]:
+        key1 = groups[ifo1] * spacing + (times[ifo1] - tmin)
+        tsort = key1.argsort()
+        key1 = key1[tsort]
+
+        # Each coincidence must have a trigger in ifo1 within the window
+        # of every ifo already in it. As in time_multi_coincidence the
+        # first such trigger is kept.
+        for ifo2 in list(ids):
+            w = windows[ifo1, ifo2]
+            ckey = group * spacing + (ctimes[ifo2] - tmin)
+            left = numpy.searchsorted(key1, ckey - w)
+            right = numpy.searchsorted(key1, ckey + w)
+            nz = numpy.flatnonzero(right > left)
+            dep_ids = left[nz]
+            slide = slide[nz]
+            group = group[nz]
+            for ifo in ctimes:
+                ctimes[ifo] = ctimes[ifo][nz]
+                ids[ifo] = ids[ifo][nz]
+
+        ids[ifo1] = tsort[dep_ids]
+        ctimes[ifo1] = times[ifo1][ids[ifo1]]
+
+    return ids, slide
+
+
 def time_multi_coincidence(times, slide_step=0, slop=.003,
                            pivot='H1', fixed='L1'):
     """ Find multi detector coincidences.
@@ -482,6 +929,38 @@ def mean_if_greater_than_zero(vals):
     return vals[above_zero].mean(), above_zero.sum()
 
 
+def _range_max(values, left, right):
+    """Return the maximum of values over each half-open range [left, right)
+
+    The ranges are answered from a sparse table of the maxima over
+    power-of-two length windows, built one level at a time so that only
+    O(len(values)) memory is needed. Empty ranges give -inf.
+    """
+    out = numpy.full(len(left), -numpy.inf)
+    length = right - left
+    if not len(length) or length.max() <= 0:
+        return out
+
+    # The level of each range is the largest power of two not longer than it
+    level = numpy.frexp(numpy.maximum(length, 1))[1] - 1
+    level[length <= 0] = -1
+
+    table = values
+    width = 1
+    k = 0
+    while True:
+        sel = numpy.flatnonzero(level == k)
+        if len(sel):
+            out[sel] = numpy.maximum(table[left[sel]],
+                                     table[right[sel] - width])
+        if 2 * width > length.max():
+            break
+        table = numpy.maximum(table[:-width], table[width:])
+        width *= 2
+        k += 1
+    return out
+
+
 def cluster_over_time(stat, time, window, argmax=numpy.argmax):
     """Cluster generalized transient events over time via maximum stat over a
     symmetric sliding window
@@ -511,6 +990,18 @@ def cluster_over_time(stat, time, window, argmax=numpy.argmax):
 
     left = numpy.searchsorted(time, time - window)
     right = numpy.searchsorted(time, time + window)
+
+    if argmax is numpy.argmax:
+        # A point survives if it is the first maximum within its own
+        # window, which is what the scan below finds, so all points can
+        # be tested at once
+        here = numpy.arange(len(time))
+        keep = (_range_max(stat, left, here) < stat) & \
+               (_range_max(stat, here, right) <= stat)
+        indices = numpy.flatnonzero(keep).astype(numpy.uint32)
+        logging.info('%d triggers remaining', len(indices))
+        return time_sorting[indices]
+
     indices = numpy.zeros(len(left), dtype=numpy.uint32)
 
     # i is the index we are inspecting, j is the next one to save
@@ -549,10 +1040,53 @@ def cluster_over_time(stat, time, window, argmax=numpy.argmax):
     return time_sorting[indices]
 
 
+def _segment_positions(starts, lengths):
+    """Return the positions of the elements of several contiguous segments
+
+    Parameters
+    ----------
+    starts: numpy.ndarray
+        The position of the first element of each segment.
+    lengths: numpy.ndarray
+        The number of elements in each segment.
+
+    Returns
+    -------
+    positions: numpy.ndarray
+        The concatenated ranges [starts[i], starts[i] + lengths[i]).
+    """
+    lengths = numpy.asarray(lengths, dtype=int)
+    total = lengths.sum()
+    shift = numpy.repeat(numpy.asarray(starts, dtype=int) -
+                         (numpy.cumsum(lengths) - lengths), lengths)
+    return shift + numpy.arange(total)
+
+
+# The version of the layout of the live background checkpoint files
+_CHECKPOINT_VERSION = 1
+
+
+def _save_checkpoint_array(group, name, data, chunk_size=2**18):
+    """Write a one dimensional array to a chunked dataset of a checkpoint"""
+    data = numpy.asarray(data)
+    if len(data):
+        return group.create_dataset(name, data=data,
+                                    chunks=(min(len(data), chunk_size),))
+    return group.create_dataset(name, data=data)
+
+
 class MultiRingBuffer(object):
-    """Dynamic size n-dimensional ring buffer that can expire elements."""
+    """Dynamic size n-dimensional ring buffer that can expire elements.
+
+    The elements of every ring are kept in one preallocated array. Each ring
+    owns a block of that array, given by an offset and a capacity, and its
+    valid elements run from a head to a tail position within the block. A
+    ring whose block is full is moved to a new block of twice the capacity,
+    and the array is compacted when too much of it is no longer owned by
+    any ring.
+    """
 
-    def __init__(self, num_rings, max_time, dtype):
+    def __init__(self, num_rings, max_time, dtype, initial_capacity=4):
         """
         Parameters
         ----------
@@ -563,31 +1097,178 @@ class MultiRingBuffer(object):
             The maximum "time" an element can exist in each ring.
         dtype: numpy.dtype
             The type of each element in the ring buffer.
+        initial_capacity: int, optional
+            The number of elements a ring has space for when it is first
+            used.
         """
         self.max_time = max_time
-        self.buffer = []
-        self.buffer_expire = []
-        for _ in range(num_rings):
-            self.buffer.append(numpy.zeros(0, dtype=dtype))
-            self.buffer_expire.append(numpy.zeros(0, dtype=int))
+        self.initial_capacity = initial_capacity
+        self.buffer = numpy.zeros(1024, dtype=dtype)
+        self.buffer_expire = numpy.zeros(len(self.buffer), dtype=int)
+        self.offset = numpy.zeros(num_rings, dtype=int)
+        self.capacity = numpy.zeros(num_rings, dtype=int)
+        self.head = numpy.zeros(num_rings, dtype=int)
+        self.tail = numpy.zeros(num_rings, dtype=int)
+        self.used = 0
         self.time = 0
 
+    def __setstate__(self, state):
+        if not isinstance(state['buffer'], list):
+            self.__dict__.update(state)
+            return
+
+        # State saved when each ring was a separate array
+        old_buffer = state['buffer']
+        old_expire = state['buffer_expire']
+        self.__init__(len(old_buffer), state['max_time'],
+                      old_buffer[0].dtype)
+        self.time = state['time']
+        lengths = numpy.array([len(b) for b in old_buffer], dtype=int)
+        if lengths.sum():
+            self._fill(lengths, numpy.concatenate(old_buffer),
+                       numpy.concatenate(old_expire))
+
+    def _fill(self, lengths, values, expire):
+        """Append the concatenated elements of every ring to the rings
+
+        Parameters
+        ----------
+        lengths: numpy.ndarray
+            The number of elements to add to each ring.
+        values: numpy.ndarray
+            The elements of all the rings, ring after ring.
+        expire: numpy.ndarray
+            The expiration vector of the elements.
+        """
+        rings = numpy.flatnonzero(lengths)
+        lengths = lengths[rings]
+        if len(rings):
+            self._reserve(rings, lengths)
+            pos = _segment_positions(self.tail[rings], lengths)
+            self.buffer[pos] = values
+            self.buffer_expire[pos] = expire
+            self.tail[rings] += lengths
+
+    def save_checkpoint(self, group):
+        """Write the elements of the rings to an HDF5 group
+
+        Only the elements that have not yet expired are stored, ring after
+        ring, so the checkpoint does not depend on the layout of the
+        internal array.
+
+        Parameters
+        ----------
+        group: h5py.Group
+            The (empty) group to write to.
+        """
+        self.expire()
+        rings = numpy.arange(len(self.head))
+        values, expire, lengths = self.data_many(rings)
+        group.attrs['max_time'] = self.max_time
+        group.attrs['time'] = self.time
+        group.attrs['initial_capacity'] = self.initial_capacity
+        _save_checkpoint_array(group, 'lengths', lengths)
+        _save_checkpoint_array(group, 'values', values)
+        _save_checkpoint_array(group, 'expire', expire)
+
+    @classmethod
+    def load_checkpoint(cls, group):
+        """Create the ring buffers from a group written by `save_checkpoint`
+        """
+        lengths = group['lengths'][:]
+        values = group['values'][:]
+        ring = cls(len(lengths), group.attrs['max_time'], values.dtype,
+                   initial_capacity=group.attrs['initial_capacity'])
+        ring.time = group.attrs['time']
+        ring._fill(lengths, values, group['expire'][:])
+        return ring
+
     @property
     def filled_time(self):
         return min(self.time, self.max_time)
 
     def num_elements(self):
-        return sum([len(a) for a in self.buffer])
+        return (self.tail - self.head).sum()
 
     @property
     def nbytes(self):
-        return sum([a.nbytes for a in self.buffer])
+        return (self.buffer.nbytes + self.buffer_expire.nbytes +
+                self.offset.nbytes + self.capacity.nbytes +
+                self.head.nbytes + self.tail.nbytes)
+
+    def _compact(self, size):
+        """Move the block of every ring to the start of a new array of at
+        least the given size, dropping the space not owned by any ring.
+        """
+        size = max(size, 2 * self.capacity.sum(), 1024)
+        buffer = numpy.zeros(size, dtype=self.buffer.dtype)
+        buffer_expire = numpy.zeros(size, dtype=int)
+
+        offset = numpy.cumsum(self.capacity) - self.capacity
+        lengths = self.tail - self.head
+        src = _segment_positions(self.head, lengths)
+        dst = _segment_positions(offset, lengths)
+        buffer[dst] = self.buffer[src]
+        buffer_expire[dst] = self.buffer_expire[src]
+
+        self.buffer = buffer
+        self.buffer_expire = buffer_expire
+        self.offset = offset
+        self.head = offset.copy()
+        self.tail = offset + lengths
+        self.used = self.capacity.sum()
+
+    def _reserve(self, rings, extra):
+        """Move the given rings to new blocks with space for extra elements
+
+        Parameters
+        ----------
+        rings: numpy.ndarray
+            The (unique) rings to move.
+        extra: numpy.ndarray
+            The number of elements that must fit after the tail of each
+            ring.
+        """
+        self.expire(rings)
+        lengths = self.tail[rings] - self.head[rings]
+        capacity = self.capacity[rings]
+        grow = lengths + extra > capacity
+        capacity[grow] = numpy.maximum(numpy.maximum(2 * capacity[grow],
+                                                     lengths[grow] +
+                                                     extra[grow]),
+                                       self.initial_capacity)
+
+        needed = self.used + capacity.sum()
+        if needed > len(self.buffer):
+            # Reclaim the unowned space, or grow the array if there is not
+            # enough of it
+            self.capacity[rings] = 0
+            owned = self.capacity.sum()
+            head = self.head[rings]
+            moved = self.buffer[_segment_positions(head, lengths)]
+            moved_expire = self.buffer_expire[_segment_positions(head,
+                                                                 lengths)]
+            self.head[rings] = self.tail[rings] = self.offset[rings] = 0
+            self._compact(2 * (owned + capacity.sum()))
+        else:
+            src = _segment_positions(self.head[rings], lengths)
+            moved = self.buffer[src]
+            moved_expire = self.buffer_expire[src]
+
+        offset = self.used + numpy.cumsum(capacity) - capacity
+        dst = _segment_positions(offset, lengths)
+        self.buffer[dst] = moved
+        self.buffer_expire[dst] = moved_expire
+        self.offset[rings] = offset
+        self.capacity[rings] = capacity
+        self.head[rings] = offset
+        self.tail[rings] = offset + lengths
+        self.used += capacity.sum()
 
     def discard_last(self, indices):
         """Discard the triggers added in the latest update"""
-        for i in indices:
-            self.buffer_expire[i] = self.buffer_expire[i][:-1]
-            self.buffer[i] = self.buffer[i][:-1]
+        numpy.subtract.at(self.tail, numpy.asarray(indices, dtype=int), 1)
+        numpy.maximum(self.tail, self.head, out=self.tail)
 
     def advance_time(self):
         """Advance the internal time increment by 1, expiring any triggers that
@@ -598,35 +1279,297 @@ class MultiRingBuffer(object):
     def add(self, indices, values):
         """Add triggers in 'values' to the buffers indicated by the indices
         """
-        for i, v in zip(indices, values):
-            self.buffer[i] = numpy.append(self.buffer[i], v)
-            self.buffer_expire[i] = numpy.append(self.buffer_expire[i], self.time)
+        indices = numpy.asarray(indices, dtype=int)
+        if len(indices):
+            order = indices.argsort(kind='mergesort')
+            sorted_indices = indices[order]
+            rings, first, counts = numpy.unique(sorted_indices,
+                                                return_index=True,
+                                                return_counts=True)
+
+            full = self.tail[rings] + counts > \
+                self.offset[rings] + self.capacity[rings]
+            if full.any():
+                self._reserve(rings[full], counts[full])
+
+            rank = numpy.arange(len(indices)) - numpy.repeat(first, counts)
+            pos = self.tail[sorted_indices] + rank
+            self.buffer[pos] = numpy.asarray(values)[order]
+            self.buffer_expire[pos] = self.time
+            self.tail[rings] += counts
         self.advance_time()
 
+    def expire(self, buffer_indices=None):
+        """Discard the expired elements of several ring buffers at once
+
+        Parameters
+        ----------
+        buffer_indices: numpy.ndarray, optional
+            The ring buffers to expire. All of them by default.
+        """
+        if buffer_indices is None:
+            rings = numpy.flatnonzero(self.tail > self.head)
+        else:
+            rings = numpy.unique(numpy.asarray(buffer_indices, dtype=int))
+        expired = self.time - self.max_time
+        lengths = self.tail[rings] - self.head[rings]
+        pos = _segment_positions(self.head[rings], lengths)
+        old = self.buffer_expire[pos] < expired
+        owner = numpy.repeat(numpy.arange(len(rings)), lengths)
+        self.head[rings] += numpy.bincount(owner[old],
+                                           minlength=len(rings))
+
     def expire_vector(self, buffer_index):
         """Return the expiration vector of a given ring buffer """
-        return self.buffer_expire[buffer_index]
+        return self.buffer_expire[self.head[buffer_index]:
+                                  self.tail[buffer_index]]
 
     def data(self, buffer_index):
         """Return the data vector for a given ring buffer"""
-        # Check for expired elements and discard if they exist
+        # Check for expired elements and discard if they exist. Elements
+        # are added in time order, so the expired ones are at the start.
+        head = self.head[buffer_index]
+        tail = self.tail[buffer_index]
         expired = self.time - self.max_time
-        exp = self.buffer_expire[buffer_index]
-        j = 0
-        while j < len(exp):
-            # Everything before this j must be expired
-            if exp[j] >= expired:
-                self.buffer_expire[buffer_index] = exp[j:].copy()
-                self.buffer[buffer_index] = self.buffer[buffer_index][j:].copy()
-                break
-            j += 1
+        self.head[buffer_index] += numpy.searchsorted(
+            self.buffer_expire[head:tail], expired)
+        return self.buffer[self.head[buffer_index]:tail]
+
+    def data_many(self, buffer_indices):
+        """Return the data and expiration vectors of several ring buffers
+
+        Parameters
+        ----------
+        buffer_indices: numpy.ndarray
+            The ring buffers to return.
+
+        Returns
+        -------
+        data: numpy.ndarray
+            The concatenated data of the ring buffers, in the order given.
+        expire: numpy.ndarray
+            The concatenated expiration vectors of the ring buffers.
+        lengths: numpy.ndarray
+            The number of elements taken from each ring buffer.
+        """
+        buffer_indices = numpy.asarray(buffer_indices, dtype=int)
+        self.expire(buffer_indices)
+        lengths = self.tail[buffer_indices] - self.head[buffer_indices]
+        pos = _segment_positions(self.head[buffer_indices], lengths)
+        return self.buffer[pos], self.buffer_expire[pos], lengths
+
+
+class _FenwickTree(object):
+    """Binary indexed tree of counts with vectorized updates"""
+
+    def __init__(self, counts):
+        counts = numpy.asarray(counts)
+        cumulative = numpy.zeros(len(counts) + 1, dtype=counts.dtype)
+        numpy.cumsum(counts, out=cumulative[1:])
+        index = numpy.arange(len(counts))
+        self.tree = cumulative[index + 1] - cumulative[index & (index + 1)]
+
+    def add(self, index, count):
+        """Add 'count' to the entries at 'index'"""
+        index = numpy.asarray(index, dtype=numpy.int64)
+        count = numpy.asarray(count, dtype=self.tree.dtype)
+        while len(index):
+            numpy.add.at(self.tree, index, count)
+            index = index | (index + 1)
+            keep = index < len(self.tree)
+            index, count = index[keep], count[keep]
+
+    def prefix(self, index):
+        """Return the total count of the entries up to and including 'index'
+        """
+        shape = numpy.shape(index)
+        index = numpy.array(index, dtype=numpy.int64, ndmin=1)
+        total = numpy.zeros(len(index), dtype=self.tree.dtype)
+        pending = numpy.flatnonzero(index >= 0)
+        index = index[pending]
+        while len(pending):
+            total[pending] += self.tree[index]
+            index = (index & (index + 1)) - 1
+            keep = index >= 0
+            pending, index = pending[keep], index[keep]
+        return total.reshape(shape)
+
+
+class SortedValues(object):
+    """Sorted multiset of values kept in buckets of limited size.
+
+    The bucket counts are held in a Fenwick tree, so inserting or removing
+    values and counting the values larger than a given one cost a binary
+    search plus a move of at most one bucket.
+    """
+
+    def __init__(self, dtype=numpy.float32, bucket_size=2**16):
+        """
+        Parameters
+        ----------
+        dtype: numpy.dtype
+            The dtype of the values.
+        bucket_size: int, optional
+            The number of values above which a bucket is split.
+        """
+        self.dtype = numpy.dtype(dtype)
+        self.bucket_size = bucket_size
+        self.rebuild(numpy.zeros(0, dtype=self.dtype))
+
+    def __len__(self):
+        return self.total
+
+    @property
+    def nbytes(self):
+        return (sum(b.nbytes for b in self.buckets) + self.bounds.nbytes
+                + self.tree.tree.nbytes)
+
+    def _split(self, values):
+        """Split sorted values into buckets of about half the maximum size,
+        keeping equal values in the same bucket.
+        """
+        num = max(1, 2 * len(values) // self.bucket_size)
+        edges = numpy.arange(1, num) * len(values) // num
+        edges = numpy.unique(numpy.searchsorted(values, values[edges],
+                                                side='left'))
+        edges = edges[edges > 0]
+        return numpy.split(values, edges)
+
+    def _reindex(self, bounds):
+        self.bounds = numpy.array(bounds, dtype=self.dtype)
+        self.counts = numpy.array([len(b) for b in self.buckets],
+                                  dtype=numpy.int64)
+        self.tree = _FenwickTree(self.counts)
+
+    def rebuild(self, values):
+        """Replace the content with the given values"""
+        values = numpy.sort(numpy.asarray(values, dtype=self.dtype))
+        self.buckets = [b.copy() for b in self._split(values)]
+        self.total = len(values)
+        self._reindex([b[0] for b in self.buckets[1:]])
+
+    def _group(self, values):
+        """Sort values and group them by the bucket they belong to"""
+        values = numpy.sort(numpy.asarray(values, dtype=self.dtype))
+        bucket = numpy.searchsorted(self.bounds, values, side='right')
+        ubucket, start = numpy.unique(bucket, return_index=True)
+        end = numpy.append(start[1:], len(values))
+        return values, ubucket, start, end
+
+    def insert(self, values):
+        """Insert an array of values"""
+        if len(values) == 0:
+            return
+        values, ubucket, start, end = self._group(values)
+        split = False
+        for b, s, e in zip(ubucket, start, end):
+            bucket = self.buckets[b]
+            add = values[s:e]
+            bucket = numpy.insert(bucket, numpy.searchsorted(bucket, add),
+                                  add)
+            self.buckets[b] = bucket
+            split = split or len(bucket) > self.bucket_size
+
+        self.total += len(values)
+        self.counts[ubucket] += end - start
+        if split:
+            # Empty buckets have no values to take their bounds from
+            buckets, bounds = [], []
+            for b, bucket in enumerate(self.buckets):
+                pieces = [bucket]
+                if len(bucket) > self.bucket_size:
+                    pieces = self._split(bucket)
+                if b > 0:
+                    bounds.append(self.bounds[b - 1])
+                bounds += [p[0] for p in pieces[1:]]
+                buckets += pieces
+            self.buckets = buckets
+            self._reindex(bounds)
+        else:
+            self.tree.add(ubucket, end - start)
+
+    def remove(self, values):
+        """Remove an array of values, each of which must be present"""
+        if len(values) == 0:
+            return
+        values, ubucket, start, end = self._group(values)
+        # Equal values must remove distinct copies
+        rank = numpy.arange(len(values)) - \
+            numpy.searchsorted(values, values, side='left')
+        for b, s, e in zip(ubucket, start, end):
+            bucket = self.buckets[b]
+            pos = numpy.searchsorted(bucket, values[s:e], side='left')
+            self.buckets[b] = numpy.delete(bucket, pos + rank[s:e])
+
+        self.total -= len(values)
+        self.counts[ubucket] -= end - start
+        if len(self.buckets) > 4 * (2 * self.total // self.bucket_size + 1):
+            self.rebuild(self.values())
+        else:
+            self.tree.add(ubucket, start - end)
+
+    def num_greater(self, value):
+        """Return the number of values larger than 'value'"""
+        cast = self.dtype.type(value)
+        if float(cast) > float(value):
+            # The value was rounded up, so values equal to the rounded one
+            # are still larger
+            cast = numpy.nextafter(cast, self.dtype.type(-numpy.inf))
+        value = cast
+        b = numpy.searchsorted(self.bounds, value, side='right')
+        bucket = self.buckets[b]
+        inside = len(bucket) - numpy.searchsorted(bucket, value, side='right')
+        return int(self.total - self.tree.prefix(b) + inside)
+
+    def values(self):
+        """Return all the values in ascending order"""
+        return numpy.concatenate(self.buckets)
+
+
+class _ExpirationQueue(object):
+    """Priority queue of buffer positions keyed by integer times.
+
+    Each pushed batch is kept sorted and merged with the previous batches
+    while they are not larger, so popping the positions below a time
+    only looks at a logarithmic number of batches.
+    """
 
-        return self.buffer[buffer_index]
+    def __init__(self):
+        self.keys = []
+        self.positions = []
+
+    def push(self, keys, positions):
+        """Add positions with the given keys"""
+        while self.keys and len(self.keys[-1]) <= len(keys):
+            keys = numpy.concatenate([self.keys.pop(), keys])
+            positions = numpy.concatenate([self.positions.pop(), positions])
+        order = numpy.argsort(keys, kind='stable')
+        self.keys.append(keys[order])
+        self.positions.append(positions[order])
+
+    def pop(self, key):
+        """Remove and return the positions whose key is below 'key'"""
+        popped = [numpy.zeros(0, dtype=numpy.int64)]
+        for i, keys in enumerate(self.keys):
+            # Match the dtype so the keys are not converted on every call
+            num = numpy.searchsorted(keys, keys.dtype.type(key))
+            if num:
+                popped.append(self.positions[i][:num])
+                self.keys[i] = keys[num:]
+                self.positions[i] = self.positions[i][num:]
+        self.positions = [p for p in self.positions if len(p)]
+        self.keys = [k for k in self.keys if len(k)]
+        return numpy.concatenate(popped)
 
 
 class CoincExpireBuffer(object):
     """Unordered dynamic sized buffer that handles
     multiple expiration vectors.
+
+    The values are mirrored in a `SortedValues` so that counting the louder
+    elements does not scan the buffer, and the elements are queued by
+    their time for each ifo so that expiring them only touches the ones
+    that expire.
     """
 
     def __init__(self, expiration, ifos,
@@ -647,21 +1590,101 @@ class CoincExpireBuffer(object):
 
         self.expiration = expiration
         self.buffer = numpy.zeros(initial_size, dtype=dtype)
-        self.index = 0
+        self.alive = numpy.zeros(initial_size, dtype=bool)
+        self.end = 0
+        self.num_alive = 0
         self.ifos = ifos
+        self.sorted = SortedValues(dtype=dtype)
 
         self.time = {}
         self.timer = {}
+        # Per ifo, the element positions filed under their expiration time
+        self.queue = {}
         for ifo in self.ifos:
             self.time[ifo] = 0
             self.timer[ifo] = numpy.zeros(initial_size, dtype=numpy.int32)
+            self.queue[ifo] = _ExpirationQueue()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'queue' not in state:
+            # Buffer pickled before the elements were indexed
+            self.end = self.num_alive = self.__dict__.pop('index')
+            self.alive = numpy.zeros(len(self.buffer), dtype=bool)
+            self.alive[:self.end] = True
+            self.sorted = SortedValues(dtype=self.buffer.dtype)
+            self.queue = {}
+            self._compact()
+
+    def save_checkpoint(self, group):
+        """Write the elements still in the buffer to an HDF5 group
+
+        Parameters
+        ----------
+        group: h5py.Group
+            The (empty) group to write to.
+        """
+        alive = numpy.flatnonzero(self.alive[:self.end])
+        group.attrs['expiration'] = self.expiration
+        group.attrs['ifos'] = [str(ifo) for ifo in self.ifos]
+        _save_checkpoint_array(group, 'values', self.buffer[alive])
+        for ifo in self.ifos:
+            _save_checkpoint_array(group, 'timer/' + ifo,
+                                   self.timer[ifo][alive])
+            group['timer/' + ifo].attrs['time'] = self.time[ifo]
+
+    @classmethod
+    def load_checkpoint(cls, group, initial_size=2**20):
+        """Create the buffer from a group written by `save_checkpoint`"""
+        values = group['values'][:]
+        ifos = [ifo.decode() if isinstance(ifo, bytes) else str(ifo)
+                for ifo in group.attrs['ifos']]
+        size = max(initial_size, 2 * len(values))
+        coincs = cls(group.attrs['expiration'], ifos, initial_size=size,
+                     dtype=values.dtype)
+        coincs.end = coincs.num_alive = len(values)
+        coincs.buffer[:coincs.end] = values
+        coincs.alive[:coincs.end] = True
+        for ifo in ifos:
+            coincs.timer[ifo][:coincs.end] = group['timer/' + ifo][:]
+            coincs.time[ifo] = int(group['timer/' + ifo].attrs['time'])
+        coincs._compact()
+        return coincs
 
     def __len__(self):
-        return self.index
+        return self.num_alive
+
+    @property
+    def index(self):
+        """The number of elements in the buffer"""
+        return self.num_alive
 
     @property
     def nbytes(self):
-        return self.buffer.nbytes
+        return (self.buffer.nbytes + self.alive.nbytes + self.sorted.nbytes
+                + sum(self.timer[ifo].nbytes for ifo in self.ifos))
+
+    def _compact(self):
+        """Drop the removed elements and rebuild the indexes"""
+        keep = numpy.flatnonzero(self.alive[:self.end])
+        self.end = len(keep)
+        self.buffer[:self.end] = self.buffer[keep]
+        self.alive[:self.end] = True
+        self.alive[self.end:] = False
+        positions = numpy.arange(self.end)
+        for ifo in self.ifos:
+            self.timer[ifo][:self.end] = self.timer[ifo][keep]
+            self.queue[ifo] = _ExpirationQueue()
+            self.queue[ifo].push(self.timer[ifo][:self.end], positions)
+        self.sorted.rebuild(self.buffer[:self.end])
+
+    def _discard(self, positions):
+        """Remove the elements at the given positions if still present"""
+        positions = numpy.unique(positions)
+        positions = positions[self.alive[positions]]
+        self.alive[positions] = False
+        self.num_alive -= len(positions)
+        self.sorted.remove(self.buffer[positions])
 
     def increment(self, ifos):
         """Increment without adding triggers"""
@@ -669,7 +1692,7 @@ class CoincExpireBuffer(object):
 
     def remove(self, num):
         """Remove the the last 'num' elements from the buffer"""
-        self.index -= num
+        self._discard(numpy.arange(self.end - num, self.end))
 
     def add(self, values, times, ifos):
         """Add values to the internal buffer
@@ -687,39 +1710,64 @@ class CoincExpireBuffer(object):
         for ifo in ifos:
             self.time[ifo] += 1
 
-        # Resize the internal buffer if we need more space
-        if self.index + len(values) >= len(self.buffer):
-            newlen = len(self.buffer) * 2
-            for ifo in self.ifos:
-                self.timer[ifo].resize(newlen)
-            self.buffer.resize(newlen, refcheck=False)
+        # Reclaim the removed elements, or resize the internal buffer if we
+        # need more space
+        if self.end + len(values) >= len(self.buffer):
+            if self.num_alive + len(values) < len(self.buffer) // 2:
+                self._compact()
+            else:
+                newlen = max(len(self.buffer) * 2,
+                             self.num_alive + 2 * len(values))
+                for ifo in self.ifos:
+                    self.timer[ifo].resize(newlen)
+                self.buffer.resize(newlen, refcheck=False)
+                self.alive.resize(newlen, refcheck=False)
 
-        self.buffer[self.index:self.index+len(values)] = values
         if len(values) > 0:
+            positions = numpy.arange(self.end, self.end + len(values))
+            self.buffer[positions] = values
+            self.alive[positions] = True
             for ifo in self.ifos:
-                self.timer[ifo][self.index:self.index+len(values)] = times[ifo]
+                self.timer[ifo][positions] = times[ifo]
+                self.queue[ifo].push(self.timer[ifo][positions], positions)
 
-            self.index += len(values)
+            self.end += len(values)
+            self.num_alive += len(values)
+            self.sorted.insert(self.buffer[positions])
 
         # Remove the expired old elements
-        keep = None
-        for ifo in ifos:
-            kt = self.timer[ifo][:self.index] >= self.time[ifo] - self.expiration
-            keep = numpy.logical_and(keep, kt) if keep is not None else kt
-
-        self.buffer[:keep.sum()] = self.buffer[:self.index][keep]
-        for ifo in self.ifos:
-            self.timer[ifo][:keep.sum()] = self.timer[ifo][:self.index][keep]
-        self.index = keep.sum()
+        expired = [self.queue[ifo].pop(self.time[ifo] - self.expiration)
+                   for ifo in ifos]
+        if ifos:
+            self._discard(numpy.concatenate(expired))
 
     def num_greater(self, value):
         """Return the number of elements larger than 'value'"""
-        return (self.buffer[:self.index] > value).sum()
+        return sum(self.sorted.num_greater(v) for v in numpy.ravel(value))
+
+    def louder_counts(self):
+        """Return the elements in ascending order and the number of elements
+        larger than each of them.
+        """
+        values = self.sorted.values()
+        return values, len(values) - numpy.searchsorted(values, values,
+                                                        side='right')
 
     @property
     def data(self):
         """Return the array of elements"""
-        return self.buffer[:self.index]
+        return self.buffer[:self.end][self.alive[:self.end]]
+
+
+def _ifar_curve(coincs, background_time, num_points=None):
+    """Return the background statistic values held in a CoincExpireBuffer
+    and the ifar in years each of them would be assigned.
+    """
+    stat, louder = coincs.louder_counts()
+    if num_points is not None and len(stat) > num_points:
+        keep = numpy.linspace(0, len(stat) - 1, num_points).astype(int)
+        stat, louder = stat[keep], louder[keep]
+    return stat, background_time / lal.YRJUL_SI / (louder + 1)
 
 
 class LiveCoincTimeslideBackgroundEstimator(object):
@@ -886,12 +1934,117 @@ class LiveCoincTimeslideBackgroundEstimator(object):
         from six.moves import cPickle
         return cPickle.load(filename)
 
+    def _coinc_buffers(self):
+        """Return the coincidence buffers keyed by their tuple of ifos"""
+        return {tuple(self.ifos): self.coincs}
+
+    def _set_coinc_buffer(self, ifos, coincs):
+        self.coincs = coincs
+
+    def save_checkpoint(self, group):
+        """Write the background buffers to an HDF5 group
+
+        Unlike `save_state` the checkpoint only holds the buffered triggers
+        and coincidences, in a versioned layout of chunked datasets, so it
+        can be restored into an estimator created from the command line by
+        `load_checkpoint`.
+
+        Parameters
+        ----------
+        group: h5py.Group
+            The (empty) group to write to.
+        """
+        group.attrs['checkpoint_version'] = _CHECKPOINT_VERSION
+        group.attrs['ifos'] = [str(ifo) for ifo in self.ifos]
+        group.attrs['num_templates'] = self.num_templates
+        group.attrs['analysis_block'] = self.analysis_block
+        group.attrs['timeslide_interval'] = self.timeslide_interval
+        for ifo in self.singles:
+            self.singles[ifo].save_checkpoint(
+                group.create_group('singles/' + ifo))
+        for ifos, coincs in self._coinc_buffers().items():
+            coincs.save_checkpoint(
+                group.create_group('coincs/' + '-'.join(sorted(ifos))))
+
+    def load_checkpoint(self, group):
+        """Replace the background buffers by those written with
+        `save_checkpoint`
+
+        The statistic and the configuration of the estimator are kept. The
+        lookback of the restored buffers is set to that of the estimator,
+        so the background limit can be changed between restarts.
+
+        Parameters
+        ----------
+        group: h5py.Group
+            The group the checkpoint was written to.
+        """
+        version = group.attrs.get('checkpoint_version', 0)
+        if version != _CHECKPOINT_VERSION:
+            raise ValueError("Checkpoint version %s is not supported, "
+                             "expected %s" % (version, _CHECKPOINT_VERSION))
+
+        ifos = [ifo.decode() if isinstance(ifo, bytes) else str(ifo)
+                for ifo in group.attrs['ifos']]
+        if sorted(ifos) != sorted(self.ifos):
+            raise ValueError("Checkpoint is for ifos %s, not %s"
+                             % (', '.join(ifos), ', '.join(self.ifos)))
+        for name in ['num_templates', 'analysis_block', 'timeslide_interval']:
+            if group.attrs[name] != getattr(self, name):
+                raise ValueError("Checkpoint has %s %s, the estimator has %s"
+                                 % (name, group.attrs[name],
+                                    getattr(self, name)))
+
+        buffers = self._coinc_buffers()
+        coincs = {}
+        for ifos in buffers:
+            name = 'coincs/' + '-'.join(sorted(ifos))
+            if name not in group:
+                raise ValueError("Checkpoint has no %s coincidences"
+                                 % '-'.join(sorted(ifos)))
+            coincs[ifos] = CoincExpireBuffer.load_checkpoint(group[name])
+            coincs[ifos].expiration = self.buffer_size
+
+        singles = {}
+        for ifo in group.get('singles', {}):
+            singles[ifo] = MultiRingBuffer.load_checkpoint(
+                group['singles/' + ifo])
+            singles[ifo].max_time = self.buffer_size
+
+        for ifos in coincs:
+            self._set_coinc_buffer(ifos, coincs[ifos])
+        self.singles = singles
+        for ifo in singles:
+            self.singles_dtype = singles[ifo].buffer.dtype
+        logging.info('Restored %s singles and %s coincidences',
+                     sum(singles[ifo].num_elements() for ifo in singles),
+                     sum(len(c) for c in coincs.values()))
+
     def ifar(self, coinc_stat):
         """Return the far that would be associated with the coincident given.
         """
         n = self.coincs.num_greater(coinc_stat)
         return self.background_time / lal.YRJUL_SI / (n + 1)
 
+    def ifar_curve(self, num_points=None):
+        """Return the cumulative ifar curve of the current background
+
+        Parameters
+        ----------
+        num_points: int, optional
+            If given, only return this many points evenly spread over the
+            background, always including the loudest one.
+
+        Returns
+        -------
+        stat: numpy.ndarray
+            The background statistic values in ascending order.
+        ifar: numpy.ndarray
+            The ifar in years a coincident with each statistic value would
+            be assigned.
+        """
+        return _ifar_curve(self.coincs, self.background_time, num_points)
+
     def set_singles_buffer(self, results):
         """Create the singles buffer
 
@@ -976,8 +2129,9 @@ class LiveCoincTimeslideBackgroundEstimator(object):
             updated_indices[ifo] = trigs['template_id']
         return updated_indices
 
-    def _find_coincs(self, results, ifos):
-        """Look for coincs within the set of single triggers
+    def _pair_singles(self, results, ifos):
+        """Find the coincidences of the new single triggers with the
+        buffered triggers of the other ifo
 
         Parameters
         ----------
@@ -985,11 +2139,25 @@ class LiveCoincTimeslideBackgroundEstimator(object):
             Dictionary of dictionaries indexed by ifo and keys such as 'snr',
             'chisq', etc. The specific format it determined by the
             LiveBatchMatchedFilter class.
+        ifos: list of strs
+            The ifos with new triggers, which must already be in the
+            buffers.
 
         Returns
         -------
-        coinc_results: dict of arrays
-            A dictionary of arrays containing the coincident results.
+        cstat: numpy.ndarray
+            The statistic of each coincidence.
+        offsets: list of numpy.ndarrays
+            The timeslide of each coincidence.
+        ctimes: dict of lists of numpy.ndarrays
+            The end time of each coincidence in each ifo.
+        single_expire: dict of lists of numpy.ndarrays
+            The time each single trigger of a coincidence was added.
+        template_ids: numpy.ndarray
+            The template of each coincidence.
+        trigger_ids: dict of numpy.ndarrays
+            The position of the single trigger of each coincidence within the
+            buffer of its template, negative from the end for new triggers.
         """
         # for each single detector trigger find the allowed coincidences
         # Record which template and the index of the single trigger
@@ -1001,52 +2169,87 @@ class LiveCoincTimeslideBackgroundEstimator(object):
         template_ids = [[]]
         trigger_ids = {self.ifos[0]:[[]], self.ifos[1]:[[]]}
 
-        # Calculate all the permutations of coincident triggers for each
-        # new single detector trigger collected
+        # Calculate all the permutations of coincident triggers for the new
+        # single detector triggers collected. All the triggers of an ifo are
+        # handled together, pairing them with the buffered triggers of the
+        # same template in the other ifo.
         for ifo in ifos:
             trigs = results[ifo]
+            if not len(trigs['end_time']):
+                continue
 
             oifo = self.ifos[1] if self.ifos[0] == ifo else self.ifos[0]
-
-            for i in range(len(trigs['end_time'])):
-                trig_stat = trigs['stat'][i]
-                trig_time = trigs['end_time'][i]
-                template = trigs['template_id'][i]
-
-                times = self.singles[oifo].data(template)['end_time']
-                stats = self.singles[oifo].data(template)['stat']
-
-                i1, _, slide = time_coincidence(times,
-                                 numpy.array(trig_time, ndmin=1,
-                                 dtype=numpy.float64),
-                                 self.time_window,
+            new_templates = numpy.array(trigs['template_id'])
+
+            # The new triggers were just added so they are at the end of
+            # their buffers. Find how far from the end each one is, counting
+            # the triggers of the same template added after it.
+            order = new_templates.argsort(kind='mergesort')
+            sorted_templates = new_templates[order]
+            first = numpy.searchsorted(sorted_templates, sorted_templates,
+                                       side='left')
+            last = numpy.searchsorted(sorted_templates, sorted_templates,
+                                      side='right')
+            new_ids = numpy.zeros(len(order), dtype=numpy.int32)
+            new_ids[order] = numpy.arange(len(order)) - last
+
+            # Collect the buffered triggers of every template involved
+            templates, group = numpy.unique(new_templates,
+                                            return_inverse=True)
+            data, expire, lengths = self.singles[oifo].data_many(templates)
+            data_group = numpy.repeat(numpy.arange(len(templates)), lengths)
+            data_start = numpy.cumsum(lengths) - lengths
+
+            i1, i2, slide = _grouped_time_coincidence(
+                                 data['end_time'], data_group,
+                                 numpy.array(trigs['end_time'],
+                                             dtype=numpy.float64),
+                                 group, self.time_window,
                                  self.timeslide_interval)
-                trig_stat = numpy.resize(trig_stat, len(i1))
-                c = self.stat_calculator.coinc(stats[i1], trig_stat,
-                                               slide, self.timeslide_interval)
-                offsets.append(slide)
-                cstat.append(c)
-                ctimes[oifo].append(times[i1])
-                ctimes[ifo].append(numpy.zeros(len(c), dtype=numpy.float64))
-                ctimes[ifo][-1].fill(trig_time)
-
-                single_expire[oifo].append(self.singles[oifo].expire_vector(template)[i1])
-                single_expire[ifo].append(numpy.zeros(len(c),
-                                          dtype=numpy.int32))
-                single_expire[ifo][-1].fill(self.singles[ifo].time - 1)
-
-                # save the template and trigger ids to keep association
-                # to singles. The trigger was just added so it must be in
-                # the last position we mark this with -1 so the
-                # slicing picks the right point
-                template_ids.append(numpy.zeros(len(c)) + template)
-                trigger_ids[oifo].append(i1)
-                trigger_ids[ifo].append(numpy.zeros(len(c)) - 1)
+            trig_stat = trigs['stat'][i2]
+            c = self.stat_calculator.coinc(data['stat'][i1], trig_stat,
+                                           slide, self.timeslide_interval)
+            offsets.append(slide)
+            cstat.append(c)
+            ctimes[oifo].append(data['end_time'][i1])
+            ctimes[ifo].append(numpy.array(trigs['end_time'][i2],
+                                           dtype=numpy.float64))
+
+            single_expire[oifo].append(expire[i1])
+            single_expire[ifo].append(numpy.zeros(len(c),
+                                      dtype=numpy.int32))
+            single_expire[ifo][-1].fill(self.singles[ifo].time - 1)
+
+            # save the template and trigger ids to keep association
+            # to singles. The new triggers are marked by their (negative)
+            # position from the end of their buffer
+            template_ids.append(new_templates[i2])
+            trigger_ids[oifo].append(i1 - data_start[data_group[i1]])
+            trigger_ids[ifo].append(new_ids[i2])
 
         cstat = numpy.concatenate(cstat)
         template_ids = numpy.concatenate(template_ids).astype(numpy.int32)
-        for ifo in ifos:
+        for ifo in self.ifos:
             trigger_ids[ifo] = numpy.concatenate(trigger_ids[ifo]).astype(numpy.int32)
+        return cstat, offsets, ctimes, single_expire, template_ids, trigger_ids
+
+    def _find_coincs(self, results, ifos):
+        """Look for coincs within the set of single triggers
+
+        Parameters
+        ----------
+        results: dict of arrays
+            Dictionary of dictionaries indexed by ifo and keys such as 'snr',
+            'chisq', etc. The specific format it determined by the
+            LiveBatchMatchedFilter class.
+
+        Returns
+        -------
+        coinc_results: dict of arrays
+            A dictionary of arrays containing the coincident results.
+        """
+        cstat, offsets, ctimes, single_expire, template_ids, trigger_ids = \
+            self._pair_singles(results, ifos)
 
         # cluster the triggers we've found
         # (both zerolag and non handled together)
@@ -1140,6 +2343,10 @@ class LiveCoincTimeslideBackgroundEstimator(object):
         # Let's see how large everything is
         logging.info('BKG Coincs %s stored %s bytes',
                      len(self.coincs), self.coincs.nbytes)
+        for ifo in self.singles:
+            logging.info('%s singles %s stored %s bytes', ifo,
+                         self.singles[ifo].num_elements(),
+                         self.singles[ifo].nbytes)
 
         # If there are no results just return
         valid_ifos = [k for k in results.keys() if results[k] and k in self.ifos]
@@ -1156,3 +2363,329 @@ class LiveCoincTimeslideBackgroundEstimator(object):
             coinc_results['coinc_possible'] = True
 
         return coinc_results
+
+
+class LiveCoincTimeslideBackgroundEstimatorMultiifo(
+        LiveCoincTimeslideBackgroundEstimator):
+    """Rolling buffer background estimation for two or more detectors.
+
+    The single detector triggers of every detector are kept in one store,
+    from which the coincidences of every combination of two or more of the
+    detectors are formed. Each combination has its own background. Time
+    slides are applied to the pivot detector only, as in
+    `time_multi_coincidence`.
+    """
+
+    def __init__(self, num_templates, analysis_block, background_statistic,
+                 stat_files, ifos,
+                 ifar_limit=100,
+                 timeslide_interval=.035,
+                 coinc_threshold=.002,
+                 return_background=False,
+                 pivot_ifo=None,
+                 fixed_ifo=None):
+        """
+        Parameters
+        ----------
+        num_templates: int
+            The size of the template bank
+        analysis_block: int
+            The number of seconds in each analysis segment
+        background_statistic: str
+            The name of the statistic to rank coincident events.
+        stat_files: list of strs
+            List of filenames that contain information used to construct
+            various coincident statistics.
+        ifos: list of strs
+            List of ifo names that are being analyzed, at least two.
+        ifar_limit: float
+            The largest inverse false alarm rate in years that we would like to
+            calculate.
+        timeslide_interval: float
+            The time in seconds between consecutive timeslide offsets.
+        coinc_threshold: float
+            Amount of time allowed to form a coincidence in addition to the
+            time of flight in seconds.
+        return_background: boolean
+            If true, background triggers will also be included in the file
+            output.
+        pivot_ifo: str, optional
+            The ifo to which time shifts are applied. The first ifo by
+            default. Combinations without it use the first of their ifos.
+        fixed_ifo: str, optional
+            The ifo which other ifos are tested against without time
+            shifts. The first other ifo by default.
+        """
+        from . import stat
+        self.num_templates = num_templates
+        self.analysis_block = analysis_block
+
+        stat_class = stat.get_statistic(background_statistic)
+        self.stat_calculator = stat_class(stat_files, ifos)
+
+        self.timeslide_interval = timeslide_interval
+        self.coinc_threshold = coinc_threshold
+        self.return_background = return_background
+
+        self.ifos = list(ifos)
+        if len(self.ifos) < 2:
+            raise ValueError("At least two ifos are needed for coincidence")
+        pivot_ifo = pivot_ifo or self.ifos[0]
+        fixed_ifo = fixed_ifo or [i for i in self.ifos if i != pivot_ifo][0]
+        if pivot_ifo not in self.ifos or fixed_ifo not in self.ifos \
+                or pivot_ifo == fixed_ifo:
+            raise ValueError("The pivot and fixed ifos must be two different "
+                             "ifos of %s" % ', '.join(self.ifos))
+
+        # Every combination lists its ifos by preference for the pivot and
+        # fixed roles
+        order = [pivot_ifo, fixed_ifo] + \
+            [i for i in self.ifos if i not in (pivot_ifo, fixed_ifo)]
+        self.combos = []
+        for num in range(2, len(order) + 1):
+            self.combos += list(itertools.combinations(order, num))
+
+        self.lookback_time = (ifar_limit * lal.YRJUL_SI * timeslide_interval) ** 0.5
+        self.buffer_size = int(numpy.ceil(self.lookback_time / analysis_block))
+
+        self.time_window = {}
+        for ifo1, ifo2 in itertools.permutations(self.ifos, 2):
+            det1, det2 = Detector(ifo1), Detector(ifo2)
+            self.time_window[ifo1, ifo2] = \
+                det1.light_travel_time_to_detector(det2) + coinc_threshold
+
+        self.coincs = {combo: CoincExpireBuffer(self.buffer_size, list(combo))
+                       for combo in self.combos}
+        self.singles = {}
+
+    @classmethod
+    def from_cli(cls, args, num_templates, analysis_chunk, ifos):
+        return cls(num_templates, analysis_chunk,
+                   args.background_statistic,
+                   args.background_statistic_files,
+                   return_background=args.store_background,
+                   ifar_limit=args.background_ifar_limit,
+                   timeslide_interval=args.timeslide_interval,
+                   ifos=ifos,
+                   pivot_ifo=args.pivot_ifo,
+                   fixed_ifo=args.fixed_ifo)
+
+    @staticmethod
+    def insert_args(parser):
+        LiveCoincTimeslideBackgroundEstimator.insert_args(parser)
+
+        group = parser.add_argument_group('Multi-detector Coincident '
+                                          'Background Estimation')
+        group.add_argument('--multiifo-background', action='store_true',
+            help="Form the coincidences of every combination of two or more "
+                 "detectors with one estimator that shares the single "
+                 "detector triggers, rather than one estimator per pair")
+        group.add_argument('--pivot-ifo',
+            help="The ifo to which time shifts are applied for the "
+                 "multi-detector background. Default is the first ifo.")
+        group.add_argument('--fixed-ifo',
+            help="The ifo which other ifos are compared to without time "
+                 "shifts for the multi-detector background. Default is the "
+                 "first ifo other than the pivot.")
+
+    def _coinc_buffers(self):
+        return dict(self.coincs)
+
+    def _set_coinc_buffer(self, ifos, coincs):
+        self.coincs[ifos] = coincs
+
+    def combo_type(self, combo):
+        """Return the name of a combination of ifos, such as 'H1-L1-V1'"""
+        return '-'.join(ifo for ifo in self.ifos if ifo in combo)
+
+    def combo_background_time(self, combo):
+        """Return the amount of background time that the buffers contain
+        for a combination of ifos. Only the pivot ifo is time shifted, so
+        the other ifos contribute the time they all have in common.
+        """
+        if not self.singles:
+            return 0
+        time = 1.0 / self.timeslide_interval
+        time *= self.singles[combo[0]].filled_time * self.analysis_block
+        time *= min(self.singles[ifo].filled_time for ifo in combo[1:]) \
+            * self.analysis_block
+        return time
+
+    def combo_ifar(self, combo, coinc_stat):
+        """Return the ifar that would be associated with a coincident of
+        the given combination of ifos.
+        """
+        n = self.coincs[combo].num_greater(coinc_stat)
+        return self.combo_background_time(combo) / lal.YRJUL_SI / (n + 1)
+
+    def combo_ifar_curve(self, combo, num_points=None):
+        """Return the cumulative ifar curve of the background of the given
+        combination of ifos, see `ifar_curve`.
+        """
+        return _ifar_curve(self.coincs[combo],
+                           self.combo_background_time(combo), num_points)
+
+    def background_dists(self):
+        """Return the ifos, background statistic values and background time
+        in years of each combination of ifos.
+        """
+        return [(list(combo), self.coincs[combo].data,
+                 self.combo_background_time(combo) / lal.YRJUL_SI)
+                for combo in self.combos]
+
+    def _find_combo_coincs(self, combo, ifos, templates):
+        """Look for the coincs of a combination of ifos which include at
+        least one of the new single triggers
+
+        Parameters
+        ----------
+        combo: tuple of strs
+            The ifos of the combination, pivot ifo first.
+        ifos: list of strs
+            The ifos of the combination which have new triggers.
+        templates: numpy.ndarray
+            The templates with new triggers in any of these ifos.
+
+        Returns
+        -------
+        coinc_results: dict of arrays
+            A dictionary of arrays containing the coincident results.
+        """
+        data = {}
+        expire = {}
+        groups = {}
+        new = {}
+        for ifo in combo:
+            data[ifo], expire[ifo], lengths = \
+                self.singles[ifo].data_many(templates)
+            groups[ifo] = numpy.repeat(numpy.arange(len(templates)), lengths)
+            if ifo in ifos:
+                new[ifo] = expire[ifo] == self.singles[ifo].time - 1
+            else:
+                new[ifo] = numpy.zeros(len(expire[ifo]), dtype=bool)
+
+        ids, slide = _grouped_time_multi_coincidence(
+            {ifo: data[ifo]['end_time'] for ifo in combo}, groups,
+            combo, self.time_window, self.timeslide_interval)
+
+        # Coincs only of old triggers were found in earlier updates
+        keep = numpy.zeros(len(slide), dtype=bool)
+        for ifo in combo:
+            keep |= new[ifo][ids[ifo]]
+        keep = numpy.flatnonzero(keep)
+        slide = slide[keep]
+        ids = {ifo: ids[ifo][keep] for ifo in combo}
+
+        num_zerolag = 0
+        logging.info('%s: %s background and zerolag coincs',
+                     self.combo_type(combo), len(slide))
+        if len(slide) > 0:
+            sngl = {ifo: data[ifo]['stat'][ids[ifo]] for ifo in combo}
+            ctimes = [data[ifo]['end_time'][ids[ifo]] for ifo in combo]
+            if len(combo) == 2:
+                cstat = self.stat_calculator.coinc(sngl[combo[0]],
+                                                   sngl[combo[1]], slide,
+                                                   self.timeslide_interval)
+                cidx = cluster_coincs(cstat, ctimes[0], ctimes[1], slide,
+                                      self.timeslide_interval,
+                                      self.analysis_block)
+            else:
+                cstat = self.stat_calculator.coinc_multiifo(
+                    [(ifo, sngl[ifo]) for ifo in combo], slide,
+                    self.timeslide_interval,
+                    to_shift=[-1 if ifo == combo[0] else 0 for ifo in combo],
+                    time_addition=self.coinc_threshold)
+                cidx = cluster_coincs_multiifo(cstat, ctimes, slide,
+                                               self.timeslide_interval,
+                                               self.analysis_block)
+            cidx = cidx.astype(int)
+            zerolag_idx = cidx[slide[cidx] == 0]
+            bkg_idx = cidx[slide[cidx] != 0]
+
+            single_expire = {ifo: expire[ifo][ids[ifo]][bkg_idx]
+                             for ifo in combo}
+            self.coincs[combo].add(cstat[bkg_idx], single_expire, ifos)
+            num_zerolag = len(zerolag_idx)
+        else:
+            self.coincs[combo].increment(ifos)
+
+        coinc_results = {}
+        if num_zerolag > 0:
+            idx = zerolag_idx[cstat[zerolag_idx].argmax()]
+            coinc_results['foreground/ifar'] = \
+                self.combo_ifar(combo, cstat[idx])
+            coinc_results['foreground/stat'] = cstat[idx]
+            for ifo in combo:
+                single_data = data[ifo][ids[ifo][idx]]
+                for key in single_data.dtype.names:
+                    path = 'foreground/%s/%s' % (ifo, key)
+                    coinc_results[path] = single_data[key]
+            coinc_results['foreground/type'] = self.combo_type(combo)
+
+        # Save some summary statistics about the background
+        coinc_results['background/time'] = \
+            numpy.array([self.combo_background_time(combo)])
+        coinc_results['background/count'] = len(self.coincs[combo].data)
+
+        # Save all the background triggers
+        if self.return_background:
+            coinc_results['background/stat'] = self.coincs[combo].data
+        return coinc_results
+
+    def add_singles(self, results):
+        """Add singles to the background estimate and find candidates
+
+        Parameters
+        ----------
+        results: dict of arrays
+            Dictionary of dictionaries indexed by ifo and keys such as 'snr',
+            'chisq', etc. The specific format it determined by the
+            LiveBatchMatchedFilter class.
+
+        Returns
+        -------
+        coinc_results: list of dicts of arrays
+            For each combination of ifos with new triggers, a dictionary of
+            arrays containing the coincident results, as returned by
+            `LiveCoincTimeslideBackgroundEstimator.add_singles`. These can
+            be given to `pick_best_coinc`.
+        """
+        for combo in self.combos:
+            logging.info('BKG Coincs %s %s stored %s bytes',
+                         self.combo_type(combo), len(self.coincs[combo]),
+                         self.coincs[combo].nbytes)
+        for ifo in self.singles:
+            logging.info('%s singles %s stored %s bytes', ifo,
+                         self.singles[ifo].num_elements(),
+                         self.singles[ifo].nbytes)
+
+        # If there are no results just return
+        valid_ifos = [k for k in results.keys() if results[k] and k in self.ifos]
+        if len(valid_ifos) == 0: return []
+
+        # Add single triggers to the shared buffer
+        self._add_singles_to_buffer(results, ifos=valid_ifos)
+        if len(self.singles.keys()) == 0:
+            return []
+
+        new_templates = {ifo: numpy.array(results[ifo]['template_id'],
+                                          dtype=int)
+                         for ifo in valid_ifos}
+
+        # Calculate zerolag and background coincidences of every
+        # combination with new triggers
+        coinc_results = []
+        for combo in self.combos:
+            ifos = [ifo for ifo in combo if ifo in valid_ifos]
+            if not ifos:
+                continue
+            templates = numpy.unique(numpy.concatenate(
+                [new_templates[ifo] for ifo in ifos]))
+            result = self._find_combo_coincs(combo, ifos, templates)
+
+            # record if a coinc is possible in this chunk
+            if len(ifos) == len(combo):
+                result['coinc_possible'] = True
+            coinc_results.append(result)
+
+        return coinc_results
@@ -37,6 +37,7 @@ from pycbc.detector import Detector
 from . import coinc, ranking
 
 from .eventmgr_cython import findchirp_cluster_over_window_cython
+from .eventmgr_cython import findchirp_cluster_over_window_segmented_cython
 
 @schemed("pycbc.events.threshold_")
 def threshold(series, value):
@@ -176,7 +177,121 @@ def cluster_reduce(idx, snr, window_size):
     return idx.take(ind), snr.take(ind)
 
 
+def findchirp_cluster_over_window_segmented(times, values, window_lengths,
+                                            bounds):
+    """ Reduce the events of many independent series (for example the
+    triggers of several templates) in a single pass, using the FindChirp
+    clustering algorithm within each series. Clusters never extend across
+    the boundary between two series.
+
+    Parameters
+    -----------
+    times: Array
+        The concatenated indices of the SNR values of every series
+    values: Array
+        The concatenated SNR values of every series
+    window_lengths: int or list of ints
+        The size of the window in integer samples, either one for all
+        series or one per series. Must be positive.
+    bounds: list of ints
+        The offsets into times of the start of each series, followed by
+        the total length, so that series n is times[bounds[n]:bounds[n+1]].
+
+    Returns
+    -------
+    indices: Array
+        The reduced list of indices into the concatenated values
+    """
+    bounds = numpy.array(bounds, dtype=numpy.int64)
+    nseg = len(bounds) - 1
+    window_lengths = numpy.array(window_lengths, dtype=numpy.int32)
+    if window_lengths.ndim == 0:
+        window_lengths = numpy.repeat(window_lengths, nseg)
+    assert len(window_lengths) == nseg, \
+        'Need one clustering window length per series'
+    assert (window_lengths > 0).all(), \
+        'Clustering window length is not positive'
+
+    indices = numpy.zeros(len(times), dtype=numpy.int64)
+    absvalues = numpy.array(abs(values), copy=False)
+    times = numpy.array(times, dtype=numpy.int32, copy=False)
+    k = findchirp_cluster_over_window_segmented_cython(times, absvalues,
+                                                       window_lengths,
+                                                       bounds, indices)
+    return indices[0:k]
+
+
+def cluster_reduce_segmented(idxs, snrs, window_sizes):
+    """ Reduce the events of many independent series by clustering over a
+    window, clustering all of the series in a single pass
+
+    Parameters
+    -----------
+    idxs: list of Arrays
+        The list of indices of the SNR values of each series
+    snrs: list of Arrays
+        The list of SNR values of each series
+    window_sizes: int or list of ints
+        The size of the window in integer samples, either one for all
+        series or one per series.
+
+    Returns
+    -------
+    idxs: list of Arrays
+        The list of indices of the SNR values of each series
+    snrs: list of Arrays
+        The list of SNR values of each series
+    """
+    if not len(idxs):
+        return [], []
+    bounds = numpy.zeros(len(idxs) + 1, dtype=numpy.int64)
+    bounds[1:] = numpy.cumsum([len(i) for i in idxs])
+    idx = numpy.concatenate(idxs)
+    snr = numpy.concatenate(snrs)
+    ind = findchirp_cluster_over_window_segmented(idx, snr, window_sizes,
+                                                  bounds)
+    split = numpy.searchsorted(ind, bounds[1:-1])
+    idx = idx.take(ind)
+    snr = snr.take(ind)
+    return numpy.split(idx, split), numpy.split(snr, split)
+
+
+class _StreamingDatasetWriter(object):
+    """ Write datasets to an open HDF5 file, extending any existing dataset
+    of the same name rather than replacing it.
+    """
+    chunk_size = 2 ** 14
+
+    def __init__(self, f, prefix):
+        self.f = f
+        self.prefix = prefix
+
+    def __setitem__(self, name, data):
+        col = self.prefix + '/' + name
+        if col in self.f:
+            dset = self.f[col]
+            start = len(dset)
+            dset.resize((start + len(data),))
+            dset[start:] = data
+        elif numpy.ndim(data) == 1:
+            self.f.create_dataset(col, data=data,
+                                  maxshape=(None,),
+                                  chunks=(self.chunk_size,),
+                                  compression='gzip',
+                                  compression_opts=9,
+                                  shuffle=True)
+        else:
+            self.f.create_dataset(col, data=data,
+                                  compression='gzip',
+                                  compression_opts=9,
+                                  shuffle=True)
+
+
 class EventManager(object):
+    # The open output file when events are streamed to disk
+    stream_file = None
+    events_written = 0
+
     def __init__(self, opt, column, column_types, **kwds):
         self.opt = opt
         self.global_params = kwds
@@ -352,6 +467,58 @@ class EventManager(object):
     def finalize_template_events(self):
         self.accumulate.append(self.template_events)
         self.template_events = numpy.array([], dtype=self.event_dtype)
+        if self.stream_file is not None:
+            self.stream_pending += 1
+            if self.stream_pending >= self.stream_interval:
+                self.flush_events()
+
+    def stream_events(self, outname, flush_interval, gwstrain=None):
+        """ Write the events to the output file as the analysis proceeds
+        rather than holding them all in memory until `write_events`.
+
+        Every `flush_interval` templates the accumulated events have the
+        trigger cuts of `consolidate_events` applied and are appended to
+        resizable datasets. The remaining events and the search information
+        are written by `write_events`, giving the same file layout as when
+        all events are written at the end. The file is written under a
+        temporary name until then.
+
+        Parameters
+        ----------
+        outname: str
+            The name of the output file. This must be the name later given
+            to `write_events`.
+        flush_interval: int
+            The number of templates between writes.
+        gwstrain: {None, TimeSeries}
+            The strain data, used to keep triggers near injections.
+        """
+        if self.opt.keep_loudest_interval:
+            raise ValueError("Keeping the loudest triggers in an interval "
+                             "needs all triggers, so cannot be used while "
+                             "streaming them to disk")
+        self.make_output_dir(outname)
+        self.stream_name = outname + '.partial'
+        self.stream_file = h5py.File(self.stream_name, 'w')
+        self.stream_interval = flush_interval
+        self.stream_pending = 0
+        self.stream_gwstrain = gwstrain
+
+    def flush_events(self):
+        """ Apply the trigger cuts to the accumulated events and append them
+        to the output file opened by `stream_events`.
+        """
+        self.consolidate_events(self.opt, gwstrain=self.stream_gwstrain)
+        self.events.sort(order='template_id')
+        f = _StreamingDatasetWriter(self.stream_file,
+                                    self.opt.channel_name[0:2])
+        self._write_event_columns(f, self.events)
+        self.events_written += len(self.events)
+        self.stream_file.flush()
+
+        self.events = numpy.array([], dtype=self.event_dtype)
+        self.accumulate = [self.events]
+        self.stream_pending = 0
 
     def consolidate_events(self, opt, gwstrain=None):
         self.events = numpy.concatenate(self.accumulate)
@@ -390,6 +557,26 @@ class EventManager(object):
     def finalize_events(self):
         self.events = numpy.concatenate(self.accumulate)
 
+    def merge_events(self, other):
+        """ Append the events and template parameters held by another
+        EventManager, such as one which filtered a separate part of the
+        template bank in a worker process. The template ids of the other
+        manager's events are offset to follow those already held here.
+
+        Parameters
+        ----------
+        other: EventManager
+            The event manager to take events from. Its events must have
+            been finalized with `finalize_events`.
+        """
+        new_events = other.events.copy()
+        new_events['template_id'] += len(self.template_params)
+        self.template_params += other.template_params
+        self.template_index = len(self.template_params) - 1
+        self.accumulate.append(new_events)
+        if self.stream_file is not None:
+            self.flush_events()
+
     def make_output_dir(self, outname):
         path = os.path.dirname(outname)
         if path != '':
@@ -418,40 +605,29 @@ class EventManager(object):
         else:
             raise ValueError('Cannot write to this format')
 
-    def write_to_hdf(self, outname):
-        class fw(object):
-            def __init__(self, name, prefix):
-                self.f = h5py.File(name, 'w')
-                self.prefix = prefix
-
-            def __setitem__(self, name, data):
-                col = self.prefix + '/' + name
-                self.f.create_dataset(col, data=data,
-                                      compression='gzip',
-                                      compression_opts=9,
-                                      shuffle=True)
-
-        self.events.sort(order='template_id')
+    def _write_event_columns(self, f, events):
+        """ Write the trigger columns of the given events, which must be
+        sorted by template id, through the dataset writer f.
+        """
         th = numpy.array([p['tmplt'].template_hash for p in
                           self.template_params])
-        tid = self.events['template_id']
-        f = fw(outname, self.opt.channel_name[0:2])
+        tid = events['template_id']
 
-        if len(self.events):
-            f['snr'] = abs(self.events['snr'])
+        if len(events):
+            f['snr'] = abs(events['snr'])
             try:
                 # Precessing
-                f['u_vals'] = self.events['u_vals']
-                f['coa_phase'] = self.events['coa_phase']
-                f['hplus_cross_corr'] = self.events['hplus_cross_corr']
+                f['u_vals'] = events['u_vals']
+                f['coa_phase'] = events['coa_phase']
+                f['hplus_cross_corr'] = events['hplus_cross_corr']
             except Exception:
                 # Not precessing
-                f['coa_phase'] = numpy.angle(self.events['snr'])
-            f['chisq'] = self.events['chisq']
-            f['bank_chisq'] = self.events['bank_chisq']
-            f['bank_chisq_dof'] = self.events['bank_chisq_dof']
-            f['cont_chisq'] = self.events['cont_chisq']
-            f['end_time'] = self.events['time_index'] / \
+                f['coa_phase'] = numpy.angle(events['snr'])
+            f['chisq'] = events['chisq']
+            f['bank_chisq'] = events['bank_chisq']
+            f['bank_chisq_dof'] = events['bank_chisq_dof']
+            f['cont_chisq'] = events['cont_chisq']
+            f['end_time'] = events['time_index'] / \
                               float(self.opt.sample_rate) \
                             + self.opt.gps_start_time
             try:
@@ -489,20 +665,44 @@ class EventManager(object):
                 cont_dof = cont_dof * 2
             if self.opt.autochi_max_valued_dof:
                 cont_dof = self.opt.autochi_max_valued_dof
-            f['cont_chisq_dof'] = numpy.repeat(cont_dof, len(self.events))
+            f['cont_chisq_dof'] = numpy.repeat(cont_dof, len(events))
 
-            if 'chisq_dof' in self.events.dtype.names:
-                f['chisq_dof'] = self.events['chisq_dof'] / 2 + 1
+            if 'chisq_dof' in events.dtype.names:
+                f['chisq_dof'] = events['chisq_dof'] / 2 + 1
             else:
-                f['chisq_dof'] = numpy.zeros(len(self.events))
+                f['chisq_dof'] = numpy.zeros(len(events))
 
             f['template_hash'] = th[tid]
 
-            if 'sg_chisq' in self.events.dtype.names:
-                f['sg_chisq'] = self.events['sg_chisq']
+            if 'sg_chisq' in events.dtype.names:
+                f['sg_chisq'] = events['sg_chisq']
 
             if self.opt.psdvar_segment is not None:
-                f['psd_var_val'] = self.events['psd_var_val']
+                f['psd_var_val'] = events['psd_var_val']
+
+    def write_to_hdf(self, outname):
+        class fw(object):
+            def __init__(self, name, prefix):
+                self.f = h5py.File(name, 'w')
+                self.prefix = prefix
+
+            def __setitem__(self, name, data):
+                col = self.prefix + '/' + name
+                self.f.create_dataset(col, data=data,
+                                      compression='gzip',
+                                      compression_opts=9,
+                                      shuffle=True)
+
+        if self.stream_file is not None:
+            # The events found before the last flush are already written
+            f = _StreamingDatasetWriter(self.stream_file,
+                                        self.opt.channel_name[0:2])
+        else:
+            f = fw(outname, self.opt.channel_name[0:2])
+
+        self.events.sort(order='template_id')
+        self._write_event_columns(f, self.events)
+        self.events_written += len(self.events)
 
         if self.opt.trig_start_time:
             f['search/start_time'] = numpy.array([self.opt.trig_start_time])
@@ -558,6 +758,11 @@ class EventManager(object):
                     f['gating/' + gate_type + '/pad'] = \
                             numpy.array([g[2] for g in gating_info[gate_type]])
 
+        if self.stream_file is not None:
+            self.stream_file.close()
+            os.rename(self.stream_name, outname)
+            self.stream_file = None
+
 
 class EventManagerMultiDetBase(EventManager):
     def __init__(self, opt, ifos, column, column_types, psd=None, **kwargs):
@@ -1084,6 +1289,8 @@ class EventManagerMultiDet(EventManagerMultiDetBase):
 
 
 __all__ = ['threshold_and_cluster', 'findchirp_cluster_over_window',
-           'threshold', 'cluster_reduce', 'ThresholdCluster',
+           'findchirp_cluster_over_window_segmented',
+           'threshold', 'cluster_reduce', 'cluster_reduce_segmented',
+           'ThresholdCluster',
            'threshold_real_numpy', 'threshold_only',
            'EventManager', 'EventManagerMultiDet', 'EventManagerCoherent']
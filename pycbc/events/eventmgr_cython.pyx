@@ -28,3 +28,37 @@ def findchirp_cluster_over_window_cython\
             indices[j] = i
             curr_ind = i
     return j
+
+
+@boundscheck(False)
+@wraparound(False)
+@cdivision(True)
+def findchirp_cluster_over_window_segmented_cython\
+        (numpy.ndarray[numpy.int32_t, ndim=1] times,
+         numpy.ndarray[REALTYPE, ndim=1] absvalues,
+         numpy.ndarray[numpy.int32_t, ndim=1] window_lengths,
+         numpy.ndarray[numpy.int64_t, ndim=1] bounds,
+         numpy.ndarray[numpy.int64_t, ndim=1] indices):
+    cdef int nseg = window_lengths.shape[0]
+    cdef long j = -1
+    cdef long curr_ind
+    cdef long i
+    cdef int s
+    cdef int window_length
+
+    for s in range(nseg):
+        if bounds[s] == bounds[s + 1]:
+            continue
+        window_length = window_lengths[s]
+        j += 1
+        indices[j] = bounds[s]
+        curr_ind = bounds[s]
+        for i in range(bounds[s] + 1, bounds[s + 1]):
+            if ((times[i] - times[curr_ind]) > window_length):
+                j += 1
+                indices[j] = i
+                curr_ind = i
+            elif (absvalues[i] > absvalues[curr_ind]):
+                indices[j] = i
+                curr_ind = i
+    return j + 1
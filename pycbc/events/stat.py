@@ -325,6 +325,127 @@ class NewSNRCutStatistic(NewSNRStatistic):
         return s1 ** 0.5
 
 
+class SparseBinIndex(object):
+    """Hash table of the positions of a set of sparse histogram bins.
+
+    Each bin, a row of small integers, is packed into a single integer key
+    and placed in an open addressing table, so bins can be looked up in
+    constant time without expanding the histogram into a dense array.
+    """
+
+    def __init__(self, param_bin, table=None):
+        """
+        Parameters
+        ----------
+        param_bin: numpy.ndarray
+            Structured array of integer columns giving the histogram bins.
+        table: numpy.ndarray, optional
+            The table made by a previous instance for the same bins, for
+            example read or memory mapped from the statistic file. It is
+            made from the bins if not given.
+        """
+        self.columns = param_bin.dtype.names
+        self.low = []
+        self.radix = []
+        for col in self.columns:
+            values = param_bin[col].astype(numpy.int64)
+            low = values.min() if len(values) else 0
+            high = values.max() if len(values) else 0
+            self.low.append(int(low))
+            self.radix.append(int(high - low + 1))
+
+        if numpy.prod([float(r) for r in self.radix]) >= 2 ** 62:
+            raise ValueError("The histogram bins can not be packed into 64 "
+                             "bit keys")
+
+        self.keys, _ = self.pack(param_bin)
+        bits = max(int(numpy.ceil(numpy.log2(2 * len(self.keys) + 1))), 1)
+        self.mask = 2 ** bits - 1
+        self.shift = numpy.uint64(64 - bits)
+
+        if table is None:
+            table = self._make_table()
+        elif len(table) != self.mask + 1:
+            raise ValueError("The bin index table does not match the bins")
+        self.table = table
+
+    @classmethod
+    def from_group(cls, param_bin, group):
+        """Get the index of the bins from the 'bin_index' dataset of an hdf
+        group if it has one, memory mapping it when stored contiguously,
+        otherwise make it.
+        """
+        if 'bin_index' not in group:
+            return cls(param_bin)
+
+        dset = group['bin_index']
+        offset = dset.id.get_offset()
+        if offset is not None and dset.compression is None:
+            table = numpy.memmap(group.file.filename, mode='r',
+                                 dtype=dset.dtype, shape=dset.shape,
+                                 offset=offset)
+        else:
+            table = dset[:]
+        return cls(param_bin, table=table)
+
+    def save(self, group):
+        """Store the table uncompressed in an hdf group, so that it can be
+        memory mapped when read back.
+        """
+        group.create_dataset('bin_index', data=numpy.array(self.table))
+
+    def pack(self, bins):
+        """Return the integer keys of the given bins, and whether each of
+        them is within the range of the indexed bins.
+        """
+        keys = numpy.zeros(len(bins), dtype=numpy.int64)
+        valid = numpy.ones(len(bins), dtype=bool)
+        for col, low, radix in zip(self.columns, self.low, self.radix):
+            value = bins[col].astype(numpy.int64) - low
+            valid &= (value >= 0) & (value < radix)
+            keys = keys * radix + value
+        return keys, valid
+
+    def _hash(self, keys):
+        # Fibonacci hashing, the top bits of the key times 2**64 / phi
+        keys = keys.astype(numpy.uint64) * numpy.uint64(0x9E3779B97F4A7C15)
+        return (keys >> self.shift).astype(numpy.int64)
+
+    def _make_table(self):
+        table = numpy.zeros(self.mask + 1, dtype=numpy.int64) - 1
+        pending = numpy.arange(len(self.keys))
+        slot = self._hash(self.keys)
+        while len(pending):
+            # The first of the bins probing each free slot takes it, the
+            # others probe the next slot
+            free = numpy.flatnonzero(table[slot] < 0)
+            taken, first = numpy.unique(slot[free], return_index=True)
+            table[taken] = pending[free[first]]
+            placed = numpy.zeros(len(pending), dtype=bool)
+            placed[free[first]] = True
+            pending = pending[~placed]
+            slot = (slot[~placed] + 1) & self.mask
+        return table
+
+    def lookup(self, bins):
+        """Return the position of each of the given bins in the indexed
+        bins, or -1 for bins which are not indexed.
+        """
+        keys, valid = self.pack(bins)
+        loc = numpy.zeros(len(bins), dtype=numpy.int64) - 1
+        pending = numpy.flatnonzero(valid)
+        slot = self._hash(keys[pending])
+        while len(pending):
+            pos = self.table[slot]
+            filled = pos >= 0
+            found = filled & (self.keys[pos] == keys[pending])
+            loc[pending[found]] = pos[found]
+            probe = filled & ~found
+            pending = pending[probe]
+            slot = (slot[probe] + 1) & self.mask
+        return loc
+
+
 class PhaseTDNewStatistic(NewSNRStatistic):
     """Statistic that re-weights combined newsnr using coinc parameters.
 
@@ -356,6 +477,7 @@ class PhaseTDNewStatistic(NewSNRStatistic):
         self.param_bin = {}
         self.two_det_flag = (len(ifos) == 2)
         self.two_det_weights = {}
+        self.bin_index = {}
 
     def get_hist(self, ifos=None):
         """Read in a signal density file for the ifo combination"""
@@ -465,6 +587,16 @@ class PhaseTDNewStatistic(NewSNRStatistic):
                 id1 = self.param_bin[ifo]['c1'].astype(numpy.int32) + self.c1_size[ifo] // 2
                 id2 = self.param_bin[ifo]['c2'].astype(numpy.int32) + self.c2_size[ifo] // 2
                 self.two_det_weights[ifo][id0, id1, id2] = self.weights[ifo]
+            else:
+                # For more detectors, index the sparse bins with a hash table
+                # instead, which is stored in new statistic files
+                try:
+                    self.bin_index[ifo] = SparseBinIndex.from_group(
+                        self.param_bin[ifo], histfile[ifo])
+                except ValueError as e:
+                    logging.info("Not indexing the %s histogram bins: %s",
+                                 ifo, e)
+                    self.bin_index[ifo] = None
 
         relfac = histfile.attrs['sensitivity_ratios']
         for ifo, sense in zip(self.hist_ifos, relfac):
@@ -589,6 +721,13 @@ class PhaseTDNewStatistic(NewSNRStatistic):
                 within = within & (id2 > 0) & (id2 < self.c2_size[ref_ifo])
                 within = numpy.where(within)[0]
                 rate[rtype[within]] = self.two_det_weights[ref_ifo][id0[within], id1[within], id2[within]]
+            elif self.bin_index.get(ref_ifo) is not None:
+                # Constant time hash table lookup of the sparse bins
+                loc = self.bin_index[ref_ifo].lookup(nbinned)
+                rate[rtype] = self.weights[ref_ifo][loc]
+
+                # These weren't in our histogram so give them max penalty
+                rate[rtype[loc < 0]] = self.max_penalty
             else:
                 # Low[er]-RAM, high[er]-CPU option for >two det
                 loc = numpy.searchsorted(self.param_bin[ref_ifo], nbinned)
@@ -20,10 +20,9 @@ from .fftw_pruned_cython import second_phase_cython
 warn_msg = ("The FFTW_pruned module can be used to speed up computing SNR "
             "timeseries by computing first at a low sample rate and then "
             "computing at full sample rate only at certain samples. This code "
-            "has not yet been used in production, and has no test case. "
-            "This was also ported to Cython in this state. "
-            "This code would need verification before trusting results. "
-            "Please do contribute test cases.")
+            "is tested against the full inverse FFT by the power chisq and "
+            "matched filter test cases, but has not yet been used in "
+            "production. Please report any differences from the full FFT.")
 
 logging.warning(warn_msg)
 
@@ -113,7 +112,7 @@ def plan_first_phase(N1, N2):
              vin.ptr, None, 1, N2,
              vout.ptr, None, 1, N2, FFTW_BACKWARD, FFTW_MEASURE)
 
-_theplan = None
+_theplans = {}
 def first_phase(invec, outvec, N1, N2):
     """
     This implements the first phase of the FFT decomposition, using
@@ -130,10 +129,9 @@ def first_phase(invec, outvec, N1, N2):
     N2 : int
         Number of columns.
     """
-    global _theplan
-    if _theplan is None:
-        _theplan = plan_first_phase(N1, N2)
-    fexecute(_theplan, invec.ptr, outvec.ptr)
+    if (N1, N2) not in _theplans:
+        _theplans[(N1, N2)] = plan_first_phase(N1, N2)
+    fexecute(_theplans[(N1, N2)], invec.ptr, outvec.ptr)
 
 def second_phase(invec, indices, N1, N2):
     """
@@ -169,7 +167,7 @@ def second_phase(invec, indices, N1, N2):
 
     return out
 
-_thetransposeplan = None
+_thetransposeplans = {}
 def fft_transpose_fftw(vec):
     """
     Perform an FFT transpose from vec into outvec.
@@ -185,12 +183,11 @@ def fft_transpose_fftw(vec):
     outvec : array
         Transposed output array.
     """
-    global _thetransposeplan
     outvec = pycbc.types.zeros(len(vec), dtype=vec.dtype)
-    if _theplan is None:
-        N1, N2 = splay(vec)
-        _thetransposeplan = plan_transpose(N1, N2)
-    ftexecute(_thetransposeplan, vec.ptr, outvec.ptr)
+    N1, N2 = splay(vec)
+    if (N1, N2) not in _thetransposeplans:
+        _thetransposeplans[(N1, N2)] = plan_transpose(N1, N2)
+    ftexecute(_thetransposeplans[(N1, N2)], vec.ptr, outvec.ptr)
     return  outvec
 
 fft_transpose = fft_transpose_fftw
@@ -199,7 +196,7 @@ def splay(vec):
     """ Determine two lengths to split stride the input vector by
     """
     N2 = 2 ** int(numpy.log2( len(vec) ) / 2)
-    N1 = len(vec) / N2
+    N1 = len(vec) // N2
     return N1, N2
 
 def pruned_c2cifft(invec, outvec, indices, pretransposed=False):
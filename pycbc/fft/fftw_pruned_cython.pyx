@@ -29,7 +29,7 @@ def second_phase_cython(int N1, int N2, int NI,
         phase_inc = (2 * pi * k) / <float> N
         sp = sin(phase_inc)
         cp = cos(phase_inc)
-        twiddle_inc = cp + cp * 1j
+        twiddle_inc = cp + sp * 1j
         twiddle = 1 + 0j
         
         for n1 in range(N1):
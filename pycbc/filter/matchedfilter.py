@@ -127,7 +127,8 @@ class MatchedFilterControl(object):
     def __init__(self, low_frequency_cutoff, high_frequency_cutoff, snr_threshold, tlen,
                  delta_f, dtype, segment_list, template_output, use_cluster,
                  downsample_factor=1, upsample_threshold=1, upsample_method='pruned_fft',
-                 gpu_callback_method='none', cluster_function='symmetric'):
+                 gpu_callback_method='none', cluster_function='symmetric',
+                 adaptive_downsample=False, adaptive_fraction=0.99):
         """ Create a matched filter engine.
 
         Parameters
@@ -159,6 +160,14 @@ class MatchedFilterControl(object):
             sliding forward window; if 'symmetric', each window's peak is compared
             to the windows before and after it, and only kept as a trigger if larger
             than both.
+        adaptive_downsample : {False, bool}, optional
+            If true, choose the factor by which to reduce the sample rate of the
+            heirarchical matched filter separately for each template, using at
+            most downsample_factor.
+        adaptive_fraction : {0.99, float}, optional
+            The fraction of the template's sigmasq which must lie below the
+            Nyquist frequency of the reduced rate filter when choosing the
+            downsample factor adaptively.
         """
         # Assuming analysis time is constant across templates and segments, also
         # delta_f is constant across segments.
@@ -211,29 +220,30 @@ class MatchedFilterControl(object):
             self.ifft = IFFT(self.corr_mem, self.snr_mem)
 
         elif downsample_factor >= 1:
-            self.matched_filter_and_cluster = self.heirarchical_matched_filter_and_cluster
+            if adaptive_downsample:
+                self.matched_filter_and_cluster = \
+                    self.adaptive_heirarchical_matched_filter_and_cluster
+            else:
+                self.matched_filter_and_cluster = \
+                    self.heirarchical_matched_filter_and_cluster
             self.downsample_factor = downsample_factor
+            self.max_downsample_factor = downsample_factor
             self.upsample_method = upsample_method
             self.upsample_threshold = upsample_threshold
+            self.adaptive_fraction = adaptive_fraction
+            self.downsample_counts = {}
 
             N_full = self.tlen
-            N_red = N_full / downsample_factor
             self.kmin_full, self.kmax_full = get_cutoff_indices(self.flow,
                                               self.fhigh, self.delta_f, N_full)
 
-            self.kmin_red, _ = get_cutoff_indices(self.flow,
-                                                  self.fhigh, self.delta_f, N_red)
-
-            if self.kmax_full < N_red:
-                self.kmax_red = self.kmax_full
-            else:
-                self.kmax_red = N_red - 1
-
-            self.snr_mem = zeros(N_red, dtype=self.dtype)
             self.corr_mem_full = FrequencySeries(zeros(N_full, dtype=self.dtype), delta_f=self.delta_f)
-            self.corr_mem = Array(self.corr_mem_full[0:N_red], copy=False)
             self.inter_vec = zeros(N_full, dtype=self.dtype)
 
+            # The reduced rate workspace for each downsample factor used
+            self._reduced = {}
+            self._set_reduced_rate(downsample_factor)
+
         else:
             raise ValueError("Invalid downsample factor")
 
@@ -372,7 +382,80 @@ class MatchedFilterControl(object):
         corr = FrequencySeries(self.corr_mem, delta_f=self.delta_f, copy=False)
         return snr, norm, corr, idx, snrv
 
-    def heirarchical_matched_filter_and_cluster(self, segnum, template_norm, window):
+    def _set_reduced_rate(self, factor):
+        """ Select the reduced rate workspace for the given downsample factor,
+        creating it if needed.
+        """
+        if factor not in self._reduced:
+            N_red = self.tlen // factor
+            kmin_red, _ = get_cutoff_indices(self.flow, self.fhigh,
+                                             self.delta_f, N_red)
+            if self.kmax_full < N_red:
+                kmax_red = self.kmax_full
+            else:
+                kmax_red = N_red - 1
+            snr_mem = zeros(N_red, dtype=self.dtype)
+            self._reduced[factor] = (kmin_red, kmax_red, snr_mem)
+
+        self.kmin_red, self.kmax_red, self.snr_mem = self._reduced[factor]
+        self.corr_mem = Array(self.corr_mem_full[0:len(self.snr_mem)],
+                              copy=False)
+        self.downsample_factor = factor
+
+    def choose_downsample_factor(self, htilde, psd):
+        """ Choose the factor by which to reduce the sample rate of the
+        heirarchical filter for a template.
+
+        The largest power of two factor, no larger than the maximum given at
+        construction, is chosen for which the reduced rate filter retains at
+        least `adaptive_fraction` of the template's sigmasq. The template's
+        end frequency is used to avoid calculating the cumulative sigmasq
+        when the whole template lies below the reduced Nyquist frequency.
+
+        Parameters
+        ----------
+        htilde : FrequencySeries
+            The template, as generated by waveform.FilterBank.
+        psd : FrequencySeries
+            The PSD to weight the template by.
+
+        Returns
+        -------
+        factor : int
+            The downsample factor to use.
+        fraction : float
+            The fraction of sigmasq retained at the reduced rate.
+        """
+        if not hasattr(htilde, '_downsample'):
+            htilde._downsample = {}
+        key = id(psd)
+        if key in htilde._downsample:
+            return htilde._downsample[key]
+
+        end_idx = getattr(htilde, 'end_idx', self.kmax_full)
+        if end_idx is None:
+            end_idx = self.kmax_full
+        cumulative = None
+        factor = 2 ** int(numpy.log2(self.max_downsample_factor))
+        while True:
+            kmax_red = min(self.tlen // factor - 1, self.kmax_full)
+            if factor == 1 or end_idx <= kmax_red:
+                fraction = 1.0
+            else:
+                if cumulative is None:
+                    cumulative = sigmasq_series(htilde, psd, self.flow,
+                                                self.fhigh).numpy()
+                    total = cumulative.max()
+                fraction = cumulative[kmax_red - 1] / total if total else 1.0
+            if factor == 1 or fraction >= self.adaptive_fraction:
+                break
+            factor //= 2
+
+        htilde._downsample[key] = (factor, fraction)
+        return factor, fraction
+
+    def heirarchical_matched_filter_and_cluster(self, segnum, template_norm,
+                                                window, epoch=None):
         """ Returns the complex snr timeseries, normalization of the complex snr,
         the correlation vector frequency series, the list of indices of the
         triggers, and the snr values at the trigger locations. Returns empty
@@ -402,6 +485,74 @@ class MatchedFilterControl(object):
         snrv : Array
             The snr values at the trigger locations.
         """
+        return self._heirarchical_filter(segnum, template_norm, window,
+                                         self.upsample_threshold)
+
+    def adaptive_heirarchical_matched_filter_and_cluster(self, segnum,
+                                                         template_norm,
+                                                         window, epoch=None,
+                                                         htilde=None):
+        """ Returns the complex snr timeseries, normalization of the complex snr,
+        the correlation vector frequency series, the list of indices of the
+        triggers, and the snr values at the trigger locations. Returns empty
+        lists for these for points that are not above the threshold.
+
+        As `heirarchical_matched_filter_and_cluster`, but the reduced sample
+        rate is chosen for the current template with
+        `choose_downsample_factor`. The reduced rate threshold is lowered by
+        the fraction of the SNR which is lost by filtering at that rate.
+
+        Parameters
+        ----------
+        segnum : int
+            Index into the list of segments at MatchedFilterControl construction
+        template_norm : float
+            The htilde, template normalization factor.
+        window : int
+            Size of the window over which to cluster triggers, in samples
+        htilde : FrequencySeries
+            The template being filtered, as generated by waveform.FilterBank.
+
+        Returns
+        -------
+        snr : TimeSeries
+            A time series containing the complex snr at the reduced sample rate.
+        norm : float
+            The normalization of the complex snr.
+        corrrelation: FrequencySeries
+            A frequency series containing the correlation vector.
+        idx : Array
+            List of indices of the triggers.
+        snrv : Array
+            The snr values at the trigger locations.
+        """
+        if htilde is None:
+            raise ValueError("The template must be given to choose the "
+                             "downsample factor")
+        stilde = self.segments[segnum]
+        factor, fraction = self.choose_downsample_factor(htilde, stilde.psd)
+        if factor not in self.downsample_counts:
+            self.downsample_counts[factor] = 0
+        self.downsample_counts[factor] += 1
+
+        # Estimate the saving in the inverse FFT by the usual N log N scaling
+        N_red = self.tlen // factor
+        speedup = (self.tlen * numpy.log2(self.tlen)) / \
+                  (N_red * numpy.log2(max(N_red, 2)))
+        logging.info("Filtering at 1/%s of the full rate, retaining %.4f of "
+                     "sigmasq, estimated FFT speedup %.1f", factor, fraction,
+                     speedup)
+
+        self._set_reduced_rate(factor)
+        return self._heirarchical_filter(segnum, template_norm, window,
+                                         self.upsample_threshold * fraction ** 0.5)
+
+    def _heirarchical_filter(self, segnum, template_norm, window,
+                             upsample_threshold):
+        """ Filter at the reduced sample rate currently selected, and then
+        calculate the full rate SNR around the points above
+        upsample_threshold times the SNR threshold.
+        """
         from pycbc.fft.fftw_pruned import pruned_c2cifft, fft_transpose
         htilde = self.htilde
         stilde = self.segments[segnum]
@@ -411,27 +562,32 @@ class MatchedFilterControl(object):
         correlate(htilde[self.kmin_red:self.kmax_red],
                   stilde[self.kmin_red:self.kmax_red],
                   self.corr_mem[self.kmin_red:self.kmax_red])
+        # Do not transform any of the full rate correlation which may have
+        # been left above the reduced rate band by an earlier template
+        self.corr_mem[self.kmax_red:len(self.corr_mem)].clear()
 
         ifft(self.corr_mem, self.snr_mem)
 
         if not hasattr(stilde, 'red_analyze'):
-            stilde.red_analyze = \
-                             slice(stilde.analyze.start/self.downsample_factor,
-                                   stilde.analyze.stop/self.downsample_factor)
-
-
-        idx_red, snrv_red = events.threshold(self.snr_mem[stilde.red_analyze],
-                                self.snr_threshold / norm * self.upsample_threshold)
+            stilde.red_analyze = {}
+        if self.downsample_factor not in stilde.red_analyze:
+            stilde.red_analyze[self.downsample_factor] = \
+                             slice(stilde.analyze.start // self.downsample_factor,
+                                   stilde.analyze.stop // self.downsample_factor)
+        red_analyze = stilde.red_analyze[self.downsample_factor]
+
+        idx_red, snrv_red = events.threshold(self.snr_mem[red_analyze],
+                                self.snr_threshold / norm * upsample_threshold)
         if len(idx_red) == 0:
             return [], None, [], [], []
 
-        idx_red, _ = events.cluster_reduce(idx_red, snrv_red, window / self.downsample_factor)
+        idx_red, _ = events.cluster_reduce(idx_red, snrv_red, window // self.downsample_factor)
         logging.info("%s points above threshold at reduced resolution"\
                       %(str(len(idx_red)),))
 
         # The fancy upsampling is here
         if self.upsample_method=='pruned_fft':
-            idx = (idx_red + stilde.analyze.start/self.downsample_factor)\
+            idx = (idx_red + stilde.analyze.start // self.downsample_factor)\
                    * self.downsample_factor
 
             idx = smear(idx, self.downsample_factor)
@@ -469,6 +625,189 @@ class MatchedFilterControl(object):
             raise ValueError("Invalid upsample method")
 
 
+class BatchMatchedFilterControl(object):
+    def __init__(self, low_frequency_cutoff, high_frequency_cutoff,
+                 snr_threshold, tlen, delta_f, dtype, segment_list,
+                 batch_size, use_cluster, cluster_function='symmetric'):
+        """ Create a matched filter engine which filters a batch of templates
+        of equal length together. The templates are correlated against a data
+        segment with a single batched correlation and inverse FFT, and the
+        resulting SNR time series are then thresholded and clustered row by
+        row.
+
+        Parameters
+        ----------
+        low_frequency_cutoff : {None, float}, optional
+            The frequency to begin the filter calculation. If None, begin at the
+            first frequency after DC.
+        high_frequency_cutoff : {None, float}, optional
+            The frequency to stop the filter calculation. If None, continue to the
+            the nyquist frequency.
+        snr_threshold : float
+            The minimum snr to return when filtering
+        tlen : int
+            The length of each SNR time series.
+        delta_f : float
+            The frequency resolution of the data segments.
+        dtype : numpy.dtype
+            The complex dtype of the templates and data.
+        segment_list : list
+            List of FrequencySeries that are the Fourier-transformed data segments
+        batch_size : int
+            The maximum number of templates to filter together.
+        use_cluster : boolean
+            If true, cluster triggers above threshold using a window; otherwise,
+            only apply a threshold.
+        cluster_function : {symmetric, str}, optional
+            Which method is used to cluster triggers over time. If 'findchirp', a
+            sliding forward window; if 'symmetric', each window's peak is compared
+            to the windows before and after it, and only kept as a trigger if larger
+            than both.
+        """
+        self.tlen = int(tlen)
+        self.delta_f = delta_f
+        self.delta_t = 1.0 / (self.delta_f * self.tlen)
+        self.dtype = dtype
+        self.snr_threshold = snr_threshold
+        self.flow = low_frequency_cutoff
+        self.fhigh = high_frequency_cutoff
+        self.batch_size = int(batch_size)
+        if cluster_function not in ['symmetric', 'findchirp']:
+            raise ValueError("MatchedFilter: 'cluster_function' must be either 'symmetric' or 'findchirp'")
+        self.use_cluster = use_cluster
+        self.cluster_function = cluster_function
+        self.segments = segment_list
+        self.kmin, self.kmax = get_cutoff_indices(self.flow, self.fhigh,
+                                                  self.delta_f, self.tlen)
+
+        size = self.tlen * self.batch_size
+        self.template_mem = zeros(size, dtype=self.dtype)
+        self.corr_mem = zeros(size, dtype=self.dtype)
+        self.snr_mem = zeros(size, dtype=self.dtype)
+
+        # Views of the workspace for each template in the batch. The
+        # template rows are given as output memory to waveform.FilterBank
+        rows = [slice(i * self.tlen, (i + 1) * self.tlen)
+                for i in range(self.batch_size)]
+        self.template_output = [self.template_mem[r] for r in rows]
+        self.corr_rows = [self.corr_mem[r] for r in rows]
+        self.snr_rows = [self.snr_mem[r] for r in rows]
+
+        corr_slice = slice(self.kmin, self.kmax)
+        self.correlator = BatchCorrelator(
+            [t[corr_slice] for t in self.template_output],
+            [c[corr_slice] for c in self.corr_rows],
+            self.kmax - self.kmin)
+        self.ifft = IFFT(self.corr_mem, self.snr_mem,
+                         nbatch=self.batch_size, size=self.tlen)
+
+        self.threshold_and_clusterers = {}
+        self.num_templates = 0
+
+    def set_templates(self, num_templates):
+        """ Set the number of rows of the template workspace which hold
+        templates to filter. The remaining rows are still transformed, but
+        are not thresholded.
+
+        Parameters
+        ----------
+        num_templates : int
+            The number of templates generated into `template_output`.
+        """
+        if num_templates > self.batch_size:
+            raise ValueError("Cannot filter more than %s templates in a "
+                             "batch" % self.batch_size)
+        self.num_templates = num_templates
+
+    def _threshold_and_cluster(self, row, segnum, threshold, window):
+        analyze = self.segments[segnum].analyze
+        snr = self.snr_rows[row]
+        if self.use_cluster and self.cluster_function == 'symmetric':
+            key = (row, segnum)
+            if key not in self.threshold_and_clusterers:
+                self.threshold_and_clusterers[key] = \
+                    events.ThresholdCluster(snr[analyze])
+            snrv, idx = self.threshold_and_clusterers[key]\
+                            .threshold_and_cluster(threshold, window)
+        elif self.use_cluster:
+            # Clustered later together with the other templates. The
+            # threshold output is reused between calls so must be copied.
+            idx, snrv = events.threshold(snr[analyze], threshold)
+            idx, snrv = idx.copy(), snrv.copy()
+        else:
+            idx, snrv = events.threshold_only(snr[analyze], threshold)
+        return idx, snrv
+
+    def matched_filter_and_cluster(self, segnum, template_norms, windows,
+                                   epoch=None, rows=None):
+        """ Filter the current batch of templates against a single segment.
+
+        Parameters
+        ----------
+        segnum : int
+            Index into the list of segments at construction against which
+            to filter.
+        template_norms : list of floats
+            The htilde, template normalization factor for each template in
+            the batch.
+        windows : list of ints
+            Size of the window over which to cluster triggers, in samples,
+            for each template in the batch.
+        epoch : {None, LIGOTimeGPS}, optional
+            The epoch of the returned SNR time series.
+        rows : {None, list of ints}, optional
+            The templates in the batch to threshold. If None, all templates
+            in the batch are used.
+
+        Returns
+        -------
+        results : list of tuples
+            For each template in the batch, the tuple (snr, norm, corr, idx,
+            snrv) as returned by `MatchedFilterControl`. Empty lists are
+            given for templates with no points above threshold, or which
+            are not included in rows.
+        """
+        self.correlator.execute(self.segments[segnum][self.kmin:self.kmax])
+        self.ifft.execute()
+
+        if rows is None:
+            rows = range(self.num_templates)
+
+        norms = {}
+        found = {}
+        for row in rows:
+            norms[row] = (4.0 * self.delta_f) / sqrt(template_norms[row])
+            found[row] = self._threshold_and_cluster(
+                row, segnum, self.snr_threshold / norms[row], windows[row])
+
+        # The FindChirp clustering of every template is done in one pass
+        if self.use_cluster and self.cluster_function != 'symmetric':
+            crows = [row for row in rows if len(found[row][0])]
+            idxs, snrvs = events.cluster_reduce_segmented(
+                [found[row][0] for row in crows],
+                [found[row][1] for row in crows],
+                [windows[row] for row in crows])
+            for row, idx, snrv in zip(crows, idxs, snrvs):
+                found[row] = (idx, snrv)
+
+        results = [([], [], [], [], [])] * self.num_templates
+        for row in rows:
+            norm = norms[row]
+            idx, snrv = found[row]
+            if len(idx) == 0:
+                continue
+
+            logging.info("%s points above threshold for template %s of "
+                         "batch", len(idx), row)
+
+            snr = TimeSeries(self.snr_rows[row], epoch=epoch,
+                             delta_t=self.delta_t, copy=False)
+            corr = FrequencySeries(self.corr_rows[row], delta_f=self.delta_f,
+                                   copy=False)
+            results[row] = (snr, norm, corr, idx, snrv)
+        return results
+
+
 def compute_max_snr_over_sky_loc_stat(hplus, hcross, hphccorr,
                                                       hpnorm=None, hcnorm=None,
                                                       out=None, thresh=0,
@@ -1903,7 +2242,8 @@ def compute_followup_snr_series(data_reader, htilde, trig_time,
 __all__ = ['match', 'matched_filter', 'sigmasq', 'sigma', 'get_cutoff_indices',
            'sigmasq_series', 'make_frequency_series', 'overlap',
            'overlap_cplx', 'matched_filter_core', 'correlate',
-           'MatchedFilterControl', 'LiveBatchMatchedFilter',
+           'MatchedFilterControl', 'BatchMatchedFilterControl',
+           'LiveBatchMatchedFilter',
            'MatchedFilterSkyMaxControl', 'MatchedFilterSkyMaxControlNoPhase',
            'compute_max_snr_over_sky_loc_stat_no_phase',
            'compute_max_snr_over_sky_loc_stat',
@@ -104,6 +104,14 @@ def fir_zero_filter(coeff, timeseries):
     data[len(coeff)//2:len(data)-len(coeff)//2] = series[(len(coeff) // 2) * 2:]
     return data
 
+def _ldas_coefficients(factor):
+    """Return the lowpass FIR coefficients used to decimate by factor"""
+    numtaps = factor * 20 + 1
+
+    # The kaiser window has been testing using the LDAS implementation
+    # and is in the same configuration as used in the original lalinspiral
+    return scipy.signal.firwin(numtaps, 1.0 / factor, window=('kaiser', 5))
+
 def resample_to_delta_t(timeseries, delta_t, method='butterworth'):
     """Resmple the time_series to delta_t
 
@@ -152,12 +160,7 @@ def resample_to_delta_t(timeseries, delta_t, method='butterworth'):
 
     elif method == 'ldas':
         factor = int(delta_t / timeseries.delta_t)
-        numtaps = factor * 20 + 1
-
-        # The kaiser window has been testing using the LDAS implementation
-        # and is in the same configuration as used in the original lalinspiral
-        filter_coefficients = scipy.signal.firwin(numtaps, 1.0 / factor,
-                                                  window=('kaiser', 5))
+        filter_coefficients = _ldas_coefficients(factor)
 
         # apply the filter and decimate
         data = fir_zero_filter(filter_coefficients, timeseries)[::factor]
@@ -244,11 +247,126 @@ def highpass_fir(timeseries, frequency, order, beta=5.0):
     beta: float
         Beta parameter of the kaiser window that sets the side lobe attenuation.
     """
-    k = frequency / float((int(1.0 / timeseries.delta_t) / 2))
-    coeff = scipy.signal.firwin(order * 2 + 1, k, window=('kaiser', beta), pass_zero=False)
+    coeff = _highpass_fir_coefficients(timeseries.delta_t, frequency, order,
+                                       beta=beta)
     data = fir_zero_filter(coeff, timeseries)
     return TimeSeries(data, epoch=timeseries.start_time, delta_t=timeseries.delta_t)
 
+def _highpass_fir_coefficients(delta_t, frequency, order, beta=5.0):
+    """Return the FIR coefficients used by `highpass_fir`"""
+    k = frequency / float((int(1.0 / delta_t) / 2))
+    return scipy.signal.firwin(order * 2 + 1, k, window=('kaiser', beta),
+                               pass_zero=False)
+
+class StreamingFIRFilter(object):
+    """Apply a zero phase FIR filter to a stream of data given in blocks.
+
+    The last samples of each block are kept as the history of the filter,
+    so every output sample is computed once, from the full extent of the
+    filter, and the blocks are not padded with data that was already
+    filtered. The output sample at an input sample is returned once the
+    input extends half the filter length past it. The data before the
+    first block is taken to be zero.
+
+    Without decimation the filter is applied by overlap-save FFT
+    convolution. With decimation only the kept output samples are
+    computed, directly from the input, which is a polyphase filter.
+    """
+    def __init__(self, coefficients, factor=1):
+        """
+        Parameters
+        ----------
+        coefficients: numpy.ndarray
+            FIR coefficients. Should be of odd length and symmetric.
+        factor: {1, int}, optional
+            Decimation factor. The output samples are at the input samples
+            that are multiples of the factor from the start of the stream.
+        """
+        self.coefficients = numpy.asarray(coefficients, dtype=numpy.float64)
+        if len(self.coefficients) % 2 != 1:
+            raise ValueError('The number of FIR coefficients must be odd')
+        if type(factor) is not int or factor <= 0:
+            raise ValueError('The decimation factor must be a positive integer')
+        self.factor = factor
+        self.half = len(self.coefficients) // 2
+        self.history = numpy.zeros(len(self.coefficients) - 1)
+        self.num_input = 0
+        self.num_output = 0
+
+    def process(self, data):
+        """Filter the next block of the stream
+
+        Parameters
+        ----------
+        data: numpy.ndarray
+            The next samples of the input.
+
+        Returns
+        -------
+        output: numpy.ndarray
+            The output samples that the input now extends far enough to
+            compute, continuing from those previously returned.
+        """
+        data = numpy.asarray(data)
+        ntaps = len(self.coefficients)
+        x = numpy.concatenate([self.history, data])
+        first_input = self.num_input - len(self.history)
+        self.num_input += len(data)
+        self.history = x[len(x) - ntaps + 1:]
+
+        # The output at input sample n needs the input up to n + half, and
+        # is found at position n - first_input - half of x as a window
+        first = self.num_output * self.factor - first_input - self.half
+        last = len(x) - ntaps
+        if last < first:
+            return numpy.zeros(0, dtype=data.dtype)
+        count = (last - first) // self.factor + 1
+        self.num_output += count
+
+        if self.factor == 1:
+            output = scipy.signal.fftconvolve(x[first:], self.coefficients,
+                                              mode='valid')
+        else:
+            stride = x.strides[0]
+            windows = numpy.lib.stride_tricks.as_strided(
+                x[first:], shape=(count, ntaps),
+                strides=(stride * self.factor, stride))
+            output = numpy.dot(windows, self.coefficients[::-1])
+        return output.astype(data.dtype)
+
+def streaming_highpass_fir(delta_t, frequency, order, beta=5.0):
+    """Return a `StreamingFIRFilter` that applies `highpass_fir`
+
+    Parameters
+    ----------
+    delta_t: float
+        The sample step of the stream.
+    frequency: float
+        The frequency below which is suppressed.
+    order: int
+        Number of samples the output is delayed by.
+    beta: float
+        Beta parameter of the kaiser window that sets the side lobe attenuation.
+    """
+    return StreamingFIRFilter(_highpass_fir_coefficients(delta_t, frequency,
+                                                         order, beta=beta))
+
+def streaming_resampler(delta_t, new_delta_t):
+    """Return a `StreamingFIRFilter` that resamples a stream as
+    `resample_to_delta_t` with the 'ldas' method.
+
+    Parameters
+    ----------
+    delta_t: float
+        The sample step of the stream.
+    new_delta_t: float
+        The desired sample step, an integer multiple of delta_t.
+    """
+    factor = int(round(new_delta_t / delta_t))
+    if factor == 1:
+        return StreamingFIRFilter([1.])
+    return StreamingFIRFilter(_ldas_coefficients(factor), factor=factor)
+
 def highpass(timeseries, frequency, filter_order=8, attenuation=0.1):
     """Return a new timeseries that is highpassed.
 
@@ -336,5 +454,6 @@ def interpolate_complex_frequency(series, delta_f, zeros_offset=0, side='right')
 
     return out_series
 
-__all__ = ['resample_to_delta_t', 'highpass', 'interpolate_complex_frequency', 'highpass_fir', 'lowpass_fir', 'notch_fir', 'fir_zero_filter']
+__all__ = ['resample_to_delta_t', 'highpass', 'interpolate_complex_frequency', 'highpass_fir', 'lowpass_fir', 'notch_fir', 'fir_zero_filter',
+           'StreamingFIRFilter', 'streaming_highpass_fir', 'streaming_resampler']
 
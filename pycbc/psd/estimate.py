@@ -54,6 +54,16 @@ def median_bias(n):
         ans += 1.0 / (2*i + 1) - 1.0 / (2*i)
     return ans
 
+def _segment_psd(segment, window, segment_tilde):
+    """Return the periodogram of one segment of data, as used by `welch`"""
+    fft(segment * window, segment_tilde)
+    seg_psd = abs(segment_tilde * segment_tilde.conj()).numpy()
+
+    #halve the DC and Nyquist components to be consistent with TO10095
+    seg_psd[0] /= 2
+    seg_psd[-1] /= 2
+    return seg_psd
+
 def welch(timeseries, seg_len=4096, seg_stride=2048, window='hann',
           avg_method='median', num_segments=None, require_exact_data_fit=False):
     """PSD estimator based on Welch's method.
@@ -155,14 +165,7 @@ def welch(timeseries, seg_len=4096, seg_stride=2048, window='hann',
         segment_end = segment_start + seg_len
         segment = timeseries[segment_start:segment_end]
         assert len(segment) == seg_len
-        fft(segment * w, segment_tilde)
-        seg_psd = abs(segment_tilde * segment_tilde.conj()).numpy()
-
-        #halve the DC and Nyquist components to be consistent with TO10095
-        seg_psd[0] /= 2
-        seg_psd[-1] /= 2
-
-        segment_psds.append(seg_psd)
+        segment_psds.append(_segment_psd(segment, w, segment_tilde))
 
     segment_psds = numpy.array(segment_psds)
 
@@ -184,6 +187,196 @@ def welch(timeseries, seg_len=4096, seg_stride=2048, window='hann',
     return FrequencySeries(psd, delta_f=delta_f, dtype=timeseries.dtype,
                            epoch=timeseries.start_time)
 
+def _replace_sorted(sorted_values, old, new):
+    """Replace a value in each column of an array sorted along its first
+    axis, keeping the columns sorted.
+
+    Parameters
+    ----------
+    sorted_values : numpy.ndarray
+        Two dimensional array whose columns are sorted in ascending order.
+        It is updated in place.
+    old : numpy.ndarray
+        The value to remove from each column. It must be in the column.
+    new : numpy.ndarray
+        The value to insert in each column.
+    """
+    num, cols = sorted_values.shape
+    old_pos = (sorted_values < old).sum(axis=0)
+    new_pos = (sorted_values < new).sum(axis=0)
+    rows = numpy.arange(num)[:, None]
+
+    # The values between the two positions move one row towards the
+    # position of the removed value
+    up = (rows >= old_pos) & (rows < new_pos - 1)
+    down = (rows > new_pos) & (rows <= old_pos)
+    shifted_up = numpy.roll(sorted_values, -1, axis=0)
+    shifted_down = numpy.roll(sorted_values, 1, axis=0)
+    sorted_values[up] = shifted_up[up]
+    sorted_values[down] = shifted_down[down]
+    new_pos[new_pos > old_pos] -= 1
+    sorted_values[new_pos, numpy.arange(cols)] = new
+
+class IncrementalWelch(object):
+    """PSD estimator based on Welch's method for a stream of data.
+
+    The estimate is the one `welch` would give for the data, but the
+    periodogram of each segment is kept in a ring and reused by the
+    following estimates as long as the data of the segment is unchanged.
+    For median averaging the periodograms are also kept sorted along
+    each frequency, so the median is updated with the new segments only.
+    Segments are identified by the GPS time of their first sample, so the
+    data of consecutive estimates must be sampled on the same grid.
+    """
+    def __init__(self, seg_len=4096, seg_stride=2048, window='hann',
+                 avg_method='median'):
+        """
+        Parameters
+        ----------
+        seg_len : int
+            Segment length in samples.
+        seg_stride : int
+            Separation between consecutive segments, in samples.
+        window : {'hann', numpy.ndarray}
+            Function used to window segments before Fourier transforming,
+            or a `numpy.ndarray` that specifies the window.
+        avg_method : {'median', 'mean', 'median-mean'}
+            Method used for averaging individual segment PSDs.
+        """
+        window_map = {
+            'hann': numpy.hanning
+        }
+        if isinstance(window, numpy.ndarray) and window.size != seg_len:
+            raise ValueError('Invalid window: incorrect window length')
+        if not isinstance(window, numpy.ndarray) and window not in window_map:
+            raise ValueError('Invalid window: unknown window {!r}'.format(window))
+        if avg_method not in ('mean', 'median', 'median-mean'):
+            raise ValueError('Invalid averaging method')
+        if type(seg_len) is not int or type(seg_stride) is not int \
+            or seg_len <= 0 or seg_stride <= 0:
+            raise ValueError('Segment length and stride must be positive integers')
+
+        if not isinstance(window, numpy.ndarray):
+            window = window_map[window](seg_len)
+        self.window = window
+        self.seg_len = seg_len
+        self.seg_stride = seg_stride
+        self.avg_method = avg_method
+        self.num_computed = 0
+        self._reset(0, None, None)
+
+    def _reset(self, num_segments, dtype, delta_t):
+        self.num_segments = num_segments
+        self.dtype = dtype
+        self.delta_t = delta_t
+        flen = self.seg_len // 2 + 1
+        # The periodograms, the first sample of their segment and whether
+        # the data of the segment may have changed since
+        self.ring = numpy.zeros((num_segments, flen), dtype=dtype)
+        self.start = numpy.zeros(num_segments, dtype=numpy.int64)
+        self.valid = numpy.zeros(num_segments, dtype=bool)
+        self.sorted = None
+        if dtype is not None:
+            self.w = Array(self.window.astype(dtype))
+            if dtype == numpy.float32:
+                fs_dtype = numpy.complex64
+            else:
+                fs_dtype = numpy.complex128
+            self.segment_tilde = FrequencySeries(
+                numpy.zeros(flen), delta_f=1. / delta_t / self.seg_len,
+                dtype=fs_dtype)
+
+    def invalidate(self, time=None):
+        """Forget the segments whose data may have changed
+
+        Parameters
+        ----------
+        time : {None, float}
+            The GPS time from which the data has changed. All the segments
+            are forgotten if not given.
+        """
+        if time is None or self.delta_t is None:
+            self.valid[:] = False
+            return
+        first = int(numpy.floor(float(time) / self.delta_t))
+        self.valid[self.start + self.seg_len > first] = False
+
+    def estimate(self, timeseries):
+        """Return the Welch PSD estimate of the data, see `welch`
+
+        Parameters
+        ----------
+        timeseries : TimeSeries
+            Time series for which the PSD is to be estimated.
+
+        Returns
+        -------
+        psd : FrequencySeries
+            Frequency series containing the estimated PSD.
+        """
+        num_samples = len(timeseries)
+        num_segments = int(num_samples // self.seg_stride)
+        if (num_segments - 1) * self.seg_stride + self.seg_len > num_samples:
+            num_segments -= 1
+        if num_segments <= 0:
+            raise ValueError('Incorrect choice of segmentation parameters')
+
+        # Use the central part of the data, as welch does
+        data_len = (num_segments - 1) * self.seg_stride + self.seg_len
+        diff = num_samples - data_len
+        offset = diff // 2 + diff % 2
+        timeseries = timeseries[offset:offset + data_len]
+
+        if num_segments != self.num_segments \
+                or timeseries.dtype != self.dtype \
+                or timeseries.delta_t != self.delta_t:
+            self._reset(num_segments, timeseries.dtype, timeseries.delta_t)
+
+        # Place each segment in the ring by its position in the stream
+        first = int(numpy.round(float(timeseries.start_time) / self.delta_t))
+        start = first + numpy.arange(num_segments) * self.seg_stride
+        slot = (start // self.seg_stride) % num_segments
+        stale = numpy.flatnonzero(~self.valid[slot] |
+                                  (self.start[slot] != start))
+        old = self.ring[slot[stale]].copy()
+        for i in stale:
+            segment = timeseries[i * self.seg_stride:
+                                 i * self.seg_stride + self.seg_len]
+            self.ring[slot[i]] = _segment_psd(segment, self.w,
+                                              self.segment_tilde)
+            self.start[slot[i]] = start[i]
+            self.valid[slot[i]] = True
+        self.num_computed += len(stale)
+
+        segment_psds = self.ring[slot]
+        if self.avg_method == 'mean':
+            psd = numpy.mean(segment_psds, axis=0)
+        elif self.avg_method == 'median':
+            if self.sorted is not None and len(stale) < num_segments // 2:
+                for row, i in zip(old, stale):
+                    _replace_sorted(self.sorted, row, self.ring[slot[i]])
+            else:
+                self.sorted = numpy.sort(segment_psds, axis=0)
+            mid = num_segments // 2
+            if num_segments % 2:
+                psd = self.sorted[mid].copy()
+            else:
+                psd = (self.sorted[mid - 1] + self.sorted[mid]) / 2
+            psd /= median_bias(num_segments)
+        elif self.avg_method == 'median-mean':
+            odd_median = numpy.median(segment_psds[::2], axis=0) / \
+                median_bias(len(segment_psds[::2]))
+            even_median = numpy.median(segment_psds[1::2], axis=0) / \
+                median_bias(len(segment_psds[1::2]))
+            psd = (odd_median + even_median) / 2
+
+        psd *= 2 * self.segment_tilde.delta_f * self.seg_len / \
+            (self.w * self.w).sum()
+
+        return FrequencySeries(psd, delta_f=self.segment_tilde.delta_f,
+                               dtype=timeseries.dtype,
+                               epoch=timeseries.start_time)
+
 def inverse_spectrum_truncation(psd, max_filter_len, low_frequency_cutoff=None, trunc_method=None):
     """Modify a PSD such that the impulse response associated with its inverse
     square root is no longer than `max_filter_len` time samples. In practice
@@ -313,3 +506,86 @@ def bandlimited_interpolate(series, delta_f):
 
     return interpolated_series
 
+
+class PSDCache(object):
+    """Keep the interpolated and truncated forms of a PSD.
+
+    The derived PSDs are keyed by the version of the PSD they come from,
+    their delta_f and the length of the inverse spectrum truncation. When
+    the PSD is updated, the forms requested for the previous PSD are
+    recomputed together, so that filtering the next block does not wait
+    on them.
+
+    Parameters
+    ----------
+    max_filter_len : int
+        The default length of the time-domain inverse PSD.
+    low_frequency_cutoff : {None, float}
+        The low frequency cutoff passed to `inverse_spectrum_truncation`.
+    trunc_method : {None, 'hann'}
+        The truncation window passed to `inverse_spectrum_truncation`.
+    """
+    def __init__(self, max_filter_len, low_frequency_cutoff=None,
+                 trunc_method=None):
+        self.max_filter_len = max_filter_len
+        self.low_frequency_cutoff = low_frequency_cutoff
+        self.trunc_method = trunc_method
+        self.psd = None
+        self.version = 0
+        self.cache = {}
+        self.requested = set()
+
+    def clear(self):
+        """Forget the current PSD and its derived forms."""
+        self.psd = None
+        self.version += 1
+        self.cache = {}
+
+    def update(self, psd, precompute=True):
+        """Replace the PSD the derived forms are computed from.
+
+        Parameters
+        ----------
+        psd : FrequencySeries
+            The new PSD.
+        precompute : {True, boolean}
+            Compute the forms requested for the previous PSD now rather
+            than when they are next needed.
+        """
+        self.clear()
+        self.psd = psd
+        if precompute:
+            for delta_f, max_filter_len in sorted(self.requested):
+                self.get(delta_f, max_filter_len)
+
+    def get(self, delta_f, max_filter_len=None):
+        """Return the PSD interpolated to `delta_f` and truncated.
+
+        Parameters
+        ----------
+        delta_f : float
+            The frequency step of the returned PSD.
+        max_filter_len : {None, int}
+            The length of the time-domain inverse PSD. By default the
+            length given when creating the cache is used.
+
+        Returns
+        -------
+        psd : FrequencySeries
+            The derived PSD, shared between calls until the PSD changes.
+        """
+        if self.psd is None:
+            raise ValueError('No PSD to derive from, call update first')
+        if max_filter_len is None:
+            max_filter_len = self.max_filter_len
+
+        key = (self.version, delta_f, max_filter_len)
+        if key not in self.cache:
+            psd = interpolate(self.psd, delta_f)
+            psd = inverse_spectrum_truncation(psd, max_filter_len,
+                    low_frequency_cutoff=self.low_frequency_cutoff,
+                    trunc_method=self.trunc_method)
+            psd._delta_f = delta_f
+            self.cache[key] = psd
+            self.requested.add((delta_f, max_filter_len))
+        return self.cache[key]
@@ -10,6 +10,27 @@ from pycbc.types import TimeSeries
 from pycbc.filter import resample_to_delta_t
 
 
+def _replace_outliers(short_ms):
+    """ Replace in place every element of short_ms greater than two times
+    the average of its closest neighbours by that average. The first and
+    last elements are left as they are.
+    """
+    # Define an array of averages that is used to substitute outliers
+    ave = 0.5 * (short_ms[2:] + short_ms[:-2])
+    outliers = short_ms[1:-1] > (2. * ave)
+    short_ms[1:-1][outliers] = ave[outliers]
+
+
+def _window_means(values, starts, ends):
+    """ Return the means of values between each pair of start and end
+    indices, from the cumulative sum of the values.
+    """
+    cumsum = numpy.zeros(len(values) + 1, dtype=numpy.float64)
+    numpy.cumsum(values, out=cumsum[1:])
+    means = (cumsum[ends] - cumsum[starts]) / (ends - starts)
+    return means.astype(values.dtype)
+
+
 def mean_square(data, delta_t, srate, short_stride, stride):
     """ Calculate mean square of given time series once per stride
 
@@ -36,7 +57,7 @@ def mean_square(data, delta_t, srate, short_stride, stride):
 
     Returns
     -------
-    m_s: List
+    m_s: numpy.ndarray
         Mean square of given time series
     """
 
@@ -44,19 +65,87 @@ def mean_square(data, delta_t, srate, short_stride, stride):
     # outliers
     short_ms = numpy.mean(data.reshape(-1, int(srate * short_stride)) ** 2,
                           axis=1)
-    # Define an array of averages that is used to substitute outliers
-    ave = 0.5 * (short_ms[2:] + short_ms[:-2])
-    outliers = short_ms[1:-1] > (2. * ave)
-    short_ms[1:-1][outliers] = ave[outliers]
+    _replace_outliers(short_ms)
 
     # Calculate mean square of data every step within a window equal to
     # stride seconds
-    m_s = []
     inv_time = int(1. / short_stride)
-    for index in range(int(delta_t - stride + 1)):
-        m_s.append(numpy.mean(short_ms[inv_time * index:inv_time *
-                                       int(index+stride)]))
-    return m_s
+    index = numpy.arange(int(delta_t - stride + 1))
+    starts = inv_time * index
+    ends = numpy.minimum(inv_time * (index + int(stride)), len(short_ms))
+    return _window_means(short_ms, starts, ends)
+
+
+class StreamingMeanSquare(object):
+    """ Calculate the mean square of a time series given in blocks, as
+    mean_square does for the whole time series.
+
+    The data that does not fill a short stride and the short stride mean
+    squares that later windows need are kept between blocks, so each
+    block is only read once. A window is returned once the short stride
+    after it is known, as its last element may otherwise be an outlier.
+    The first element of the stream is never replaced, as in mean_square.
+    """
+    def __init__(self, srate, short_stride, stride):
+        """
+        Parameters
+        ----------
+        srate : int
+            Sample rate of the data
+        short_stride : float
+            Stride duration for outlier removal
+        stride : float
+            Stride duration
+        """
+        self.short_len = int(srate * short_stride)
+        self.inv_time = int(1. / short_stride)
+        self.window = self.inv_time * int(stride)
+        self.samples = numpy.zeros(0)
+        self.short_ms = numpy.zeros(0)
+        self.short_start = 0
+        self.num_output = 0
+
+    def update(self, data):
+        """ Calculate the mean square of the next block of the stream
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The next samples of the time series
+
+        Returns
+        -------
+        m_s: numpy.ndarray
+            The mean square once per second that the stream now extends
+            far enough to compute, continuing from those previously
+            returned.
+        """
+        data = numpy.concatenate([self.samples, data])
+        num = len(data) // self.short_len * self.short_len
+        self.samples = data[num:]
+        short_ms = numpy.mean(data[:num].reshape(-1, self.short_len) ** 2,
+                              axis=1)
+        self.short_ms = numpy.concatenate([self.short_ms, short_ms])
+
+        # The outliers are found from the mean squares before replacement,
+        # so only a copy of them is smoothed
+        smoothed = self.short_ms.copy()
+        _replace_outliers(smoothed)
+
+        # A window needs the short stride after its end to be known
+        last = self.short_start + len(self.short_ms) - 1
+        num_output = max((last - self.window) // self.inv_time + 1,
+                         self.num_output)
+        index = numpy.arange(self.num_output, num_output)
+        starts = self.inv_time * index - self.short_start
+        m_s = _window_means(smoothed, starts, starts + self.window)
+        self.num_output = num_output
+
+        # Keep the neighbour before the next window for outlier removal
+        keep = max(self.inv_time * self.num_output - 1, 0)
+        self.short_ms = self.short_ms[keep - self.short_start:]
+        self.short_start = keep
+        return m_s
 
 
 def calc_filt_psd_variation(strain, segment, short_segment, psd_long_segment,
@@ -164,7 +253,7 @@ def calc_filt_psd_variation(strain, segment, short_segment, psd_long_segment,
         # already has a variance of one.
         fweight = freqs ** (-7./6.) * filt / numpy.sqrt(plong)
         fweight[0] = 0.
-        norm = (sum(abs(fweight) ** 2) / (len(fweight) - 1.)) ** -0.5
+        norm = (numpy.sum(abs(fweight) ** 2) / (len(fweight) - 1.)) ** -0.5
         fweight = norm * fweight
         fwhiten = numpy.sqrt(2. / srate) / numpy.sqrt(plong)
         fwhiten[0] = 0.
@@ -1208,6 +1208,39 @@ class StrainSegments(object):
             required_opts_multi_ifo(opt, parser, ifo, cls.required_opts_list)
 
 
+class _StrainStore(object):
+    """Storage for a fixed length time series that is advanced in blocks.
+
+    The series is a contiguous view of an array twice its length. Advancing
+    moves the view along the array, and the data is copied back to the
+    start of the array only when the view reaches its end, so on average
+    advancing costs the length of the block rather than of the series.
+    """
+    def __init__(self, length, delta_t, epoch, dtype=numpy.float32):
+        self.store = zeros(2 * length, dtype=dtype)
+        self.offset = 0
+        self.series = TimeSeries(self.store[0:length], delta_t=delta_t,
+                                 epoch=epoch, copy=False)
+
+    def advance(self, num):
+        """Drop the first num samples of the series and return it, with num
+        samples at the end to be filled in. Unlike `TimeSeries.roll` the
+        samples at the end are not the dropped ones. The epoch is kept.
+        """
+        series = self.series
+        length = len(series)
+        start = self.offset + num
+        if start + length > len(self.store):
+            keep = max(length - num, 0)
+            self.store[0:keep] = self.store[start:start + keep]
+            start = 0
+        self.offset = start
+        self.series = TimeSeries(self.store[start:start + length],
+                                 delta_t=series.delta_t,
+                                 epoch=series.start_time, copy=False)
+        return self.series
+
+
 class StrainBuffer(pycbc.frame.DataBuffer):
     def __init__(self, frame_src, channel_name, start_time,
                  max_buffer=512,
@@ -1372,12 +1405,20 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         self.psd_samples = psd_samples
         self.psd_inverse_length = psd_inverse_length
         self.psd = None
-        self.psds = {}
+
+        # Keeps the interpolated and truncated PSDs between blocks
+        self.psd_cache = pycbc.psd.PSDCache(
+                int(self.sample_rate * self.psd_inverse_length),
+                low_frequency_cutoff=self.low_frequency_cutoff)
+
+        # Keeps the periodograms of the PSD segments between estimates
+        seg_len = int(self.sample_rate * self.psd_segment_length)
+        self.psd_estimator = pycbc.psd.IncrementalWelch(seg_len, seg_len // 2)
 
         strain_len = int(max_buffer * self.sample_rate)
-        self.strain = TimeSeries(zeros(strain_len, dtype=numpy.float32),
-                                 delta_t=1.0/self.sample_rate,
-                                 epoch=start_time-max_buffer)
+        self.strain_store = _StrainStore(strain_len, 1.0/self.sample_rate,
+                                         start_time-max_buffer)
+        self.strain = self.strain_store.series
 
         # Determine the total number of corrupted samples for highpass
         # and PSD over whitening
@@ -1388,6 +1429,14 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         self.factor = int(1.0 / self.raw_buffer.delta_t / self.sample_rate)
         self.corruption = self.highpass_samples // self.factor + resample_corruption
 
+        # The filters keep their state between blocks, so the samples at
+        # the end of the strain that they cannot compute yet are zero
+        self.highpass_stream = pycbc.filter.streaming_highpass_fir(
+                self.raw_buffer.delta_t, self.highpass_frequency,
+                self.highpass_samples, beta=self.beta)
+        self.resample_stream = pycbc.filter.streaming_resampler(
+                self.raw_buffer.delta_t, 1.0 / self.sample_rate)
+
         self.psd_corruption =  self.psd_inverse_length * self.sample_rate
         self.total_corruption = self.corruption + self.psd_corruption
 
@@ -1427,7 +1476,7 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         """ Make the current PSD invalid. A new one will be generated when
         it is next required """
         self.psd = None
-        self.psds = {}
+        self.psd_cache.clear()
 
     def recalculate_psd(self):
         """ Recalculate the psd
@@ -1436,7 +1485,7 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         seg_len = int(self.sample_rate * self.psd_segment_length)
         e = len(self.strain)
         s = e - (self.psd_samples + 1) * seg_len // 2
-        psd = pycbc.psd.welch(self.strain[s:e], seg_len=seg_len, seg_stride=seg_len//2)
+        psd = self.psd_estimator.estimate(self.strain[s:e])
 
         psd.dist = spa_distance(psd, 1.4, 1.4, self.low_frequency_cutoff) * pycbc.DYN_RANGE_FAC
 
@@ -1453,12 +1502,13 @@ class StrainBuffer(pycbc.frame.DataBuffer):
                 logging.info("%s PSD is CRAZY, aborting!!!!, %s-%s",
                              self.detector, self.psd.dist, psd.dist)
                 self.psd = psd
-                self.psds = {}
+                self.psd_cache.update(psd, precompute=False)
                 return False
 
-        # If the new estimate replaces the current one, invalide the ineterpolate PSDs
+        # If the new estimate replaces the current one, recompute the
+        # interpolated PSDs now rather than when filtering the next block
         self.psd = psd
-        self.psds = {}
+        self.psd_cache.update(psd)
         logging.info("Recalculating %s PSD, %s", self.detector, psd.dist)
         return True
 
@@ -1482,24 +1532,12 @@ class StrainBuffer(pycbc.frame.DataBuffer):
             s = int(e - buffer_length * self.sample_rate - self.reduced_pad * 2)
             fseries = make_frequency_series(self.strain[s:e])
 
-            # we haven't calculated a resample psd for this delta_f
-            if delta_f not in self.psds:
-                psdt = pycbc.psd.interpolate(self.psd, fseries.delta_f)
-                psdt = pycbc.psd.inverse_spectrum_truncation(psdt,
-                                       int(self.sample_rate * self.psd_inverse_length),
-                                       low_frequency_cutoff=self.low_frequency_cutoff)
-                psdt._delta_f = fseries.delta_f
+            # the psd may have been set directly rather than recalculated
+            if self.psd_cache.psd is not self.psd:
+                self.psd_cache.update(self.psd)
 
-                psd = pycbc.psd.interpolate(self.psd, delta_f)
-                psd = pycbc.psd.inverse_spectrum_truncation(psd,
-                                       int(self.sample_rate * self.psd_inverse_length),
-                                       low_frequency_cutoff=self.low_frequency_cutoff)
-
-                psd.psdt = psdt
-                self.psds[delta_f] = psd
-
-            psd = self.psds[delta_f]
-            fseries /= psd.psdt
+            psd = self.psd_cache.get(delta_f)
+            fseries /= self.psd_cache.get(fseries.delta_f)
 
             # trim ends of strain
             if self.reduced_pad  != 0:
@@ -1535,6 +1573,31 @@ class StrainBuffer(pycbc.frame.DataBuffer):
             return True
         return False
 
+    @property
+    def strain_delay(self):
+        """The number of samples at the end of the strain that the filters
+        cannot compute yet.
+        """
+        return (self.highpass_stream.num_input // self.factor
+                - self.resample_stream.num_output)
+
+    def _condition_strain(self, raw):
+        """Highpass, scale and resample the next samples of the raw data
+
+        Parameters
+        ----------
+        raw: numpy.ndarray
+            The raw data following that given in the previous call.
+
+        Returns
+        -------
+        strain: numpy.ndarray
+            The conditioned strain up to where it can be computed.
+        """
+        strain = self.highpass_stream.process(raw)
+        strain = (strain * self.dyn_range_fac).astype(numpy.float32)
+        return self.resample_stream.process(strain)
+
     def null_advance_strain(self, blocksize):
         """ Advance and insert zeros
 
@@ -1545,11 +1608,16 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         """
         sample_step = int(blocksize * self.sample_rate)
         csize = sample_step + self.corruption * 2
-        self.strain.roll(-sample_step)
+
+        # Keep the filters in step with the data, which is taken to be zero
+        self._condition_strain(numpy.zeros(sample_step * self.factor))
+        self.strain = self.strain_store.advance(sample_step)
 
         # We should roll this off at some point too...
         self.strain[len(self.strain) - csize + self.corruption:] = 0
         self.strain.start_time += blocksize
+        self.psd_estimator.invalidate(self.strain.start_time +
+            (len(self.strain) - csize + self.corruption) * self.strain.delta_t)
 
         # The next time we need strain will need to be tapered
         self.taper_immediate_strain = True
@@ -1608,39 +1676,30 @@ class StrainBuffer(pycbc.frame.DataBuffer):
         # only condition with the needed raw data so we can continuously add
         # to the existing result
 
-        # Precondition
+        # Precondition only the new data, continuing from the previous block
         sample_step = int(blocksize * self.sample_rate)
-        csize = sample_step + self.corruption * 2
-        start = len(self.raw_buffer) - csize * self.factor
-        strain = self.raw_buffer[start:]
+        start = len(self.raw_buffer) - sample_step * self.factor
+        conditioned = self._condition_strain(self.raw_buffer[start:].numpy())
 
-        strain =  pycbc.filter.highpass_fir(strain, self.highpass_frequency,
-                                       self.highpass_samples,
-                                       beta=self.beta)
-        strain = (strain * self.dyn_range_fac).astype(numpy.float32)
-
-        strain = pycbc.filter.resample_to_delta_t(strain,
-                                           1.0/self.sample_rate, method='ldas')
-
-        # remove corruption at beginning
-        strain = strain[self.corruption:]
+        # Stitch into continuous stream
+        self.strain = self.strain_store.advance(sample_step)
+        self.strain.start_time += blocksize
+        end = len(self.strain) - self.strain_delay
+        self.strain[end - len(conditioned):end] = Array(conditioned, copy=False)
+        self.strain[end:] = 0
+        strain = self.strain[end - len(conditioned):end]
+        self.psd_estimator.invalidate(strain.start_time)
 
         # taper beginning if needed
         if self.taper_immediate_strain:
             logging.info("Tapering start of %s strain block", self.detector)
-            strain = gate_data(
-                    strain, [(strain.start_time, 0., self.autogating_taper)])
+            gate_data(strain, [(strain.start_time, 0., self.autogating_taper)])
             self.taper_immediate_strain = False
 
-        # Stitch into continuous stream
-        self.strain.roll(-sample_step)
-        self.strain[len(self.strain) - csize + self.corruption:] = strain[:]
-        self.strain.start_time += blocksize
-
         # apply gating if needed
         if self.autogating_threshold is not None:
             glitch_times = detect_loud_glitches(
-                    strain[:-self.corruption],
+                    strain,
                     psd_duration=2., psd_stride=1.,
                     threshold=self.autogating_threshold,
                     cluster_window=self.autogating_cluster,
@@ -1653,6 +1712,9 @@ class StrainBuffer(pycbc.frame.DataBuffer):
                         [(gt, self.autogating_width, self.autogating_taper)
                          for gt in glitch_times]
                 self.strain = gate_data(self.strain, self.gate_params)
+                self.psd_estimator.invalidate(min(gt - self.autogating_width
+                                                  - self.autogating_taper
+                                                  for gt in glitch_times))
 
         if self.psd is None and self.wait_duration <=0:
             self.recalculate_psd()
@@ -21,10 +21,11 @@
 #
 # =============================================================================
 #
-import logging, numpy
+import logging, numpy, os, h5py
 from pycbc.types import Array, zeros, real_same_precision_as, TimeSeries
 from pycbc.filter import overlap_cplx, matched_filter_core
-from pycbc.waveform import FilterBank
+from pycbc.filter.matchedfilter import get_cutoff_indices
+from pycbc.waveform import FilterBank, PSDTemplateStore
 from math import sqrt
 
 def segment_snrs(filters, stilde, psd, low_frequency_cutoff):
@@ -83,17 +84,64 @@ def template_overlaps(bank_filters, template, psd, low_frequency_cutoff):
         norm = sqrt(1 / template.sigmasq(psd) / bank_template.sigmasq(psd))
         overlaps.append(overlap * norm)
         if (abs(overlaps[-1]) > 0.99):
-            errMsg = "Overlap > 0.99 between bank template and filter. "
-            errMsg += "This bank template will not be used to calculate "
-            errMsg += "bank chisq for this filter template. The expected "
-            errMsg += "value will be added to the chisq to account for "
-            errMsg += "the removal of this template.\n"
-            errMsg += "Masses of filter template: %e %e\n" \
-                      %(template.params.mass1, template.params.mass2)
-            errMsg += "Masses of bank filter template: %e %e\n" \
-                      %(bank_template.params.mass1, bank_template.params.mass2)
-            errMsg += "Overlap: %e" %(abs(overlaps[-1]))
-            logging.info(errMsg)
+            _log_high_overlap(template, bank_template, overlaps[-1])
+    return overlaps
+
+def _log_high_overlap(template, bank_template, overlap):
+    """ Log that a bank veto template will not be used for a filter template
+    because their overlap is above 0.99.
+    """
+    errMsg = "Overlap > 0.99 between bank template and filter. "
+    errMsg += "This bank template will not be used to calculate "
+    errMsg += "bank chisq for this filter template. The expected "
+    errMsg += "value will be added to the chisq to account for "
+    errMsg += "the removal of this template.\n"
+    errMsg += "Masses of filter template: %e %e\n" \
+              %(template.params.mass1, template.params.mass2)
+    errMsg += "Masses of bank filter template: %e %e\n" \
+              %(bank_template.params.mass1, bank_template.params.mass2)
+    errMsg += "Overlap: %e" %(abs(overlap))
+    logging.info(errMsg)
+
+def template_overlaps_batch(bank_filters, templates, psd,
+                            low_frequency_cutoff):
+    """ This function calculates the overlaps between several templates and
+    the bank veto templates, as a single matrix product rather than one
+    inner product per pair.
+
+    Parameters
+    ----------
+    bank_filters: List of FrequencySeries
+    templates: List of FrequencySeries
+    psd: FrequencySeries
+    low_frequency_cutoff: float
+
+    Returns
+    -------
+    overlaps: numpy.ndarray
+        Complex overlap of each template (rows) with each of the bank veto
+        templates (columns), normalized as by `template_overlaps`.
+    """
+    flen = len(bank_filters[0])
+    kmin, kmax = get_cutoff_indices(low_frequency_cutoff, None,
+                                    bank_filters[0].delta_f, (flen - 1) * 2)
+    band = kmax - kmin
+    inv_psd = 1.0 / psd.numpy()[kmin:kmax]
+
+    veto = numpy.zeros((len(bank_filters), band), dtype=numpy.complex64)
+    for i, bank_template in enumerate(bank_filters):
+        veto[i] = bank_template.numpy()[kmin:kmax] * inv_psd
+    tmplt = numpy.zeros((len(templates), band), dtype=numpy.complex64)
+    for i, template in enumerate(templates):
+        h = template.numpy()[kmin:kmax]
+        tmplt[i, :len(h)] = h
+
+    overlaps = numpy.dot(tmplt.conj(), veto.T) * (4 * psd.delta_f)
+    tnorm = numpy.array([t.sigmasq(psd) for t in templates])
+    bnorm = numpy.array([b.sigmasq(psd) for b in bank_filters])
+    overlaps *= numpy.sqrt(1.0 / numpy.outer(tnorm, bnorm))
+    for i, j in zip(*numpy.nonzero(abs(overlaps) > 0.99)):
+        _log_high_overlap(templates[i], bank_filters[j], overlaps[i, j])
     return overlaps
 
 def bank_chisq_from_filters(tmplt_snr, tmplt_norm, bank_snrs, bank_norms,
@@ -191,10 +239,94 @@ class SingleDetBankVeto(object):
             self.dof = len(bank_veto_bank) * 2
 
             self._overlaps_cache = {}
+            self._overlaps_tables = {}
             self._segment_snrs_cache = {}
         else:
             self.do = False
 
+    def _check_overlaps_file(self, f):
+        """ Check that a file of overlaps was made for this bank veto """
+        veto_hashes = [int(b.params.template_hash) for b in self.filters]
+        if (f.attrs['delta_f'] != self.delta_f or
+                f.attrs['f_low'] != self.f_low or
+                f.attrs['flen'] != self.seg_len_freq or
+                list(f['bank_veto_hash'][:]) != veto_hashes):
+            raise ValueError("The bank veto overlaps in %s were computed "
+                             "for a different bank veto or segment "
+                             "length" % f.filename)
+
+    def has_overlaps(self, psd):
+        """ Return whether the overlaps for the given PSD have been
+        precomputed or loaded.
+        """
+        return PSDTemplateStore.psd_fingerprint(psd) in self._overlaps_tables
+
+    def precompute_overlaps(self, bank, psd, batch_size=64):
+        """ Calculate the overlaps of every template in a bank with the bank
+        veto templates for the given PSD, so that `cache_overlaps` does not
+        need to calculate them per template.
+
+        Parameters
+        ----------
+        bank : FilterBank
+            The search template bank.
+        psd : FrequencySeries
+            The PSD to calculate the overlaps with.
+        batch_size : {64, int}
+            The number of templates to generate and overlap at once.
+        """
+        logging.info("Precalculate the bank veto overlaps of %s templates",
+                     len(bank))
+        outs = [zeros(self.seg_len_freq, dtype=self.cdtype)
+                for _ in range(min(batch_size, len(bank)))]
+        hashes = numpy.zeros(len(bank), dtype=numpy.int64)
+        overlaps = numpy.zeros((len(bank), len(self.filters)),
+                               dtype=numpy.complex64)
+        for start in range(0, len(bank), batch_size):
+            indices = list(range(start, min(start + batch_size, len(bank))))
+            templates = bank.get_templates(indices, outs[:len(indices)])
+            hashes[start:start + len(indices)] = \
+                [int(t.params.template_hash) for t in templates]
+            overlaps[start:start + len(indices)] = \
+                template_overlaps_batch(self.filters, templates, psd,
+                                        self.f_low)
+
+        order = hashes.argsort()
+        self._overlaps_tables[PSDTemplateStore.psd_fingerprint(psd)] = \
+            (hashes[order], overlaps[order])
+
+    def load_overlaps(self, filename):
+        """ Read precomputed bank veto overlaps from an HDF5 file written by
+        `save_overlaps`. The file is opened read-only.
+        """
+        with h5py.File(filename, 'r') as f:
+            self._check_overlaps_file(f)
+            for fingerprint in f['psd']:
+                group = f['psd'][fingerprint]
+                self._overlaps_tables[fingerprint] = \
+                    (group['template_hash'][:], group['overlaps'][:])
+        logging.info("Read bank veto overlaps for %s PSDs from %s",
+                     len(self._overlaps_tables), filename)
+
+    def save_overlaps(self, filename):
+        """ Write the precomputed bank veto overlaps to an HDF5 file, with
+        one group per PSD named by the hash of the PSD.
+        """
+        tmp = filename + '.tmp%s' % os.getpid()
+        with h5py.File(tmp, 'w') as f:
+            f.attrs['delta_f'] = self.delta_f
+            f.attrs['f_low'] = self.f_low
+            f.attrs['flen'] = self.seg_len_freq
+            f['bank_veto_hash'] = numpy.array(
+                [int(b.params.template_hash) for b in self.filters],
+                dtype=numpy.int64)
+            for fingerprint, (hashes, overlaps) in \
+                    self._overlaps_tables.items():
+                group = f.create_group('psd/%s' % fingerprint)
+                group['template_hash'] = hashes
+                group['overlaps'] = overlaps
+        os.rename(tmp, filename)
+
     def cache_segment_snrs(self, stilde, psd):
         key = (id(stilde), id(psd))
         if key not in self._segment_snrs_cache:
@@ -204,6 +336,16 @@ class SingleDetBankVeto(object):
         return self._segment_snrs_cache[key]
 
     def cache_overlaps(self, template, psd):
+        fingerprint = None
+        if self._overlaps_tables:
+            fingerprint = PSDTemplateStore.psd_fingerprint(psd)
+        if fingerprint in self._overlaps_tables:
+            hashes, overlaps = self._overlaps_tables[fingerprint]
+            thash = int(template.params.template_hash)
+            row = numpy.searchsorted(hashes, thash)
+            if row < len(hashes) and hashes[row] == thash:
+                return overlaps[row]
+
         key = (id(template.params), id(psd))
         if key not in self._overlaps_cache:
             logging.info("...Calculate bank veto overlaps")
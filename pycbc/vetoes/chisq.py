@@ -21,9 +21,9 @@
 #
 # =============================================================================
 #
-import numpy, logging, math, pycbc.fft
+import numpy, logging, math, time, pycbc.fft
 
-from pycbc.types import zeros, real_same_precision_as, TimeSeries, complex_same_precision_as
+from pycbc.types import Array, zeros, real_same_precision_as, TimeSeries, complex_same_precision_as
 from pycbc.filter import sigmasq_series, make_frequency_series, matched_filter_core, get_cutoff_indices
 from pycbc.scheme import schemed
 import pycbc.pnutils
@@ -219,6 +219,66 @@ def power_chisq_from_precomputed(corr, snr, snr_norm, bins, indices=None, return
     else:
         return chisq
 
+def power_chisq_at_points_from_ifft(corr, snr, snr_norm, bins, indices,
+                                    pruned=False):
+    """Calculate the chisq at select points with an inverse FFT of each bin.
+
+    Parameters
+    ----------
+    corr: FrequencySeries
+        The product of the template and data in the frequency domain.
+    snr: numpy.ndarray
+        The unnormalized array of snr values at only the selected points in `indices`.
+    snr_norm: float
+        The snr normalization factor (true snr = snr * snr_norm)
+    bins: List of integers
+        The edges of the equal power bins
+    indices: Array
+        The indices where we will calculate the chisq. These must be relative
+        to the given `corr` series.
+    pruned: {False, boolean}, optional
+        If true, use the pruned FFT of `pycbc.fft.fftw_pruned` to calculate
+        each bin only at the selected points. This requires a single
+        precision `corr` whose length is a power of two.
+
+    Returns
+    -------
+    chisq: numpy.ndarray
+        An array containing only the chisq at the selected points.
+    """
+    # Get workspace memory
+    global _q_l, _qtilde_l
+
+    if _q_l is None or len(_q_l) != len(corr) or _q_l.dtype != corr.dtype:
+        _q_l = zeros(len(corr), dtype=corr.dtype)
+        _qtilde_l = zeros(len(corr), dtype=corr.dtype)
+    q = _q_l
+    qtilde = _qtilde_l
+
+    if pruned:
+        from pycbc.fft.fftw_pruned import pruned_c2cifft
+        indices = numpy.array(indices, dtype=numpy.uint32)
+
+    chisq = zeros(len(indices), dtype=real_same_precision_as(corr))
+    num_bins = len(bins) - 1
+
+    for j in range(num_bins):
+        k_min = int(bins[j])
+        k_max = int(bins[j+1])
+
+        qtilde[k_min:k_max] = corr[k_min:k_max]
+        if pruned:
+            qv = Array(pruned_c2cifft(qtilde, q, indices), copy=False)
+        else:
+            pycbc.fft.ifft(qtilde, q)
+            qv = q.take(indices)
+        qtilde[k_min:k_max].clear()
+
+        chisq_accum_bin(chisq, qv)
+
+    chisq = chisq.numpy()
+    return (chisq * num_bins - (snr.conj() * snr).real) * (snr_norm ** 2.0)
+
 def fastest_power_chisq_at_points(corr, snr, snrv, snr_norm, bins, indices):
     """Calculate the chisq values for only selected points.
 
@@ -299,11 +359,33 @@ def power_chisq(template, data, num_bins, psd,
     return power_chisq_from_precomputed(corr, total_snr, tnorm, bins, return_bins=return_bins)
 
 
+_pruned_fft = None
+
+def _pruned_fft_available():
+    """ Return whether the pruned FFT module, with its Cython extension and
+    the single precision FFTW library, can be loaded.
+    """
+    global _pruned_fft
+    if _pruned_fft is None:
+        try:
+            import pycbc.fft.fftw_pruned # pylint:disable=unused-variable
+            _pruned_fft = True
+        except (ImportError, AttributeError, OSError):
+            _pruned_fft = False
+    return _pruned_fft
+
+
 class SingleDetPowerChisq(object):
     """Class that handles precomputation and memory management for efficiently
     running the power chisq in a single detector inspiral analysis.
     """
-    def __init__(self, num_bins=0, snr_threshold=None):
+    # Relative cost of one complex multiply-add in the point-wise sum and
+    # one butterfly in an FFT, used to choose how to calculate the chisq
+    point_cost = 1.0
+    fft_cost = 1.0
+    methods = ['direct', 'fft', 'pruned', 'auto']
+
+    def __init__(self, num_bins=0, snr_threshold=None, method='direct'):
         if not (num_bins == "0" or num_bins == 0):
             self.do = True
             self.column_name = "chisq"
@@ -313,6 +395,16 @@ class SingleDetPowerChisq(object):
             self.do = False
         self.snr_threshold = snr_threshold
 
+        if method not in self.methods:
+            raise ValueError("The chisq method must be one of %s" %
+                             ', '.join(self.methods))
+        if method == 'pruned' and not _pruned_fft_available():
+            raise ValueError("The pruned chisq needs the "
+                             "pycbc.fft.fftw_pruned module")
+        self.method = method
+        self.timing = dict((m, {'calls': 0, 'points': 0, 'time': 0.0})
+                           for m in self.methods[:-1])
+
     @staticmethod
     def parse_option(row, arg):
         safe_dict = {}
@@ -329,7 +421,7 @@ class SingleDetPowerChisq(object):
             psd._chisq_cached_key = {}
 
         if not hasattr(template, '_bin_cache'):
-            template._bin_cache = LimitedSizeDict(size_limite=2**2)
+            template._bin_cache = LimitedSizeDict(size_limit=2**2)
 
         if key not in template._bin_cache or id(template.params) not in psd._chisq_cached_key:
             psd._chisq_cached_key[id(template.params)] = True
@@ -341,11 +433,129 @@ class SingleDetPowerChisq(object):
                 bins = power_chisq_bins_from_sigmasq_series(
                     psd.sigmasq_vec[template.approximant], num_bins, kmin, kmax)
             else:
-                bins = power_chisq_bins(template, num_bins, psd, template.f_lower)
+                # Templates from a FilterBank can share bins through the store
+                store = None
+                if hasattr(template, 'store_key'):
+                    from pycbc.waveform.bank import get_psd_template_store
+                    store = get_psd_template_store()
+
+                bins = None
+                if store is not None:
+                    store_key = template.store_key + (num_bins,)
+                    bins = store.get('chisq_bins', psd, store_key)
+                if bins is None:
+                    bins = power_chisq_bins(template, num_bins, psd, template.f_lower)
+                    if store is not None:
+                        store.put('chisq_bins', psd, store_key, bins)
             template._bin_cache[key] = bins
 
         return template._bin_cache[key]
 
+    @staticmethod
+    def pruned_available(corr):
+        """ Return whether the pruned FFT can be used with the given
+        correlation vector.
+        """
+        import pycbc.scheme
+        n = len(corr)
+        return (isinstance(pycbc.scheme.mgr.state, pycbc.scheme.CPUScheme)
+                and corr.dtype == numpy.complex64 and n > 1
+                and (n & (n - 1)) == 0 and _pruned_fft_available())
+
+    def method_costs(self, corr, bins, num_points):
+        """ Estimate the cost of each chisq method
+
+        Parameters
+        ----------
+        corr: FrequencySeries
+            The product of the template and data in the frequency domain.
+        bins: List of integers
+            The edges of the equal power bins
+        num_points: int
+            The number of points at which the chisq is needed.
+
+        Returns
+        -------
+        costs: dict
+            The estimated cost of each available method, in arbitrary units.
+        """
+        n = len(corr)
+        num_bins = len(bins) - 1
+        logn = numpy.log2(n)
+        costs = {}
+
+        # Every point sums over every frequency in the bins
+        costs['direct'] = self.point_cost * num_points * (bins[-1] - bins[0])
+
+        # One full inverse FFT per bin
+        costs['fft'] = num_bins * n * (self.fft_cost * logn + 1)
+
+        if self.pruned_available(corr):
+            # Each bin is transposed, transformed in rows of length n2, and
+            # then each point sums over the n1 row outputs
+            n2 = 2 ** int(logn / 2)
+            n1 = n // n2
+            costs['pruned'] = num_bins * (n * (self.fft_cost *
+                                               numpy.log2(n2) + 2) +
+                                          self.point_cost * num_points * n1)
+        return costs
+
+    def chisq_at_points(self, corr, snrv, snr_norm, bins, indices):
+        """ Calculate the chisq at the given points with the configured
+        method, choosing the cheapest method if it is 'auto'.
+
+        Parameters
+        ----------
+        corr: FrequencySeries
+            The product of the template and data in the frequency domain.
+        snrv: numpy.ndarray
+            The unnormalized snr at the points in `indices`.
+        snr_norm: float
+            The snr normalization factor (true snr = snr * snr_norm)
+        bins: List of integers
+            The edges of the equal power bins
+        indices: Array
+            The indices where we will calculate the chisq.
+
+        Returns
+        -------
+        chisq: numpy.ndarray
+            The chisq at the selected points.
+        """
+        method = self.method
+        if method == 'auto':
+            costs = self.method_costs(corr, bins, len(indices))
+            method = min(costs, key=costs.get)
+        elif method == 'pruned' and not self.pruned_available(corr):
+            raise ValueError("The pruned chisq needs a single precision, "
+                             "power of two length series on the CPU, and "
+                             "the pycbc.fft.fftw_pruned module")
+
+        start = time.time()
+        if method == 'direct':
+            chisq = power_chisq_at_points_from_precomputed(corr, snrv,
+                                               snr_norm, bins, indices)
+        else:
+            chisq = power_chisq_at_points_from_ifft(corr, snrv, snr_norm,
+                            bins, indices, pruned=(method == 'pruned'))
+
+        timing = self.timing[method]
+        timing['calls'] += 1
+        timing['points'] += len(indices)
+        timing['time'] += time.time() - start
+        return chisq
+
+    def report(self):
+        """ Log the number of calls, points and time spent in each chisq
+        method.
+        """
+        for method in self.methods[:-1]:
+            timing = self.timing[method]
+            if timing['calls']:
+                logging.info("Chisq %s: %s calls, %s points, %.3f s", method,
+                             timing['calls'], timing['points'],
+                             timing['time'])
+
     def values(self, corr, snrv, snr_norm, psd, indices, template):
         """ Calculate the chisq at points given by indices.
 
@@ -376,8 +586,8 @@ class SingleDetPowerChisq(object):
             if num_above > 0:
                 bins = self.cached_chisq_bins(template, psd)
                 dof = (len(bins) - 1) * 2 - 2
-                chisq = power_chisq_at_points_from_precomputed(corr,
-                                     above_snrv, snr_norm, bins, above_indices)
+                chisq = self.chisq_at_points(corr, above_snrv, snr_norm, bins,
+                                             above_indices)
 
             if self.snr_threshold:
                 if num_above > 0:
@@ -30,13 +30,15 @@ import logging
 import os.path
 import h5py
 from copy import copy
+from collections import OrderedDict
 import numpy as np
 from glue.ligolw import ligolw, table, lsctables, utils as ligolw_utils
 import pycbc.waveform
 import pycbc.pnutils
+import pycbc.scheme
 import pycbc.waveform.compress
 from pycbc import DYN_RANGE_FAC
-from pycbc.types import FrequencySeries, zeros
+from pycbc.types import Array, FrequencySeries, zeros
 import pycbc.io
 import six
 import hashlib
@@ -54,14 +56,28 @@ def sigma_cached(self, psd):
 
     if key not in self._sigmasq or id(self) not in psd._sigma_cached_key:
         psd._sigma_cached_key[id(self)] = True
+        # Templates from a FilterBank can share values through the store
+        store = None
+        if hasattr(self, 'store_key'):
+            store = get_psd_template_store()
+
         # If possible, we precalculate the sigmasq vector for all possible waveforms
         if pycbc.waveform.waveform_norm_exists(self.approximant):
             if not hasattr(psd, 'sigmasq_vec'):
                 psd.sigmasq_vec = {}
 
             if self.approximant not in psd.sigmasq_vec:
-                psd.sigmasq_vec[self.approximant] = pycbc.waveform.get_waveform_filter_norm(
-                     self.approximant, psd, len(psd), psd.delta_f, self.f_lower)
+                vec_key = (self.approximant, self.f_lower)
+                vec = None
+                if store is not None:
+                    vec = store.get('sigmasq_vec', psd, vec_key)
+                if vec is None:
+                    vec = pycbc.waveform.get_waveform_filter_norm(
+                        self.approximant, psd, len(psd), psd.delta_f,
+                        self.f_lower)
+                    if store is not None:
+                        store.put('sigmasq_vec', psd, vec_key, vec)
+                psd.sigmasq_vec[self.approximant] = vec
 
             if not hasattr(self, 'sigma_scale'):
                 # Get an amplitude normalization (mass dependant constant norm)
@@ -75,6 +91,13 @@ def sigma_cached(self, psd):
                 psd.sigmasq_vec[self.approximant][self.end_idx-1]
 
         else:
+            sigmasq = None
+            if store is not None:
+                sigmasq = store.get('sigmasq', psd, self.store_key)
+            if sigmasq is not None:
+                self._sigmasq[key] = sigmasq
+                return sigmasq
+
             if not hasattr(self, 'sigma_view'):
                 from pycbc.filter.matchedfilter import get_cutoff_indices
                 N = (len(self) -1) * 2
@@ -88,6 +111,8 @@ def sigma_cached(self, psd):
                 psd.invsqrt = 1.0 / psd
 
             self._sigmasq[key] = self.sigma_view.inner(psd.invsqrt[self.sslice])
+            if store is not None:
+                store.put('sigmasq', psd, self.store_key, self._sigmasq[key])
     return self._sigmasq[key]
 
 # dummy class needed for loading LIGOLW files
@@ -641,6 +666,366 @@ class LiveFilterBank(TemplateBank):
         return htilde
 
 
+class TemplateCache(object):
+    """ On-disk cache of frequency domain filter templates
+
+    Each template is stored in its own HDF5 file within the cache directory.
+    The file name is a digest of the template hash, approximant, delta_f,
+    lower and upper frequency cutoffs, filter length, data type, the extra
+    waveform arguments (such as the phase order and taper) and the waveform
+    decompression settings, so jobs which share a bank and analysis settings
+    can share a cache directory. Only the non-zero frequency range of each
+    template is stored. When a size limit is given the least recently used
+    templates are removed from the directory once it is exceeded.
+
+    Parameters
+    ----------
+    directory : str
+        The directory holding the cached templates. It is created if it
+        does not exist.
+    max_size : {None, int}
+        The maximum total size of the cached files, in bytes. If None, no
+        templates are evicted.
+    """
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Running total of the directory size, updated as templates are
+        # added so the directory is only scanned when the limit is passed
+        self._size = None
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another job may have created the directory
+                if not os.path.isdir(directory):
+                    raise
+
+    @staticmethod
+    def key(template_hash, approximant, delta_f, f_lower, length, dtype,
+            f_end=None, extra_args=None, compression=None):
+        """ Return the cache key of a template generated with these settings
+
+        Parameters
+        ----------
+        template_hash : int
+            The hash of the template parameters.
+        approximant : str
+            The approximant used to generate the template.
+        delta_f : float
+            The frequency step of the template.
+        f_lower : float
+            The lower frequency cutoff of the template.
+        length : int
+            The length of the template.
+        dtype : numpy.dtype
+            The data type of the template.
+        f_end : {None, float}
+            The upper frequency cutoff of the template.
+        extra_args : {None, dict}
+            Any additional arguments passed to the waveform generator.
+        compression : {None, tuple}
+            Whether the template is decompressed from a compressed waveform,
+            and the decompression method used.
+        """
+        extra_args = {} if extra_args is None else extra_args
+        desc = repr((int(template_hash), str(approximant), float(delta_f),
+                     float(f_lower), int(length), np.dtype(dtype).str,
+                     None if f_end is None else float(f_end),
+                     sorted(extra_args.items()), compression))
+        return hashlib.sha1(desc.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.hdf')
+
+    def get(self, key, out, delta_f):
+        """ Load a cached template into the memory given
+
+        Parameters
+        ----------
+        key : str
+            The key returned by `key`.
+        out : Array
+            The memory to write the template into. It is cleared before the
+            template is written.
+        delta_f : float
+            The frequency step of the template.
+
+        Returns
+        -------
+        htilde : {FrequencySeries, None}
+            The template, with its chirp_length and length_in_time
+            attributes set, or None if the template is not in the cache.
+        """
+        path = self._path(key)
+        try:
+            with h5py.File(path, 'r') as f:
+                kmin = f.attrs['kmin']
+                data = f['htilde'][:]
+                chirp_length = f.attrs['chirp_length']
+                length_in_time = f.attrs['length_in_time']
+        except (IOError, OSError, KeyError):
+            self.misses += 1
+            return None
+
+        # Mark the template as recently used for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+
+        out.clear()
+        if len(data):
+            out[kmin:kmin + len(data)] = Array(data, copy=False)
+        htilde = FrequencySeries(out, delta_f=delta_f, copy=False)
+        htilde.chirp_length = None if np.isnan(chirp_length) else chirp_length
+        htilde.length_in_time = \
+            None if np.isnan(length_in_time) else length_in_time
+        return htilde
+
+    def put(self, key, htilde, chirp_length=None, length_in_time=None):
+        """ Store a template in the cache
+
+        Parameters
+        ----------
+        key : str
+            The key returned by `key`.
+        htilde : FrequencySeries
+            The template to store.
+        chirp_length : {None, float}
+            The template duration up to merger.
+        length_in_time : {None, float}
+            The total template duration.
+        """
+        data = htilde.numpy()
+        nonzero = np.flatnonzero(data)
+        kmin = nonzero[0] if len(nonzero) else 0
+        kmax = nonzero[-1] + 1 if len(nonzero) else 0
+
+        # Write to a temporary file and move it into place, so other jobs
+        # reading the cache never see a partially written template
+        path = self._path(key)
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with h5py.File(tmp_path, 'w') as f:
+            f['htilde'] = data[kmin:kmax]
+            f.attrs['kmin'] = kmin
+            f.attrs['chirp_length'] = \
+                np.nan if chirp_length is None else chirp_length
+            f.attrs['length_in_time'] = \
+                np.nan if length_in_time is None else length_in_time
+        size = os.path.getsize(tmp_path)
+        os.rename(tmp_path, path)
+
+        if self.max_size is not None:
+            if self._size is not None:
+                self._size += size
+            if self._size is None or self._size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """ Remove the least recently used templates until the cache is
+        within its size limit
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.hdf'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Removed by another job
+                pass
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def report(self):
+        """ Log the cache statistics
+        """
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        logging.info("Template cache: %s hits, %s misses (%.1f%% hit rate), "
+                     "%s evictions", self.hits, self.misses, rate,
+                     self.evictions)
+
+
+class PSDTemplateStore(object):
+    """ Least recently used store of template quantities which depend on
+    the PSD
+
+    The normalization of each template, the cumulative normalization
+    vectors of approximants with a closed form amplitude, and the power
+    chisq bin edges are keyed by a fingerprint of the PSD contents rather
+    than the identity of the PSD and template objects. Segments with an
+    identical PSD therefore share values, and the store can be saved to
+    and loaded from an HDF5 file so that later jobs using the same PSD
+    avoid recalculating them.
+
+    Parameters
+    ----------
+    size_limit : {65536, int}
+        The maximum number of values to keep.
+    """
+    # The kinds of value held and whether each is an array or a scalar
+    kinds = {'sigmasq': False, 'sigmasq_vec': True, 'chisq_bins': True}
+
+    def __init__(self, size_limit=2**16):
+        self.size_limit = size_limit
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # The keys of the values put since the last call of new_values
+        self._new_keys = OrderedDict()
+
+    @staticmethod
+    def psd_fingerprint(psd):
+        """ Return a digest of the contents of the PSD. It is stored on the
+        PSD, which should not be modified afterwards.
+        """
+        if not hasattr(psd, '_fingerprint'):
+            h = hashlib.sha1(np.ascontiguousarray(psd.numpy()).tobytes())
+            h.update(repr((float(psd.delta_f), len(psd))).encode('utf-8'))
+            psd._fingerprint = h.hexdigest()
+        return psd._fingerprint
+
+    def _key(self, kind, psd, key):
+        if kind not in self.kinds:
+            raise ValueError("Unknown kind of value %s" % kind)
+        return (kind, repr((self.psd_fingerprint(psd),) + tuple(key)))
+
+    def get(self, kind, psd, key):
+        """ Return a stored value, or None if it is not in the store
+
+        Parameters
+        ----------
+        kind : str
+            The kind of value, one of 'sigmasq', 'sigmasq_vec' or
+            'chisq_bins'.
+        psd : FrequencySeries
+            The PSD the value was calculated with.
+        key : tuple
+            The remaining parameters the value depends on.
+        """
+        k = self._key(kind, psd, key)
+        try:
+            value = self.data.pop(k)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.data[k] = value
+        self.hits += 1
+        return value
+
+    def put(self, kind, psd, key, value):
+        """ Store a value, removing the least recently used values if the
+        store is full. The arguments are as for `get`.
+        """
+        k = self._key(kind, psd, key)
+        self.data.pop(k, None)
+        self.data[k] = value
+        self._new_keys.pop(k, None)
+        self._new_keys[k] = None
+        while len(self.data) > self.size_limit:
+            self.data.popitem(last=False)
+
+    def new_values(self):
+        """ Return the values put in the store since the last call, which
+        are still held, in the order they were put. For example, a worker
+        process returns these for its parent to `merge`.
+
+        Returns
+        -------
+        values : OrderedDict
+            The values keyed as in `data`.
+        """
+        values = OrderedDict((k, self.data[k]) for k in self._new_keys
+                             if k in self.data)
+        self._new_keys = OrderedDict()
+        return values
+
+    def merge(self, values):
+        """ Add values returned by the `new_values` of another store, as
+        the most recently used values of this store.
+        """
+        for k, value in values.items():
+            self.data.pop(k, None)
+            self.data[k] = value
+        while len(self.data) > self.size_limit:
+            self.data.popitem(last=False)
+
+    def save(self, filename):
+        """ Write the store to an HDF5 file
+        """
+        with h5py.File(filename, 'w') as f:
+            for kind in self.kinds:
+                keys = [k for (knd, k) in self.data if knd == kind]
+                values = [np.atleast_1d(self.data[(kind, k)]) for k in keys]
+                g = f.create_group(kind)
+                g['keys'] = np.array(keys, dtype='S')
+                g['lengths'] = np.array([len(v) for v in values], dtype=int)
+                g['values'] = np.concatenate(values) if values \
+                    else np.array([], dtype=np.float64)
+
+    def load(self, filename):
+        """ Add the values in an HDF5 file written by `save` to the store
+        """
+        with h5py.File(filename, 'r') as f:
+            for kind in self.kinds:
+                if kind not in f:
+                    continue
+                keys = f[kind]['keys'][:]
+                values = f[kind]['values'][:]
+                offsets = np.cumsum(np.append(0, f[kind]['lengths'][:]))
+                for i, k in enumerate(keys):
+                    value = values[offsets[i]:offsets[i + 1]]
+                    if not self.kinds[kind]:
+                        value = value[0]
+                    k = k.decode() if isinstance(k, bytes) else k
+                    self.data[(kind, k)] = value
+        while len(self.data) > self.size_limit:
+            self.data.popitem(last=False)
+
+    def report(self):
+        """ Log the store statistics
+        """
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        logging.info("PSD template store: %s values, %s hits, %s misses "
+                     "(%.1f%% hit rate)", len(self.data), self.hits,
+                     self.misses, rate)
+
+_psd_template_store = None
+
+def set_psd_template_store(store):
+    """ Set the `PSDTemplateStore` used by templates from a `FilterBank`.
+    If None, the quantities are only cached on the templates and PSDs.
+    """
+    global _psd_template_store
+    _psd_template_store = store
+
+def get_psd_template_store():
+    """ Return the `PSDTemplateStore` in use, or None
+    """
+    return _psd_template_store
+
+
 class FilterBank(TemplateBank):
     def __init__(self, filename, filter_length, delta_f, dtype,
                  out=None, max_template_length=None,
@@ -648,8 +1033,10 @@ class FilterBank(TemplateBank):
                  enable_compressed_waveforms=True,
                  low_frequency_cutoff=None,
                  waveform_decompression_method=None,
+                 template_cache=None,
                  **kwds):
         self.out = out
+        self.template_cache = template_cache
         self.dtype = dtype
         self.f_lower = low_frequency_cutoff
         self.filename = filename
@@ -749,27 +1136,40 @@ class FilterBank(TemplateBank):
             tempout = self.out
 
         approximant = self.approximant(index)
-        f_end = self.end_frequency(index)
-        if f_end is None or f_end >= (self.filter_length * self.delta_f):
-            f_end = (self.filter_length-1) * self.delta_f
+        f_end = self._template_end_frequency(index)
 
         # Find the start frequency, if variable
         f_low = find_variable_start_frequency(approximant,
                                               self.table[index],
                                               self.f_lower,
                                               self.max_template_length)
-        logging.info('%s: generating %s from %s Hz' % (index, approximant, f_low))
 
         # Clear the storage memory
         poke  = tempout.data # pylint:disable=unused-variable
         tempout.clear()
 
+        htilde = None
+        if self.template_cache is not None:
+            cache_key = self.template_cache.key(
+                self.table.template_hash[index], approximant, self.delta_f,
+                f_low, self.filter_length, self.dtype, f_end=f_end,
+                extra_args=self.extra_args,
+                compression=self._compression_settings())
+            htilde = self.template_cache.get(
+                cache_key, tempout[0:self.filter_length], self.delta_f)
+        cached = htilde is not None
+
         # Get the waveform filter
         distance = 1.0 / DYN_RANGE_FAC
-        if self.has_compressed_waveforms and self.enable_compressed_waveforms:
+        if cached:
+            logging.info('%s: loaded %s from %s Hz from the template cache',
+                         index, approximant, f_low)
+        elif self.has_compressed_waveforms and self.enable_compressed_waveforms:
+            logging.info('%s: generating %s from %s Hz' % (index, approximant, f_low))
             htilde = self.get_decompressed_waveform(tempout, index, f_lower=f_low,
                                                     approximant=approximant, df=None)
         else :
+            logging.info('%s: generating %s from %s Hz' % (index, approximant, f_low))
             htilde = pycbc.waveform.get_waveform_filter(
                 tempout[0:self.filter_length], self.table[index],
                 approximant=approximant, f_lower=f_low, f_final=f_end,
@@ -788,6 +1188,30 @@ class FilterBank(TemplateBank):
         self.table[index].template_duration = template_duration
 
         htilde = htilde.astype(self.dtype)
+        if self.template_cache is not None and not cached:
+            self.template_cache.put(cache_key, htilde,
+                                    chirp_length=template_duration,
+                                    length_in_time=ttotal)
+        self._set_template_attributes(htilde, index, approximant, f_low,
+                                      f_end, template_duration, ttotal)
+        return htilde
+
+    def _compression_settings(self):
+        """ Return whether templates are decompressed from the compressed
+        waveforms in the bank, and with which interpolation method
+        """
+        if self.has_compressed_waveforms and self.enable_compressed_waveforms:
+            return (True, self.waveform_decompression_method)
+        return (False, None)
+
+    def _template_end_frequency(self, index):
+        f_end = self.end_frequency(index)
+        if f_end is None or f_end >= (self.filter_length * self.delta_f):
+            f_end = (self.filter_length-1) * self.delta_f
+        return f_end
+
+    def _set_template_attributes(self, htilde, index, approximant, f_low,
+                                 f_end, template_duration, ttotal):
         htilde.f_lower = f_low
         htilde.min_f_lower = self.min_f_lower
         htilde.end_idx = int(f_end / htilde.delta_f)
@@ -796,11 +1220,100 @@ class FilterBank(TemplateBank):
         htilde.length_in_time = ttotal
         htilde.approximant = approximant
         htilde.end_frequency = f_end
+        if 'template_hash' in self.table.fieldnames:
+            # Identifies the template in the PSDTemplateStore
+            htilde.store_key = (int(self.table.template_hash[index]),
+                                approximant, float(f_low),
+                                float(self.min_f_lower or 0),
+                                float(f_end), len(htilde),
+                                float(htilde.delta_f),
+                                repr(sorted(self.extra_args.items())),
+                                self._compression_settings())
 
         # Add sigmasq as a method of this instance
         htilde.sigmasq = types.MethodType(sigma_cached, htilde)
         htilde._sigmasq = {}
-        return htilde
+
+    def get_templates(self, indices, outs):
+        """ Generate several templates into the given output memory
+
+        Blocks of SPAtmplt templates are generated together with
+        `pycbc.waveform.spa_tmplt.spa_tmplt_bulk`, which avoids most of the
+        per-template overhead, and do not use the template cache. Any other
+        templates are generated one at a time as by indexing the bank.
+
+        Parameters
+        ----------
+        indices : list of ints
+            The indices of the templates to generate.
+        outs : list of Arrays
+            The memory to write each template into, for example the
+            template rows of a `pycbc.filter.BatchMatchedFilterControl`.
+
+        Returns
+        -------
+        templates : list of FrequencySeries
+            The templates, with the same attributes as those returned by
+            indexing the bank.
+        """
+        approximants = [self.approximant(index) for index in indices]
+        input_params = [pycbc.waveform.waveform.props(self.table[index],
+                                                      **self.extra_args)
+                        for index in indices]
+        orders = set((int(p['phase_order']), int(p['spin_order']))
+                     for p in input_params)
+        use_bulk = (len(indices) > 1 and len(orders) == 1 and
+                    all(a == 'SPAtmplt' for a in approximants) and
+                    not (self.has_compressed_waveforms and
+                         self.enable_compressed_waveforms) and
+                    np.dtype(self.dtype) == np.complex64 and
+                    isinstance(pycbc.scheme.mgr.state,
+                               pycbc.scheme.CPUScheme))
+
+        if not use_bulk:
+            templates = []
+            bank_out = self.out
+            try:
+                for index, out in zip(indices, outs):
+                    self.out = out
+                    templates.append(self[index])
+            finally:
+                self.out = bank_out
+            return templates
+
+        f_lows = [find_variable_start_frequency(approximant,
+                                                self.table[index],
+                                                self.f_lower,
+                                                self.max_template_length)
+                  for index, approximant in zip(indices, approximants)]
+        logging.info('%s-%s: generating %s SPAtmplt templates together',
+                     indices[0], indices[-1], len(indices))
+
+        for out in outs:
+            if len(out) > self.filter_length:
+                out[self.filter_length:].clear()
+        phase_order, spin_order = orders.pop()
+        htildes = pycbc.waveform.spa_tmplt.spa_tmplt_bulk(
+            [out[0:self.filter_length] for out in outs],
+            [p['mass1'] for p in input_params],
+            [p['mass2'] for p in input_params],
+            [p['spin1z'] for p in input_params],
+            [p['spin2z'] for p in input_params],
+            np.array(f_lows), self.delta_f, distance=1.0 / DYN_RANGE_FAC,
+            phase_order=phase_order, spin_order=spin_order)
+
+        for htilde, index, p, f_low in zip(htildes, indices, input_params,
+                                            f_lows):
+            p['f_lower'] = f_low
+            template_duration = \
+                pycbc.waveform.get_waveform_filter_length_in_time(
+                    'SPAtmplt', **p)
+            self.table[index].template_duration = template_duration
+            self._set_template_attributes(htilde, index, 'SPAtmplt', f_low,
+                                          self._template_end_frequency(index),
+                                          template_duration,
+                                          template_duration)
+        return htildes
 
 def find_variable_start_frequency(approximant, parameters, f_start, max_length,
                                   delta_f = 1):
@@ -157,6 +157,55 @@ def spa_tmplt_engine(htilde, kmin, phase_order, delta_f, piM, pfaN,
     err_msg += "scheme. You shouldn't be seeing this error!"
     raise ValueError(err_msg)
 
+@schemed("pycbc.waveform.spa_tmplt_")
+def spa_tmplt_bulk_engine(htildes, kmins, delta_f, piM, pfaN,
+                          pfa2, pfa3, pfa4, pfa5, pfl5,
+                          pfa6, pfl6, pfa7, amp_factor):
+    """ Calculate the spa tmplt phase for a block of templates
+    """
+    err_msg = "This function is a stub that should be overridden using the "
+    err_msg += "scheme. You shouldn't be seeing this error!"
+    raise ValueError(err_msg)
+
+def spa_phasing_terms(mass1, mass2, s1z, s2z, lal_pars):
+    """ Return the TaylorF2 phasing coefficients used by the spa tmplt engine
+
+    Returns
+    -------
+    terms : tuple
+        The coefficients (pfaN, pfa2, pfa3, pfa4, pfa5, pfl5, pfa6, pfl6,
+        pfa7), where all but pfaN are relative to pfaN.
+    """
+    phasing = lalsimulation.SimInspiralTaylorF2AlignedPhasing(
+                                    float(mass1), float(mass2),
+                                    float(s1z), float(s2z),
+                                    lal_pars)
+
+    pfaN = phasing.v[0]
+    pfa2 = phasing.v[2] / pfaN
+    pfa3 = phasing.v[3] / pfaN
+    pfa4 = phasing.v[4] / pfaN
+    pfa5 = phasing.v[5] / pfaN
+    pfa6 = (phasing.v[6] - phasing.vlogv[6] * log(4)) / pfaN
+    pfa7 = phasing.v[7] / pfaN
+
+    pfl5 = phasing.vlogv[5] / pfaN
+    pfl6 = phasing.vlogv[6] / pfaN
+    return pfaN, pfa2, pfa3, pfa4, pfa5, pfl5, pfa6, pfl6, pfa7
+
+def spa_lal_pars(phase_order, spin_order):
+    """ Return a LAL dictionary holding the PN phase and spin orders
+    """
+    lal_pars = lal.CreateDict()
+    if phase_order != -1:
+        lalsimulation.SimInspiralWaveformParamsInsertPNPhaseOrder(
+            lal_pars, phase_order)
+
+    if spin_order != -1:
+        lalsimulation.SimInspiralWaveformParamsInsertPNSpinOrder(
+            lal_pars, spin_order)
+    return lal_pars
+
 def spa_tmplt(**kwds):
     """ Generate a minimal TaylorF2 approximant with optimizations for the sin/cos
     """
@@ -177,31 +226,10 @@ def spa_tmplt(**kwds):
 
     amp_factor = spa_amplitude_factor(mass1=mass1, mass2=mass2) / distance
 
-    lal_pars = lal.CreateDict()
-    if phase_order != -1:
-        lalsimulation.SimInspiralWaveformParamsInsertPNPhaseOrder(
-            lal_pars, phase_order)
-
-    if spin_order != -1:
-        lalsimulation.SimInspiralWaveformParamsInsertPNSpinOrder(
-            lal_pars, spin_order)
-
     #Calculate the PN terms
-    phasing = lalsimulation.SimInspiralTaylorF2AlignedPhasing(
-                                    float(mass1), float(mass2),
-                                    float(s1z), float(s2z),
-                                    lal_pars)
-
-    pfaN = phasing.v[0]
-    pfa2 = phasing.v[2] / pfaN
-    pfa3 = phasing.v[3] / pfaN
-    pfa4 = phasing.v[4] / pfaN
-    pfa5 = phasing.v[5] / pfaN
-    pfa6 = (phasing.v[6] - phasing.vlogv[6] * log(4)) / pfaN
-    pfa7 = phasing.v[7] / pfaN
-
-    pfl5 = phasing.vlogv[5] / pfaN
-    pfl6 = phasing.vlogv[6] / pfaN
+    lal_pars = spa_lal_pars(phase_order, spin_order)
+    pfaN, pfa2, pfa3, pfa4, pfa5, pfl5, pfa6, pfl6, pfa7 = \
+        spa_phasing_terms(mass1, mass2, s1z, s2z, lal_pars)
 
     piM = lal.PI * (mass1 + mass2) * lal.MTSUN_SI
 
@@ -242,3 +270,77 @@ def spa_tmplt(**kwds):
             amp_factor, kwds['sample_points'], htilde)
     return htilde
 
+
+def spa_tmplt_bulk(outs, mass1, mass2, spin1z, spin2z, f_lower, delta_f,
+                   distance=1.0, phase_order=-1, spin_order=-1):
+    """ Generate a block of SPAtmplt templates together
+
+    The templates are written into the given output memory in a single pass
+    of the spa tmplt engine, which shares the precomputed powers of the
+    frequency between all of them. Each output is cleared before its
+    template is written.
+
+    Parameters
+    ----------
+    outs : list of Arrays
+        The complex64 memory to write each template into, for example the
+        template rows of a `pycbc.filter.BatchMatchedFilterControl`.
+    mass1 : numpy.ndarray
+        The primary mass of each template.
+    mass2 : numpy.ndarray
+        The secondary mass of each template.
+    spin1z : numpy.ndarray
+        The primary aligned spin of each template.
+    spin2z : numpy.ndarray
+        The secondary aligned spin of each template.
+    f_lower : {float, numpy.ndarray}
+        The frequency to start each template from.
+    delta_f : float
+        The frequency step of the templates.
+    distance : {1.0, float}
+        The distance of the templates.
+    phase_order : {-1, int}
+        The PN phase order. If -1, use the highest available.
+    spin_order : {-1, int}
+        The PN spin order. If -1, use the highest available.
+
+    Returns
+    -------
+    htildes : list of FrequencySeries
+        The templates, which use the output memory given.
+    """
+    num = len(outs)
+    mass1 = numpy.array(mass1, dtype=numpy.float64, ndmin=1)
+    mass2 = numpy.array(mass2, dtype=numpy.float64, ndmin=1)
+    f_lower = numpy.zeros(num) + f_lower
+
+    htildes = []
+    for out in outs:
+        if out.dtype != complex64:
+            raise TypeError("Output array is the wrong dtype")
+        out.clear()
+        htildes.append(FrequencySeries(out, delta_f=delta_f, copy=False))
+    if num == 0:
+        return htildes
+
+    amp_factor = spa_amplitude_factor(mass1=mass1, mass2=mass2) / distance
+    piM = lal.PI * (mass1 + mass2) * lal.MTSUN_SI
+
+    lal_pars = spa_lal_pars(int(phase_order), int(spin_order))
+    terms = numpy.array([spa_phasing_terms(m1, m2, s1z, s2z, lal_pars)
+                         for m1, m2, s1z, s2z in zip(mass1, mass2,
+                                                     spin1z, spin2z)])
+
+    vISCO = 1. / sqrt(6.)
+    fISCO = vISCO * vISCO * vISCO / piM
+    kmins = (f_lower / float(delta_f)).astype(int)
+    kmaxs = (fISCO / delta_f).astype(int)
+
+    rows = []
+    for out, kmin, kmax in zip(outs, kmins, kmaxs):
+        kmax = max(min(kmax, len(out)), kmin)
+        rows.append(out[kmin:kmax])
+
+    spa_tmplt_bulk_engine(rows, kmins, delta_f, piM, *(list(terms.T) +
+                                                       [amp_factor]))
+    return htildes
@@ -51,31 +51,25 @@ def get_log(vmax, delta):
         _logv_vec = logv_lookup(vmax, delta)
     return _logv_vec
 
-@cython.wraparound(False)
-@cython.boundscheck(False)
 @cython.cdivision(True)
-cdef spa_tmplt_inline(float piM, float pfaN,
-                      float pfa2, float pfa3,
-                      float pfa4, float pfa5,
-                      float pfl5, float pfa6,
-                      float pfl6, float pfa7,
-                      float ampc, int kmin,
-                      numpy.ndarray[numpy.float32_t, ndim=1] _logv_vec,
-                      numpy.ndarray[numpy.float32_t, ndim=1] _cbrt_vec,
-                      numpy.ndarray[numpy.float32_t, ndim=1] _kfac,
-                      numpy.ndarray[numpy.complex64_t, ndim=1] _htilde,
-                      ):
+cdef inline void spa_tmplt_row(float piM, float pfaN,
+                               float pfa2, float pfa3,
+                               float pfa4, float pfa5,
+                               float pfl5, float pfa6,
+                               float pfl6, float pfa7,
+                               float ampc,
+                               float* logv_vec,
+                               float* cbrt_vec,
+                               float* kfac,
+                               float complex* htilde,
+                               unsigned int xmax) nogil:
     cdef float piM13 = cbrt(piM)
     cdef float logpiM13 = log(piM13)
     cdef float log4 = log(4.)
     cdef float two_pi = 2 * M_PI
     cdef float v, logv, v5, phasing, amp
-
-    cdef float complex* htilde = &_htilde[0]
-    cdef float* kfac = &_kfac[0]
-    cdef float* cbrt_vec = &_cbrt_vec[kmin]
-    cdef float* logv_vec = &_logv_vec[kmin]
-    cdef unsigned int i, xmax = _htilde.shape[0]
+    cdef double sinp, cosp
+    cdef unsigned int i
 
     for i in range(xmax):
         v = piM13 * cbrt_vec[i]
@@ -110,6 +104,58 @@ cdef spa_tmplt_inline(float piM, float pfaN,
 
         htilde[i] = (cosp - sinp * 1j) * amp
 
+@cython.wraparound(False)
+@cython.boundscheck(False)
+@cython.cdivision(True)
+cdef spa_tmplt_inline(float piM, float pfaN,
+                      float pfa2, float pfa3,
+                      float pfa4, float pfa5,
+                      float pfl5, float pfa6,
+                      float pfl6, float pfa7,
+                      float ampc, int kmin,
+                      numpy.ndarray[numpy.float32_t, ndim=1] _logv_vec,
+                      numpy.ndarray[numpy.float32_t, ndim=1] _cbrt_vec,
+                      numpy.ndarray[numpy.float32_t, ndim=1] _kfac,
+                      numpy.ndarray[numpy.complex64_t, ndim=1] _htilde,
+                      ):
+    spa_tmplt_row(piM, pfaN, pfa2, pfa3, pfa4, pfa5, pfl5, pfa6, pfl6, pfa7,
+                  ampc, &_logv_vec[kmin], &_cbrt_vec[kmin], &_kfac[0],
+                  &_htilde[0], _htilde.shape[0])
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+@cython.cdivision(True)
+cdef spa_tmplt_inline_block(numpy.ndarray[numpy.float32_t, ndim=1] piM,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfaN,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfa2,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfa3,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfa4,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfa5,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfl5,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfa6,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfl6,
+                            numpy.ndarray[numpy.float32_t, ndim=1] pfa7,
+                            numpy.ndarray[numpy.float32_t, ndim=1] ampc,
+                            numpy.ndarray[numpy.int64_t, ndim=1] kmin,
+                            numpy.ndarray[numpy.int64_t, ndim=1] length,
+                            numpy.ndarray[numpy.uintp_t, ndim=1] ptrs,
+                            numpy.ndarray[numpy.float32_t, ndim=1] _logv_vec,
+                            numpy.ndarray[numpy.float32_t, ndim=1] _cbrt_vec,
+                            numpy.ndarray[numpy.float32_t, ndim=1] _kfac,
+                            ):
+    cdef float* logv_vec = &_logv_vec[0]
+    cdef float* cbrt_vec = &_cbrt_vec[0]
+    cdef float* kfac = &_kfac[0]
+    cdef unsigned int j, nrows = ptrs.shape[0]
+
+    with nogil:
+        for j in range(nrows):
+            spa_tmplt_row(piM[j], pfaN[j], pfa2[j], pfa3[j], pfa4[j], pfa5[j],
+                          pfl5[j], pfa6[j], pfl6[j], pfa7[j], ampc[j],
+                          logv_vec + kmin[j], cbrt_vec + kmin[j],
+                          kfac + kmin[j],
+                          <float complex*> ptrs[j], length[j])
+
 @cython.wraparound(False)
 @cython.boundscheck(False)
 @cython.cdivision(True)
@@ -178,3 +224,24 @@ def spa_tmplt_engine(htilde,  kmin,  phase_order, delta_f, piM,  pfaN,
                       pfa6, pfl6, pfa7, amp_factor,
                       kmin, logv_vec, cbrt_vec, kfac, htilde.data,
                       )
+
+def spa_tmplt_bulk_engine(htildes, kmins, delta_f, piM, pfaN,
+                          pfa2, pfa3, pfa4, pfa5, pfl5,
+                          pfa6, pfl6, pfa7, amp_factor):
+    """ Calculate the spa tmplt phase for a block of templates
+    """
+    lengths = numpy.array([len(h) for h in htildes], dtype=numpy.int64)
+    kmins = numpy.array(kmins, dtype=numpy.int64)
+    kmax = int((kmins + lengths).max())
+
+    # The lookup vectors are shared by all templates in the block
+    kfac = spa_tmplt_precondition(kmax, delta_f).data
+    cbrt_vec = get_cbrt(kmax * delta_f, delta_f).data
+    logv_vec = get_log(kmax * delta_f, delta_f).data
+    ptrs = numpy.array([h.ptr for h in htildes], dtype=numpy.uintp)
+
+    f32 = lambda x: numpy.asarray(x, dtype=numpy.float32)
+    spa_tmplt_inline_block(f32(piM), f32(pfaN), f32(pfa2), f32(pfa3),
+                           f32(pfa4), f32(pfa5), f32(pfl5), f32(pfa6),
+                           f32(pfl6), f32(pfa7), f32(amp_factor),
+                           kmins, lengths, ptrs, logv_vec, cbrt_vec, kfac)
@@ -0,0 +1,246 @@
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+import numpy
+import h5py
+
+from utils import parse_args_cpu_only, simple_exit
+
+from pycbc.types import FrequencySeries, zeros
+from pycbc.waveform.bank import FilterBank
+from pycbc.waveform.bank import TemplateCache, PSDTemplateStore
+
+parse_args_cpu_only("waveform.bank")
+
+
+class TestTemplateCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.delta_f = 0.25
+        self.length = 1024
+        self.kmin = 80
+        self.kmax = 700
+        data = numpy.zeros(self.length, dtype=numpy.complex64)
+        numpy.random.seed(0)
+        band = numpy.random.normal(size=(2, self.kmax - self.kmin))
+        data[self.kmin:self.kmax] = band[0] + 1j * band[1]
+        self.htilde = FrequencySeries(data, delta_f=self.delta_f)
+        self.extra_args = {'phase_order': -1, 'taper': None}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def key(self, template_hash, **kwds):
+        args = dict(f_end=self.kmax * self.delta_f,
+                    extra_args=self.extra_args, compression=(False, None))
+        args.update(kwds)
+        return TemplateCache.key(template_hash, 'SPAtmplt', self.delta_f,
+                                 20.0, self.length, numpy.complex64, **args)
+
+    def test_round_trip(self):
+        cache = TemplateCache(self.directory)
+        key = self.key(1)
+        cache.put(key, self.htilde, chirp_length=12.5, length_in_time=13.0)
+
+        out = zeros(self.length, dtype=numpy.complex64)
+        out.fill(1)
+        htilde = cache.get(key, out, self.delta_f)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(htilde.delta_f, self.delta_f)
+        self.assertEqual(numpy.flatnonzero(htilde.numpy())[0], self.kmin)
+        numpy.testing.assert_array_equal(htilde.numpy(), self.htilde.numpy())
+        self.assertEqual(htilde.chirp_length, 12.5)
+        self.assertEqual(htilde.length_in_time, 13.0)
+
+        cache.put(key, self.htilde)
+        htilde = cache.get(key, out, self.delta_f)
+        self.assertIsNone(htilde.chirp_length)
+        self.assertIsNone(htilde.length_in_time)
+
+    def test_settings_in_key(self):
+        cache = TemplateCache(self.directory)
+        cache.put(self.key(1), self.htilde)
+        out = zeros(self.length, dtype=numpy.complex64)
+
+        extra_args = dict(self.extra_args, phase_order=4)
+        for key in [self.key(1, extra_args=extra_args),
+                    self.key(1, extra_args=dict(self.extra_args,
+                                                taper='start')),
+                    self.key(1, f_end=200.0),
+                    self.key(1, compression=(True, 'linear')),
+                    self.key(2)]:
+            self.assertIsNone(cache.get(key, out, self.delta_f))
+        self.assertEqual(cache.misses, 5)
+
+        # The order of the extra arguments does not matter
+        reordered = dict(reversed(list(self.extra_args.items())))
+        self.assertIsNotNone(cache.get(self.key(1, extra_args=reordered),
+                                       out, self.delta_f))
+
+    def test_eviction(self):
+        cache = TemplateCache(self.directory)
+        cache.put(self.key(0), self.htilde)
+        size = os.path.getsize(cache._path(self.key(0)))
+        os.remove(cache._path(self.key(0)))
+
+        cache = TemplateCache(self.directory, max_size=int(2.5 * size))
+        now = time.time() - 100
+        keys = [self.key(i) for i in range(1, 5)]
+        for i, key in enumerate(keys):
+            cache.put(key, self.htilde)
+            os.utime(cache._path(key), (now + i, now + i))
+            remaining = [os.path.exists(cache._path(k)) for k in keys]
+            self.assertTrue(sum(remaining) <= 2)
+
+        # The least recently used templates are removed first
+        self.assertEqual(remaining, [False, False, True, True])
+        self.assertEqual(cache.evictions, 2)
+
+        # Reading a template marks it as recently used
+        out = zeros(self.length, dtype=numpy.complex64)
+        cache.get(keys[2], out, self.delta_f)
+        cache.put(keys[0], self.htilde)
+        self.assertTrue(os.path.exists(cache._path(keys[2])))
+        self.assertFalse(os.path.exists(cache._path(keys[3])))
+
+
+class TestPSDTemplateStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        numpy.random.seed(1)
+        self.psd = FrequencySeries(numpy.random.uniform(1, 2, size=513),
+                                   delta_f=0.25)
+        self.key = (1234, 'SEOBNRv4_ROM', 20.0, 20.0, 1024.0, 513, 0.25,
+                    repr(sorted({'phase_order': -1}.items())), (False, None))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_load(self):
+        store = PSDTemplateStore()
+        vec = numpy.random.uniform(size=513)
+        bins = numpy.array([0, 10, 50, 200, 513])
+        store.put('sigmasq', self.psd, self.key, 3.5)
+        store.put('sigmasq_vec', self.psd, ('SPAtmplt', 20.0), vec)
+        store.put('chisq_bins', self.psd, self.key + (4,), bins)
+        filename = os.path.join(self.directory, 'store.hdf')
+        store.save(filename)
+
+        loaded = PSDTemplateStore()
+        loaded.load(filename)
+        self.assertEqual(len(loaded.data), 3)
+        sigmasq = loaded.get('sigmasq', self.psd, self.key)
+        self.assertTrue(numpy.isscalar(sigmasq))
+        self.assertEqual(sigmasq, 3.5)
+        numpy.testing.assert_array_equal(
+            loaded.get('sigmasq_vec', self.psd, ('SPAtmplt', 20.0)), vec)
+        numpy.testing.assert_array_equal(
+            loaded.get('chisq_bins', self.psd, self.key + (4,)), bins)
+        self.assertEqual(loaded.hits, 3)
+
+        # A different PSD or template setting is not found
+        other_psd = FrequencySeries(self.psd.numpy() * 2, delta_f=0.25)
+        self.assertIsNone(loaded.get('sigmasq', other_psd, self.key))
+        other_key = self.key[:-2] + (repr(sorted({'phase_order': 4}.items())),
+                                     (False, None))
+        self.assertIsNone(loaded.get('sigmasq', self.psd, other_key))
+        self.assertEqual(loaded.misses, 2)
+        self.assertRaises(ValueError, loaded.get, 'snr', self.psd, self.key)
+
+    def test_size_limit(self):
+        store = PSDTemplateStore(size_limit=3)
+        for i in range(3):
+            store.put('sigmasq', self.psd, (i,), float(i))
+        # Using a value keeps it in the store
+        self.assertEqual(store.get('sigmasq', self.psd, (0,)), 0.0)
+        store.put('sigmasq', self.psd, (3,), 3.0)
+        self.assertEqual(len(store.data), 3)
+        self.assertIsNone(store.get('sigmasq', self.psd, (1,)))
+        for i in [0, 2, 3]:
+            self.assertEqual(store.get('sigmasq', self.psd, (i,)), float(i))
+
+        # Loading a file also keeps only the most recent values
+        filename = os.path.join(self.directory, 'store.hdf')
+        store.save(filename)
+        small = PSDTemplateStore(size_limit=2)
+        small.load(filename)
+        self.assertEqual(len(small.data), 2)
+        self.assertIsNone(small.get('sigmasq', self.psd, (0,)))
+
+    def test_merge(self):
+        store = PSDTemplateStore(size_limit=4)
+        store.put('sigmasq', self.psd, (0,), 0.0)
+        store.new_values()
+
+        # A copy of the store, as held by a forked worker process, finds
+        # new values which are returned to the parent store
+        worker = pickle.loads(pickle.dumps(store))
+        bins = numpy.array([0, 10, 513])
+        worker.put('sigmasq', self.psd, (1,), 1.0)
+        worker.put('chisq_bins', self.psd, (2,), bins)
+        worker.put('sigmasq', self.psd, (1,), 1.5)
+        values = pickle.loads(pickle.dumps(worker.new_values()))
+        self.assertEqual(len(values), 2)
+        self.assertEqual(len(worker.new_values()), 0)
+
+        store.put('sigmasq', self.psd, (3,), 3.0)
+        store.merge(values)
+        self.assertEqual(len(store.data), 4)
+        self.assertEqual(store.get('sigmasq', self.psd, (1,)), 1.5)
+        numpy.testing.assert_array_equal(
+            store.get('chisq_bins', self.psd, (2,)), bins)
+
+        # The merged values are the most recently used
+        store.put('sigmasq', self.psd, (4,), 4.0)
+        store.put('sigmasq', self.psd, (5,), 5.0)
+        self.assertIsNone(store.get('sigmasq', self.psd, (0,)))
+        self.assertIsNone(store.get('sigmasq', self.psd, (3,)))
+        self.assertEqual(store.get('sigmasq', self.psd, (1,)), 1.5)
+
+class TestFilterBank(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'bank.hdf')
+        with h5py.File(self.filename, 'w') as f:
+            f['mass1'] = numpy.array([10.0, 12.0, 15.0])
+            f['mass2'] = numpy.array([10.0, 8.0, 5.0])
+            f['spin1z'] = numpy.zeros(3)
+            f['spin2z'] = numpy.zeros(3)
+        self.delta_f = 0.25
+        self.flen = 4097
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_templates_keeps_out(self):
+        out = zeros((self.flen - 1) * 2, dtype=numpy.complex64)
+        bank = FilterBank(self.filename, self.flen, self.delta_f,
+                          numpy.complex64, out=out, approximant='TaylorF2',
+                          low_frequency_cutoff=30.0)
+        outs = [zeros(len(out), dtype=numpy.complex64) for _ in range(2)]
+        templates = bank.get_templates([0, 1], outs)
+        kept = [t.numpy().copy() for t in templates]
+        self.assertIs(bank.out, out)
+
+        # Indexing the bank later writes to its own memory, and not to that
+        # of the templates just generated
+        htilde = bank[2]
+        self.assertTrue(out.numpy().any())
+        self.assertEqual(htilde.params.mass1, 15.0)
+        for template, data in zip(templates, kept):
+            numpy.testing.assert_array_equal(template.numpy(), data)
+        self.assertEqual(templates[1].params.mass1, 12.0)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestTemplateCache))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestPSDTemplateStore))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestFilterBank))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
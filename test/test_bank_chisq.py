@@ -0,0 +1,105 @@
+import logging
+import unittest
+import numpy
+
+from utils import parse_args_cpu_only, simple_exit
+
+import pycbc.psd
+from pycbc import DYN_RANGE_FAC
+from pycbc.types import FrequencySeries
+from pycbc.filter import sigmasq
+from pycbc.waveform import get_fd_waveform
+from pycbc.vetoes import template_overlaps, template_overlaps_batch
+
+parse_args_cpu_only("vetoes.bank_chisq")
+
+
+class _Params(object):
+    def __init__(self, mass1, mass2):
+        self.mass1 = mass1
+        self.mass2 = mass2
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestTemplateOverlaps(unittest.TestCase):
+    def setUp(self):
+        self.f_low = 20.0
+        delta_f = 0.25
+        flen = int(2048 / delta_f) + 1
+        self.psd = pycbc.psd.from_string('aLIGOZeroDetHighPower', flen,
+                                         delta_f, 15)
+        self.psd[0:int(15 / delta_f)] = self.psd[int(15 / delta_f)]
+        self.psd[flen - 1] = self.psd[flen - 2]
+        self.psd = (self.psd * DYN_RANGE_FAC ** 2).astype(numpy.float32)
+
+        def template(mass1, mass2):
+            hp, _ = get_fd_waveform(approximant='TaylorF2', mass1=mass1,
+                                    mass2=mass2, f_lower=self.f_low,
+                                    delta_f=delta_f)
+            hp.resize(flen)
+            h = FrequencySeries(hp * DYN_RANGE_FAC, delta_f=delta_f,
+                                dtype=numpy.complex64)
+            h.params = _Params(mass1, mass2)
+            norm = sigmasq(h, self.psd, low_frequency_cutoff=self.f_low)
+            h.sigmasq = lambda psd: norm
+            return h
+
+        self.bank_filters = [template(m1, m2) for m1, m2 in
+                             [(1.4, 1.4), (3.0, 2.0), (6.0, 1.4), (9.0, 9.0)]]
+        self.templates = [template(m1, m2) for m1, m2 in
+                          [(1.5, 1.3), (9.0, 9.0), (5.0, 5.0)]]
+
+        self.handler = _ListHandler()
+        self.logger = logging.getLogger()
+        self.level = self.logger.level
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+
+    def test_batch_matches_single(self):
+        batch = template_overlaps_batch(self.bank_filters, self.templates,
+                                        self.psd, self.f_low)
+        batch_messages = self.handler.messages
+        self.handler.messages = []
+
+        self.assertEqual(batch.shape,
+                         (len(self.templates), len(self.bank_filters)))
+        for row, template in zip(batch, self.templates):
+            single = template_overlaps(self.bank_filters, template,
+                                       self.psd, self.f_low)
+            numpy.testing.assert_allclose(row, numpy.array(single),
+                                          rtol=1e-4, atol=1e-5)
+
+        # The identical templates overlap fully, and are reported the same
+        # way by both functions
+        self.assertAlmostEqual(abs(batch[1, 3]), 1.0, places=4)
+        self.assertEqual(sum(abs(batch.flatten()) > 0.99), 1)
+        overlap_messages = [m for m in batch_messages
+                            if m.startswith('Overlap > 0.99')]
+        self.assertEqual(len(overlap_messages), 1)
+        self.assertIn('9.000000e+00 9.000000e+00', overlap_messages[0])
+        single_messages = [m for m in self.handler.messages
+                           if m.startswith('Overlap > 0.99')]
+        # The overlap on the last line may differ in the last digit
+        self.assertEqual([m.rsplit('\n', 1)[0] for m in single_messages],
+                         [m.rsplit('\n', 1)[0] for m in overlap_messages])
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestTemplateOverlaps))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
@@ -37,6 +37,7 @@ _scheme, _context = parse_args_all_schemes("correlate")
 from pycbc.vetoes.chisq_cpu import chisq_accum_bin_numpy
 from pycbc.vetoes import chisq_accum_bin, power_chisq_bins, power_chisq
 from pycbc.vetoes import power_chisq_at_points_from_precomputed
+from pycbc.vetoes import power_chisq_at_points_from_ifft, SingleDetPowerChisq
 from pycbc.filter import resample_to_delta_t, highpass
 from pycbc.catalog import Merger
 from pycbc.psd import interpolate, inverse_spectrum_truncation
@@ -125,9 +126,103 @@ class TestChisq(unittest.TestCase):
             max_diff = max(abs(chisq_full[ifo] - chisq_quick[ifo]))
             self.assertTrue(max_diff < 1E-5)
 
+    def test_chisq_methods(self):
+        nbins = 26
+        dof = nbins * 2 - 2
+        indices = numpy.arange(27402, 27492)
+        power_chisq_calc = SingleDetPowerChisq(nbins, method='auto')
+        for ifo in self.ifos:
+            bins = power_chisq_bins(self.hp, nbins, self.psd[ifo],
+                                    low_frequency_cutoff=20.0)
+            snrv = self.snr_unnorm[ifo][27402:27492].data
+            chisq_direct = power_chisq_at_points_from_precomputed(
+                self.corr[ifo], snrv, self.norm[ifo], bins, indices)
+            chisq_fft = power_chisq_at_points_from_ifft(
+                self.corr[ifo], snrv, self.norm[ifo], bins, indices)
+            max_diff = max(abs(chisq_direct - chisq_fft) / dof)
+            self.assertTrue(max_diff < 1E-5)
+
+            # A handful of points should use the direct sum, and many
+            # points a transform of each bin
+            costs = power_chisq_calc.method_costs(self.corr[ifo], bins, 10)
+            self.assertEqual(min(costs, key=costs.get), 'direct')
+            costs = power_chisq_calc.method_costs(self.corr[ifo], bins,
+                                                  len(self.corr[ifo]))
+            self.assertNotEqual(min(costs, key=costs.get), 'direct')
+
+        self.assertRaises(ValueError, SingleDetPowerChisq, nbins,
+                          method='unknown')
+
+
+class TestPrunedChisq(unittest.TestCase):
+    def setUp(self, *args):
+        self.context = _context
+        self.scheme = _scheme
+        # A single precision, power of two length correlation vector with
+        # power in a band of frequencies, as from a template and data
+        numpy.random.seed(3)
+        n = 2 ** 16
+        corr = numpy.zeros(n, dtype=numpy.complex64)
+        corr[300:20000] = numpy.random.normal(size=19700) + \
+                          1j * numpy.random.normal(size=19700)
+        self.corr = Array(corr)
+        self.bins = numpy.linspace(300, 20000, 17).astype(int)
+        self.indices = numpy.array([0, 7, 1000, 12345, 40000, n - 1],
+                                   dtype=numpy.uint32)
+        snr = numpy.fft.ifft(corr) * n
+        self.snrv = snr[self.indices].astype(numpy.complex64)
+
+    def test_pruned_chisq(self):
+        if self.scheme != 'cpu':
+            return
+        with self.context:
+            dof = len(self.bins) * 2 - 2
+            chisq_direct = power_chisq_at_points_from_precomputed(
+                self.corr, self.snrv, 1.0, self.bins, self.indices)
+            chisq_pruned = power_chisq_at_points_from_ifft(
+                self.corr, self.snrv, 1.0, self.bins, self.indices,
+                pruned=True)
+            chisq_fft = power_chisq_at_points_from_ifft(
+                self.corr, self.snrv, 1.0, self.bins, self.indices)
+            scale = abs(chisq_direct).max()
+            self.assertTrue(max(abs(chisq_direct - chisq_pruned) / scale)
+                            < 1E-4)
+            self.assertTrue(max(abs(chisq_direct - chisq_fft) / scale)
+                            < 1E-4)
+
+            # The automatic choice uses the direct sum for a few points,
+            # and the pruned FFT once there are many
+            power_chisq_calc = SingleDetPowerChisq(16, method='auto')
+            self.assertTrue(power_chisq_calc.pruned_available(self.corr))
+            power_chisq_calc.chisq_at_points(self.corr, self.snrv, 1.0,
+                                             self.bins, self.indices)
+            self.assertEqual(power_chisq_calc.timing['direct']['calls'], 1)
+
+            indices = numpy.arange(0, len(self.corr), 64, dtype=numpy.uint32)
+            costs = power_chisq_calc.method_costs(self.corr, self.bins,
+                                                  len(indices))
+            self.assertEqual(min(costs, key=costs.get), 'pruned')
+            snrv = (numpy.fft.ifft(self.corr.numpy()) *
+                    len(self.corr))[indices].astype(numpy.complex64)
+            chisq_auto = power_chisq_calc.chisq_at_points(
+                self.corr, snrv, 1.0, self.bins, indices)
+            self.assertEqual(power_chisq_calc.timing['pruned']['calls'], 1)
+            chisq_direct = power_chisq_at_points_from_precomputed(
+                self.corr, snrv, 1.0, self.bins, indices)
+            scale = abs(chisq_direct).max()
+            self.assertTrue(max(abs(chisq_direct - chisq_auto) / scale)
+                            < 1E-4)
+
+            # It is not available for other lengths
+            self.assertFalse(power_chisq_calc.pruned_available(
+                self.corr[:len(self.corr) - 1]))
+            self.assertNotIn('pruned', power_chisq_calc.method_costs(
+                self.corr[:len(self.corr) - 1], self.bins, len(indices)))
+
 
 suite = unittest.TestSuite()
 suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestChisq))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestPrunedChisq))
 
 if __name__ == '__main__':
     results = unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,980 @@
+import argparse
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy
+import h5py
+import lal
+
+from utils import parse_args_cpu_only, simple_exit
+
+from pycbc.events.coinc import MultiRingBuffer, CoincExpireBuffer
+from pycbc.events.coinc import SortedValues, BackgroundNLouder
+from pycbc.events.coinc import calculate_n_louder
+from pycbc.events.coinc import calculate_n_louder_chunked
+from pycbc.events.coinc import cluster_over_time, time_coincidence
+from pycbc.events.coinc import time_coincidence_chunks
+from pycbc.events.coinc import LiveCoincTimeslideBackgroundEstimator
+from pycbc.events.coinc import LiveCoincTimeslideBackgroundEstimatorMultiifo
+from pycbc.events.coinc import time_multi_coincidence
+from pycbc.events.coinc import _grouped_time_multi_coincidence
+import pycbc.events.coinc
+
+parse_args_cpu_only("events.coinc")
+
+
+class ReferenceRings(object):
+    """The ring buffers kept as a list of arrays, one per ring"""
+    def __init__(self, num_rings, max_time):
+        self.max_time = max_time
+        self.buffer = [numpy.zeros(0, dtype=numpy.float32)
+                       for _ in range(num_rings)]
+        self.buffer_expire = [numpy.zeros(0, dtype=int)
+                              for _ in range(num_rings)]
+        self.time = 0
+
+    def add(self, indices, values):
+        for i, v in zip(indices, values):
+            self.buffer[i] = numpy.append(self.buffer[i], v)
+            self.buffer_expire[i] = numpy.append(self.buffer_expire[i],
+                                                 self.time)
+        self.time += 1
+
+    def discard_last(self, indices):
+        for i in indices:
+            self.buffer[i] = self.buffer[i][:-1]
+            self.buffer_expire[i] = self.buffer_expire[i][:-1]
+
+    def data(self, i):
+        keep = self.buffer_expire[i] >= self.time - self.max_time
+        self.buffer[i] = self.buffer[i][keep]
+        self.buffer_expire[i] = self.buffer_expire[i][keep]
+        return self.buffer[i]
+
+
+class TestMultiRingBuffer(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(0)
+        self.num_rings = 40
+        self.max_time = 15
+
+    def check_equal(self, ring, ref):
+        for i in range(self.num_rings):
+            numpy.testing.assert_array_equal(ring.data(i), ref.data(i))
+            numpy.testing.assert_array_equal(ring.expire_vector(i),
+                                             ref.buffer_expire[i])
+        self.assertEqual(ring.num_elements(),
+                         sum(len(b) for b in ref.buffer))
+
+    def test_random_updates(self):
+        ring = MultiRingBuffer(self.num_rings, self.max_time,
+                               numpy.float32, initial_capacity=1)
+        ref = ReferenceRings(self.num_rings, self.max_time)
+
+        compactions = []
+        compact = ring._compact
+        def counted_compact(size):
+            compactions.append(size)
+            compact(size)
+        ring._compact = counted_compact
+
+        for step in range(300):
+            # Busy rings fill their blocks, and the number of triggers
+            # changes over time so that blocks are moved and the array is
+            # compacted repeatedly
+            rate = 5 + 60 * (step // 50 % 2)
+            num = numpy.random.randint(0, rate)
+            indices = numpy.random.randint(0, self.num_rings, size=num)
+            values = numpy.random.uniform(size=num).astype(numpy.float32)
+            ring.add(indices, values)
+            ref.add(indices, values)
+
+            action = numpy.random.randint(0, 4)
+            if action == 0 and num:
+                # Back out the latest update for a subset of the rings
+                discard = numpy.unique(indices)[:3]
+                ring.discard_last(discard)
+                ref.discard_last(discard)
+            elif action == 1:
+                ring.advance_time()
+                ref.time += 1
+            elif action == 2:
+                rings = numpy.random.randint(0, self.num_rings, size=10)
+                data, expire, lengths = ring.data_many(rings)
+                self.assertEqual(len(lengths), len(rings))
+                numpy.testing.assert_array_equal(
+                    data, numpy.concatenate([ref.data(i) for i in rings]))
+                numpy.testing.assert_array_equal(
+                    expire, numpy.concatenate([ref.buffer_expire[i]
+                                               for i in rings]))
+                numpy.testing.assert_array_equal(
+                    lengths, [len(ref.buffer[i]) for i in rings])
+
+            if step % 25 == 0:
+                self.check_equal(ring, ref)
+
+        self.check_equal(ring, ref)
+        self.assertTrue(len(compactions) > 2)
+
+    def test_old_state(self):
+        # The pickled state of a buffer with a separate array for each ring
+        ref = ReferenceRings(self.num_rings, self.max_time)
+        for _ in range(40):
+            num = numpy.random.randint(0, 20)
+            indices = numpy.random.randint(0, self.num_rings, size=num)
+            ref.add(indices, numpy.random.uniform(size=num))
+        ref.buffer[3] = numpy.zeros(0, dtype=numpy.float32)
+        ref.buffer_expire[3] = numpy.zeros(0, dtype=int)
+        state = {'max_time': ref.max_time, 'time': ref.time,
+                 'buffer': [b.copy() for b in ref.buffer],
+                 'buffer_expire': [e.copy() for e in ref.buffer_expire]}
+
+        ring = MultiRingBuffer.__new__(MultiRingBuffer)
+        ring.__setstate__(state)
+        self.assertEqual(ring.time, ref.time)
+        self.check_equal(ring, ref)
+
+        # The restored buffer can be updated as usual
+        indices = numpy.arange(self.num_rings)
+        values = numpy.random.uniform(size=self.num_rings)
+        ring.add(indices, values)
+        ref.add(indices, values)
+        self.check_equal(ring, ref)
+
+        # The state of the current layout is restored as is
+        copy = MultiRingBuffer.__new__(MultiRingBuffer)
+        copy.__setstate__(dict(ring.__dict__))
+        self.check_equal(copy, ref)
+
+
+class ReferenceCoincs(object):
+    """The coinc buffer as a plain array scanned on every update"""
+    def __init__(self, expiration, ifos):
+        self.expiration = expiration
+        self.values = numpy.zeros(0, dtype=numpy.float32)
+        self.time = dict((ifo, 0) for ifo in ifos)
+        self.timer = dict((ifo, numpy.zeros(0, dtype=int)) for ifo in ifos)
+
+    def add(self, values, times, ifos):
+        for ifo in ifos:
+            self.time[ifo] += 1
+        self.values = numpy.append(self.values,
+                                   numpy.array(values, dtype=numpy.float32))
+        for ifo in self.timer:
+            self.timer[ifo] = numpy.append(self.timer[ifo],
+                                           times[ifo] if len(values) else [])
+        keep = numpy.ones(len(self.values), dtype=bool)
+        for ifo in ifos:
+            keep &= self.timer[ifo] >= self.time[ifo] - self.expiration
+        self.values = self.values[keep]
+        for ifo in self.timer:
+            self.timer[ifo] = self.timer[ifo][keep]
+
+    def remove(self, num):
+        self.values = self.values[:len(self.values) - num]
+        for ifo in self.timer:
+            self.timer[ifo] = self.timer[ifo][:len(self.timer[ifo]) - num]
+
+    def num_greater(self, value):
+        # Compare in double precision
+        return (self.values.astype(numpy.float64) > value).sum()
+
+
+class TestCoincExpireBuffer(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(1)
+        self.ifos = ['H1', 'L1']
+        self.expiration = 6
+
+    def check_counts(self, coincs, ref):
+        self.assertEqual(len(coincs), len(ref.values))
+        numpy.testing.assert_array_equal(numpy.sort(coincs.data),
+                                         numpy.sort(ref.values))
+        values, louder = coincs.louder_counts()
+        numpy.testing.assert_array_equal(values, numpy.sort(ref.values))
+        numpy.testing.assert_array_equal(
+            louder, [ref.num_greater(v) for v in values])
+
+        # Values between, equal to and just either side of the stored ones
+        tests = list(numpy.random.uniform(-0.5, 10.5, size=20))
+        for v in ref.values[:10]:
+            v = float(v)
+            tests += [v, numpy.nextafter(v, -numpy.inf),
+                      numpy.nextafter(v, numpy.inf)]
+        for value in tests:
+            self.assertEqual(coincs.num_greater(value),
+                             ref.num_greater(value))
+        self.assertEqual(coincs.num_greater(tests),
+                         sum(ref.num_greater(v) for v in tests))
+
+    def test_random_updates(self):
+        coincs = CoincExpireBuffer(self.expiration, self.ifos,
+                                   initial_size=16)
+        # Small buckets so that they are split and rebuilt
+        coincs.sorted = SortedValues(bucket_size=8)
+        ref = ReferenceCoincs(self.expiration, self.ifos)
+
+        for step in range(400):
+            num = numpy.random.randint(0, 12)
+            # Repeat some values to test ties
+            values = numpy.round(numpy.random.uniform(0, 10, size=num), 1)
+            times = dict((ifo, ref.time[ifo] -
+                          numpy.random.randint(0, 3, size=num))
+                         for ifo in self.ifos)
+            ifos = [ifo for ifo in self.ifos if numpy.random.uniform() < 0.8]
+            coincs.add(values, times, ifos)
+            ref.add(values, times, ifos)
+
+            action = numpy.random.randint(0, 5)
+            if action == 0 and num:
+                # Back out some of the coincs just added
+                backout = numpy.random.randint(1, num + 1)
+                coincs.remove(backout)
+                ref.remove(backout)
+            elif action == 1:
+                ifos = self.ifos[:numpy.random.randint(1, 3)]
+                coincs.increment(ifos)
+                ref.add([], {}, ifos)
+
+            if step % 20 == 0:
+                self.check_counts(coincs, ref)
+        self.check_counts(coincs, ref)
+
+    def test_rounding(self):
+        # A double precision statistic which rounds up to a stored single
+        # precision value is still below it
+        coincs = CoincExpireBuffer(self.expiration, self.ifos)
+        coincs.add(numpy.array([10.0, 10.0, 20.0]),
+                   dict((ifo, numpy.zeros(3)) for ifo in self.ifos),
+                   self.ifos)
+        self.assertEqual(numpy.float32(9.99999999), 10.0)
+        self.assertEqual(coincs.num_greater(9.99999999), 3)
+        self.assertEqual(coincs.num_greater(10.0), 1)
+        self.assertEqual(coincs.num_greater(10.00000001), 1)
+        self.assertEqual(coincs.num_greater(numpy.float32(10.0)), 1)
+
+
+class TestBackgroundNLouder(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(2)
+        size = 2000
+        self.bstat = numpy.random.permutation(
+            numpy.linspace(5, 20, size)).astype(numpy.float32)
+        self.dec = numpy.random.choice([1, 100], size=size)
+        # Foreground below, among and above the background
+        self.fstat = numpy.concatenate([[1.0, 5.0], self.bstat[:50],
+                                        numpy.random.uniform(4, 21, 50),
+                                        [20.0, 25.0]])
+
+    def test_removal(self):
+        nlouder = BackgroundNLouder(self.bstat, self.dec)
+        alive = numpy.ones(len(self.bstat), dtype=bool)
+        # Remove random subsets, including the quietest background events
+        # and some already removed
+        removals = [numpy.argsort(self.bstat)[:3]]
+        removals += [numpy.random.randint(0, len(self.bstat), size=n)
+                     for n in [1, 10, 200, 500, 1000]]
+        for idx in removals:
+            nlouder.remove(idx)
+            alive[idx] = False
+            back, fore = calculate_n_louder(self.bstat[alive], self.fstat,
+                                            self.dec[alive])
+            numpy.testing.assert_array_equal(nlouder.foreground(self.fstat),
+                                             fore)
+            numpy.testing.assert_array_equal(nlouder.background(), back)
+            self.assertEqual(nlouder.foreground(self.fstat[7]), fore[7])
+
+        # With no background left, nothing is louder
+        nlouder.remove(numpy.arange(len(self.bstat)))
+        numpy.testing.assert_array_equal(nlouder.foreground(self.fstat),
+                                         numpy.zeros(len(self.fstat)))
+        self.assertEqual(nlouder.foreground(10.0), 0)
+        self.assertEqual(len(nlouder.background()), 0)
+
+
+class TestChunkedNLouder(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(3)
+        self.directory = tempfile.mkdtemp()
+        size = 1000
+        self.bstat = numpy.random.permutation(
+            numpy.linspace(5, 20, size)).astype(numpy.float32)
+        self.dec = numpy.random.choice([1, 100], size=size)
+        self.fstat = numpy.concatenate([
+            # Below and equal to the quietest background
+            [1.0, self.bstat.min()],
+            # Equal to, and among, the background values
+            self.bstat[:20], numpy.random.uniform(5, 20, 100),
+            # Above all the background
+            [self.bstat.max(), 30.0]])
+        self.fstat = numpy.random.permutation(self.fstat)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_arrays(self):
+        back, fore = calculate_n_louder(self.bstat, self.fstat, self.dec)
+        for chunk_size in [16, 64, 333, 5000]:
+            back_chunked = numpy.zeros(len(self.bstat), dtype=self.dec.dtype)
+            fore_chunked = calculate_n_louder_chunked(
+                self.bstat, self.fstat, self.dec, back_cum_num=back_chunked,
+                chunk_size=chunk_size, tmpdir=self.directory)
+            numpy.testing.assert_array_equal(fore_chunked, fore)
+            numpy.testing.assert_array_equal(back_chunked, back)
+
+    def test_scalar(self):
+        for value in [1.0, self.bstat.min(), self.bstat[5], 12.345, 30.0]:
+            fore = calculate_n_louder(self.bstat, value, self.dec,
+                                      skip_background=True)
+            fore_chunked = calculate_n_louder_chunked(
+                self.bstat, value, self.dec, chunk_size=16)
+            self.assertEqual(numpy.ndim(fore_chunked), 0)
+            self.assertEqual(fore_chunked, fore)
+
+    def test_quiet_foreground(self):
+        # Foreground below all the background does not count the quietest
+        # background event
+        fstat = numpy.array([0.5, 1.0, 2.0])
+        back, fore = calculate_n_louder(self.bstat, fstat, self.dec)
+        fore_chunked = calculate_n_louder_chunked(self.bstat, fstat,
+                                                  self.dec, chunk_size=10)
+        numpy.testing.assert_array_equal(fore_chunked, fore)
+        quietest = self.bstat.argmin()
+        self.assertTrue((fore_chunked ==
+                         self.dec.sum() - self.dec[quietest]).all())
+
+    def test_datasets(self):
+        back, fore = calculate_n_louder(self.bstat, self.fstat, self.dec)
+        filename = os.path.join(self.directory, 'background.hdf')
+        with h5py.File(filename, 'w') as f:
+            f['stat'] = self.bstat
+            f['decimation_factor'] = self.dec
+            f.create_dataset('back_cum_num', shape=(len(self.bstat),),
+                             dtype=self.dec.dtype)
+            fore_chunked = calculate_n_louder_chunked(
+                f['stat'], self.fstat, f['decimation_factor'],
+                back_cum_num=f['back_cum_num'], chunk_size=50,
+                tmpdir=self.directory)
+            numpy.testing.assert_array_equal(fore_chunked, fore)
+            numpy.testing.assert_array_equal(f['back_cum_num'][:], back)
+
+        # Only the output file is left behind
+        self.assertEqual(os.listdir(self.directory), ['background.hdf'])
+
+def random_live_singles(ifos, num_templates, start, duration,
+                        time_step=None, num=(20, 60)):
+    """Random single triggers of each ifo in the format given to
+    LiveCoincTimeslideBackgroundEstimator.add_singles. If time_step is
+    given the end times are multiples of it, so that many are equal.
+    """
+    results = {}
+    for ifo in ifos:
+        size = numpy.random.randint(*num)
+        results[ifo] = {
+            'snr': numpy.random.uniform(5, 12, size).astype(numpy.float32),
+            'chisq': numpy.random.uniform(0.5, 2, size).astype(
+                numpy.float32),
+            'chisq_dof': numpy.random.randint(
+                10, 20, size).astype(numpy.float32),
+            'end_time': numpy.sort(numpy.random.uniform(
+                start, start + duration, size)),
+            'template_id': numpy.random.randint(
+                0, num_templates, size).astype(numpy.uint32)}
+        if time_step:
+            results[ifo]['end_time'] = start + time_step * numpy.floor(
+                (results[ifo]['end_time'] - start) / time_step)
+    return results
+
+
+class TestLiveCheckpoint(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(5)
+        self.ifos = ['H1', 'L1']
+        self.num_templates = 6
+        self.analysis_block = 8
+        # Keep about four analysis blocks of background, so that some of
+        # the buffered singles and coincidences expire
+        parser = argparse.ArgumentParser()
+        LiveCoincTimeslideBackgroundEstimator.insert_args(parser)
+        self.args = parser.parse_args(['--background-ifar-limit', '3e-4',
+                                       '--timeslide-interval', '0.1'])
+        self.estimator = self.from_cli(self.ifos)
+        self.step = 0
+
+    def from_cli(self, ifos):
+        return LiveCoincTimeslideBackgroundEstimator.from_cli(
+            self.args, self.num_templates, self.analysis_block, ifos)
+
+    def results(self):
+        """Random single triggers for the next analysis block"""
+        start = 1e9 + self.step * self.analysis_block
+        self.step += 1
+        return random_live_singles(self.ifos, self.num_templates, start,
+                                   self.analysis_block)
+
+    def checkpoint(self):
+        f = h5py.File('checkpoint', 'w', driver='core', backing_store=False)
+        self.estimator.save_checkpoint(f.create_group('background'))
+        return f
+
+    def check_equal(self, loaded):
+        for ifo in self.ifos:
+            ring, loaded_ring = self.estimator.singles[ifo], loaded.singles[ifo]
+            self.assertEqual(ring.time, loaded_ring.time)
+            for i in range(self.num_templates):
+                numpy.testing.assert_array_equal(ring.data(i),
+                                                 loaded_ring.data(i))
+                numpy.testing.assert_array_equal(ring.expire_vector(i),
+                                                 loaded_ring.expire_vector(i))
+
+        coincs, loaded_coincs = self.estimator.coincs, loaded.coincs
+        self.assertEqual(len(coincs), len(loaded_coincs))
+        numpy.testing.assert_array_equal(coincs.data, loaded_coincs.data)
+        alive = numpy.flatnonzero(coincs.alive[:coincs.end])
+        loaded_alive = numpy.flatnonzero(
+            loaded_coincs.alive[:loaded_coincs.end])
+        for ifo in self.ifos:
+            self.assertEqual(coincs.time[ifo], loaded_coincs.time[ifo])
+            numpy.testing.assert_array_equal(
+                coincs.timer[ifo][alive],
+                loaded_coincs.timer[ifo][loaded_alive])
+
+        self.assertEqual(self.estimator.background_time,
+                         loaded.background_time)
+        values = numpy.concatenate([coincs.data[:10], [0.0, 5.5, 100.0]])
+        for value in values:
+            self.assertEqual(self.estimator.ifar(value), loaded.ifar(value))
+
+    def test_round_trip(self):
+        for _ in range(7):
+            self.estimator.add_singles(self.results())
+        self.assertTrue(len(self.estimator.coincs) > 0)
+
+        with self.checkpoint() as f:
+            loaded = self.from_cli(self.ifos)
+            loaded.load_checkpoint(f['background'])
+        self.check_equal(loaded)
+
+        # Both estimators carry on in the same way, expiring the restored
+        # triggers as they go
+        for _ in range(5):
+            results = self.results()
+            original = self.estimator.add_singles(results)
+            restored = loaded.add_singles(results)
+            self.assertEqual(sorted(original.keys()), sorted(restored.keys()))
+            for key in original:
+                numpy.testing.assert_array_equal(original[key],
+                                                 restored[key])
+        self.check_equal(loaded)
+
+    def test_rejection(self):
+        for _ in range(3):
+            self.estimator.add_singles(self.results())
+
+        with self.checkpoint() as f:
+            group = f['background']
+            self.assertRaises(ValueError,
+                              self.from_cli(['H1', 'V1']).load_checkpoint,
+                              group)
+
+            group.attrs['checkpoint_version'] = 0
+            loaded = self.from_cli(self.ifos)
+            self.assertRaises(ValueError, loaded.load_checkpoint, group)
+            # A rejected checkpoint leaves the estimator untouched
+            self.assertEqual(loaded.singles, {})
+            self.assertEqual(len(loaded.coincs), 0)
+
+class TestClusterOverTime(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(8)
+
+    def check_clusters(self, stat, time, window):
+        # A different argmax function forces the scan over the windows
+        scan = cluster_over_time(stat, time, window,
+                                 argmax=lambda x: numpy.argmax(x))
+        fast = cluster_over_time(stat, time, window)
+        numpy.testing.assert_array_equal(fast, scan)
+        return fast
+
+    def test_ties(self):
+        for size in [1, 2, 10, 200, 3000]:
+            # Few distinct values, so many stats and times are tied
+            stat = numpy.random.randint(0, 5, size).astype(numpy.float32)
+            time = numpy.random.randint(0, size // 4 + 1, size) * 0.5
+            for window in [0.25, 0.5, 1.0, 2.2, 50.0]:
+                self.check_clusters(stat, time, window)
+
+    def test_random(self):
+        stat = numpy.random.uniform(5, 20, 10000)
+        time = numpy.random.uniform(1e9, 1e9 + 1e4, 10000)
+        for window in [1e-3, 0.3, 10.0, 2e4]:
+            cidx = self.check_clusters(stat, time, window)
+            self.assertEqual(len(numpy.unique(cidx)), len(cidx))
+        # The whole span clusters to the loudest event
+        numpy.testing.assert_array_equal(cidx, [stat.argmax()])
+
+class ReferenceLiveEstimator(LiveCoincTimeslideBackgroundEstimator):
+    """Find the coincidences of each new single trigger on its own, as
+    the live coincidence search did before the triggers were batched
+    """
+    def _pair_singles(self, results, ifos):
+        cstat = [[]]
+        offsets = []
+        ctimes = {self.ifos[0]: [], self.ifos[1]: []}
+        single_expire = {self.ifos[0]: [], self.ifos[1]: []}
+        template_ids = [[]]
+        trigger_ids = {self.ifos[0]: [[]], self.ifos[1]: [[]]}
+
+        for ifo in ifos:
+            trigs = results[ifo]
+            oifo = self.ifos[1] if self.ifos[0] == ifo else self.ifos[0]
+            templates = numpy.array(trigs['template_id'])
+            for i in range(len(trigs['end_time'])):
+                trig_time = trigs['end_time'][i]
+                template = templates[i]
+                times = self.singles[oifo].data(template)['end_time']
+                stats = self.singles[oifo].data(template)['stat']
+
+                i1, _, slide = time_coincidence(
+                    times, numpy.array(trig_time, ndmin=1,
+                                       dtype=numpy.float64),
+                    self.time_window, self.timeslide_interval)
+                trig_stat = numpy.resize(trigs['stat'][i], len(i1))
+                c = self.stat_calculator.coinc(stats[i1], trig_stat, slide,
+                                               self.timeslide_interval)
+                offsets.append(slide)
+                cstat.append(c)
+                ctimes[oifo].append(times[i1])
+                ctimes[ifo].append(numpy.repeat(
+                    numpy.float64(trig_time), len(c)))
+                single_expire[oifo].append(
+                    self.singles[oifo].expire_vector(template)[i1])
+                single_expire[ifo].append(numpy.repeat(
+                    numpy.int32(self.singles[ifo].time - 1), len(c)))
+
+                # The new trigger is counted back from the end of the
+                # buffer, past the later new triggers of its template
+                template_ids.append(numpy.repeat(template, len(c)))
+                trigger_ids[oifo].append(i1)
+                trigger_ids[ifo].append(numpy.repeat(
+                    -(templates[i:] == template).sum(), len(c)))
+
+        cstat = numpy.concatenate(cstat)
+        template_ids = numpy.concatenate(template_ids).astype(numpy.int32)
+        for ifo in self.ifos:
+            trigger_ids[ifo] = numpy.concatenate(
+                trigger_ids[ifo]).astype(numpy.int32)
+        return cstat, offsets, ctimes, single_expire, template_ids, trigger_ids
+
+
+class TestLiveCoincs(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(9)
+        self.ifos = ['H1', 'L1']
+        self.num_templates = 5
+        self.analysis_block = 8
+        parser = argparse.ArgumentParser()
+        LiveCoincTimeslideBackgroundEstimator.insert_args(parser)
+        self.args = parser.parse_args(['--background-ifar-limit', '3e-4',
+                                       '--timeslide-interval', '0.1',
+                                       '--store-background'])
+
+    def pairs(self, estimator, results, ifos):
+        """The coincidences found for the new singles as sorted rows"""
+        cstat, offsets, ctimes, expire, template_ids, trigger_ids = \
+            estimator._pair_singles(results, ifos)
+        rows = numpy.zeros(len(cstat), dtype=[
+            ('template_id', int), ('time0', float), ('time1', float),
+            ('slide', int), ('stat', float), ('expire0', int),
+            ('expire1', int)])
+        if not len(cstat):
+            return rows
+        rows['template_id'] = template_ids
+        rows['stat'] = cstat
+        rows['slide'] = numpy.concatenate(offsets)
+        for n, ifo in enumerate(self.ifos):
+            rows['time%s' % n] = numpy.concatenate(ctimes[ifo])
+            rows['expire%s' % n] = numpy.concatenate(expire[ifo])
+
+            # The trigger ids point at the single triggers of the coincs
+            singles = estimator.singles[ifo]
+            for row, trig_id in zip(rows, trigger_ids[ifo]):
+                data = singles.data(row['template_id'])[trig_id]
+                self.assertEqual(data['end_time'], row['time%s' % n])
+        rows.sort()
+        return rows
+
+    def test_random_stream(self):
+        fast = LiveCoincTimeslideBackgroundEstimator.from_cli(
+            self.args, self.num_templates, self.analysis_block, self.ifos)
+        ref = ReferenceLiveEstimator.from_cli(
+            self.args, self.num_templates, self.analysis_block, self.ifos)
+
+        num_pairs = num_zerolag = 0
+        for step in range(12):
+            # End times on a coarse grid, so that many are equal within and
+            # between the ifos, with several triggers of each template
+            results = random_live_singles(
+                self.ifos, self.num_templates, 1e9 + step * 8, 8,
+                time_step=0.05, num=(0, 40))
+            if step == 3:
+                results.pop('H1')
+            ifos = [ifo for ifo in self.ifos if ifo in results]
+
+            fast_results = copy.deepcopy(results)
+            ref_results = copy.deepcopy(results)
+            fast._add_singles_to_buffer(fast_results, ifos)
+            ref._add_singles_to_buffer(ref_results, ifos)
+            if not fast.singles:
+                continue
+
+            fast_pairs = self.pairs(fast, fast_results, ifos)
+            numpy.testing.assert_array_equal(
+                fast_pairs, self.pairs(ref, ref_results, ifos))
+            num_pairs += len(fast_pairs)
+
+            num_fast, fast_coincs = fast._find_coincs(fast_results, ifos)
+            num_ref, ref_coincs = ref._find_coincs(ref_results, ifos)
+            self.assertEqual(num_fast, num_ref)
+            self.assertEqual(sorted(fast_coincs.keys()),
+                             sorted(ref_coincs.keys()))
+            for key in fast_coincs:
+                if key == 'background/stat':
+                    continue
+                numpy.testing.assert_array_equal(fast_coincs[key],
+                                                 ref_coincs[key])
+            num_zerolag += 'foreground/stat' in fast_coincs
+
+            # The background, which expires as the stream goes on
+            numpy.testing.assert_array_equal(numpy.sort(fast.coincs.data),
+                                             numpy.sort(ref.coincs.data))
+            for ifo in self.ifos:
+                numpy.testing.assert_array_equal(
+                    numpy.sort(fast.coincs.timer[ifo][:fast.coincs.end][
+                        fast.coincs.alive[:fast.coincs.end]]),
+                    numpy.sort(ref.coincs.timer[ifo][:ref.coincs.end][
+                        ref.coincs.alive[:ref.coincs.end]]))
+            self.assertEqual(fast.ifar(10.0), ref.ifar(10.0))
+
+        self.assertTrue(num_pairs > 500)
+        self.assertTrue(num_zerolag > 2)
+
+def _no_clustering(stat, *args, **kwds):
+    return numpy.arange(len(stat))
+
+
+class TestLiveMultiifo(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(10)
+        self.ifos = ['H1', 'L1', 'V1']
+        self.num_templates = 4
+        self.analysis_block = 8
+        self.slop = 0.002
+        parser = argparse.ArgumentParser()
+        LiveCoincTimeslideBackgroundEstimatorMultiifo.insert_args(parser)
+        self.options = ['--background-ifar-limit', '3e-4',
+                        '--timeslide-interval', '0.1']
+        self.args = parser.parse_args(self.options)
+        self.parser = parser
+
+    def results(self, step, ifos):
+        """Random singles where many V1 triggers are close to L1 ones, so
+        that there are triple coincidences
+        """
+        results = random_live_singles(ifos, self.num_templates,
+                                      1e9 + step * self.analysis_block,
+                                      self.analysis_block, num=(5, 30))
+        if 'L1' in results and 'V1' in results:
+            l1, v1 = results['L1'], results['V1']
+            num = min(len(l1['end_time']), len(v1['end_time'])) // 2
+            v1['template_id'][:num] = l1['template_id'][:num]
+            v1['end_time'][:num] = l1['end_time'][:num] + \
+                numpy.random.uniform(-0.01, 0.01, num)
+        return results
+
+    def window(self, ifo1, ifo2):
+        return LiveCoincTimeslideBackgroundEstimatorMultiifo(
+            1, 1, 'newsnr', [], self.ifos).time_window[ifo1, ifo2]
+
+    def test_grouped_multi_coincidence(self):
+        windows = {}
+        for ifo1 in self.ifos:
+            for ifo2 in self.ifos:
+                if ifo1 != ifo2:
+                    windows[ifo1, ifo2] = self.window(ifo1, ifo2)
+
+        for combo in [('H1', 'L1'), ('L1', 'H1'), ('H1', 'L1', 'V1'),
+                      ('V1', 'H1', 'L1')]:
+            for slide_step in [0, 0.1]:
+                times = {}
+                groups = {}
+                for ifo in combo:
+                    size = numpy.random.randint(0, 200)
+                    groups[ifo] = numpy.random.randint(0, 6, size)
+                    times[ifo] = 1e9 + numpy.random.uniform(0, 30, size)
+                # Some of the triggers are at the same time in every ifo
+                num = min(len(times[ifo]) for ifo in combo) // 3
+                for ifo in combo[1:]:
+                    groups[ifo][:num] = groups[combo[0]][:num]
+                    times[ifo][:num] = times[combo[0]][:num] + 0.001
+
+                ids, slide = _grouped_time_multi_coincidence(
+                    times, groups, combo, windows, slide_step=slide_step)
+                found = numpy.array(sorted(zip(slide,
+                    *[ids[ifo] for ifo in combo])), ndmin=2)
+
+                expected = []
+                for group in range(6):
+                    sel = {ifo: numpy.flatnonzero(groups[ifo] == group)
+                           for ifo in combo}
+                    if any(len(sel[ifo]) == 0 for ifo in combo):
+                        continue
+                    gids, gslide = time_multi_coincidence(
+                        {ifo: times[ifo][sel[ifo]] for ifo in combo},
+                        slide_step=slide_step, slop=self.slop,
+                        pivot=combo[0], fixed=combo[1])
+                    expected += zip(gslide,
+                                    *[sel[ifo][gids[ifo]] for ifo in combo])
+                expected = numpy.array(sorted(expected), ndmin=2)
+                self.assertTrue(len(expected) > 0)
+                numpy.testing.assert_array_equal(found, expected)
+
+    def buffered_background(self, estimator, combo):
+        """All the time slide coincidences of a combination of ifos among
+        the buffered singles, as rows of the statistic and the time each
+        single was added
+        """
+        rows = []
+        for template in range(self.num_templates):
+            data = {ifo: estimator.singles[ifo].data(template)
+                    for ifo in combo}
+            if any(len(data[ifo]) == 0 for ifo in combo):
+                continue
+            ids, slide = time_multi_coincidence(
+                {ifo: data[ifo]['end_time'] for ifo in combo},
+                slide_step=estimator.timeslide_interval, slop=self.slop,
+                pivot=combo[0], fixed=combo[1])
+            bkg = slide != 0
+            sngl = [(ifo, data[ifo]['stat'][ids[ifo][bkg]]) for ifo in combo]
+            if len(combo) == 2:
+                cstat = estimator.stat_calculator.coinc(
+                    sngl[0][1], sngl[1][1], slide[bkg],
+                    estimator.timeslide_interval)
+            else:
+                cstat = estimator.stat_calculator.coinc_multiifo(
+                    sngl, slide[bkg], estimator.timeslide_interval,
+                    to_shift=[-1] + [0] * (len(combo) - 1))
+            expire = [estimator.singles[ifo].expire_vector(template)[
+                ids[ifo][bkg]] for ifo in combo]
+            rows += zip(cstat, *expire)
+        return sorted(rows)
+
+    def stored_background(self, coincs, combo):
+        """The background coincidences in a buffer, as buffered_background"""
+        alive = numpy.flatnonzero(coincs.alive[:coincs.end])
+        return sorted(zip(coincs.buffer[alive],
+                          *[coincs.timer[ifo][alive] for ifo in combo]))
+
+    def check_stream(self, multi, pairs, num_steps):
+        combos = multi.combos
+        counts = dict((combo, 0) for combo in combos)
+        for step in range(num_steps):
+            ifos = list(self.ifos)
+            if step % 5 == 3:
+                ifos.remove(self.ifos[step % 3])
+            results = self.results(step, ifos)
+            multi.add_singles(copy.deepcopy(results))
+            for pair in pairs.values():
+                pair.add_singles(copy.deepcopy(results))
+
+            for combo in combos:
+                # The background held is every time slide coincidence of
+                # the singles which have not yet expired
+                stored = self.stored_background(multi.coincs[combo], combo)
+                expected = self.buffered_background(multi, combo)
+                self.assertEqual(len(stored), len(expected))
+                numpy.testing.assert_array_equal(stored, expected)
+                counts[combo] = max(counts[combo], len(stored))
+
+                stat = numpy.array([row[0] for row in expected])
+                for value in [0.0, numpy.median(stat) if len(stat) else 1.0,
+                              100.0]:
+                    louder = (stat > value).sum()
+                    self.assertAlmostEqual(
+                        multi.combo_ifar(combo, value),
+                        multi.combo_background_time(combo) / lal.YRJUL_SI /
+                        (louder + 1))
+
+                if len(combo) == 2:
+                    # An estimator of the pair alone finds the same
+                    # background, though it holds the coincidences of two
+                    # new singles twice, once from each ifo
+                    pair = pairs[tuple(sorted(combo))]
+                    pair_stored = self.stored_background(
+                        pair.coincs, combo)
+                    self.assertEqual(sorted(set(pair_stored)), stored)
+                    self.assertEqual(pair.background_time,
+                                     multi.combo_background_time(combo))
+        return counts
+
+    def test_estimator(self):
+        for options in [[], ['--pivot-ifo', 'L1', '--fixed-ifo', 'V1']]:
+            args = self.parser.parse_args(self.options + options)
+            with mock.patch.object(pycbc.events.coinc, 'cluster_coincs',
+                                   _no_clustering), \
+                    mock.patch.object(pycbc.events.coinc,
+                                      'cluster_coincs_multiifo',
+                                      _no_clustering):
+                multi = LiveCoincTimeslideBackgroundEstimatorMultiifo\
+                    .from_cli(args, self.num_templates, self.analysis_block,
+                              self.ifos)
+                pairs = {}
+                for combo in multi.combos:
+                    if len(combo) == 2:
+                        pairs[tuple(sorted(combo))] = \
+                            LiveCoincTimeslideBackgroundEstimator.from_cli(
+                                args, self.num_templates,
+                                self.analysis_block, list(combo))
+                counts = self.check_stream(multi, pairs, 12)
+
+            self.assertEqual(multi.combos[0][:2],
+                             tuple(options[1::2]) or ('H1', 'L1'))
+            self.assertEqual(len(multi.combos), 4)
+            for combo in multi.combos:
+                self.assertTrue(counts[combo] > 10)
+
+    def test_clustered_results(self):
+        # With clustering, the background is a part of all the
+        # coincidences, and the loudest zerolag coinc is reported
+        multi = LiveCoincTimeslideBackgroundEstimatorMultiifo.from_cli(
+            self.args, self.num_templates, self.analysis_block, self.ifos)
+        found = set()
+        for step in range(10):
+            results = multi.add_singles(self.results(step, self.ifos))
+            self.assertEqual(len(results), len(multi.combos))
+            for combo, result in zip(multi.combos, results):
+                self.assertTrue(result['coinc_possible'])
+                stored = self.stored_background(multi.coincs[combo], combo)
+                expected = self.buffered_background(multi, combo)
+                self.assertTrue(set(stored) <= set(expected))
+                self.assertEqual(result['background/count'], len(stored))
+                if 'foreground/stat' in result:
+                    found.add(result['foreground/type'])
+                    stat = result['foreground/stat']
+                    self.assertEqual(result['foreground/ifar'],
+                                     multi.combo_ifar(combo, stat))
+            best = multi.pick_best_coinc(results)
+            if 'foreground/ifar' in best:
+                self.assertIn(best['foreground/type'], found)
+        self.assertIn('L1-V1', found)
+
+
+class TestTimeCoincidence(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(15)
+        # Times on a grid of 1/64 s, so that the times folded by the slide
+        # step and moved by the window are exact, and the pairs at the
+        # window edges are tested
+        self.window = 4. / 64
+
+    def random_times(self, num, duration):
+        return 1e9 + numpy.random.randint(0, 64 * duration, num) / 64.
+
+    def brute_force(self, t1, t2, slide_step):
+        """ Every pair of triggers within the window, as in
+        time_coincidence the edge before the t1 trigger is included, and
+        the one after it is not
+        """
+        pairs = []
+        for i in range(len(t1)):
+            for j in range(len(t2)):
+                if slide_step:
+                    diff = t1[i] % slide_step - t2[j] % slide_step
+                    shifts = [-slide_step, 0, slide_step]
+                else:
+                    diff = t1[i] - t2[j]
+                    shifts = [0]
+                for shift in shifts:
+                    if -self.window < diff - shift <= self.window:
+                        slide = numpy.rint(t1[i] / slide_step -
+                                           t2[j] / slide_step) \
+                            if slide_step else 0
+                        pairs.append((i, j, slide))
+        return sorted(pairs)
+
+    def check(self, t1, t2, slide_step):
+        expected = self.brute_force(t1, t2, slide_step)
+        idx1, idx2, slide = time_coincidence(t1, t2, self.window,
+                                             slide_step=slide_step)
+        self.assertEqual(sorted(zip(idx1, idx2, slide)), expected)
+
+        for max_pairs in [1, 3, 50]:
+            chunks = list(time_coincidence_chunks(
+                t1, t2, self.window, slide_step=slide_step,
+                max_pairs=max_pairs))
+            self.assertTrue(len(chunks) >= 1)
+            for cidx1, _, _ in chunks:
+                # Only the matches of a single t1 trigger can be more
+                self.assertTrue(len(cidx1) <= max_pairs or
+                                len(numpy.unique(cidx1)) == 1)
+            for found, whole in zip(zip(*chunks), [idx1, idx2, slide]):
+                found = numpy.concatenate(found)
+                self.assertEqual(found.dtype, whole.dtype)
+                numpy.testing.assert_array_equal(found, whole)
+        return expected
+
+    def test_random(self):
+        for slide_step in [0, 1.0, 0.25]:
+            for num1, num2 in [(40, 50), (1, 200), (200, 1)]:
+                t1 = self.random_times(num1, 10)
+                t2 = self.random_times(num2, 10)
+                pairs = self.check(t1, t2, slide_step)
+                self.assertTrue(len(pairs) > 0)
+                if slide_step:
+                    self.assertTrue(len(set(p[2] for p in pairs)) > 5)
+
+    def test_empty(self):
+        times = self.random_times(10, 10)
+        empty = numpy.array([])
+        for slide_step in [0, 1.0]:
+            for t1, t2 in [(empty, times), (times, empty), (empty, empty)]:
+                self.assertEqual(self.check(t1, t2, slide_step), [])
+
+    def test_window_edges(self):
+        w = self.window
+        for slide_step in [0, 1.0]:
+            for start in [1e9, 1e9 + 1 - w / 2, 1e9 + 1 - w]:
+                # Triggers each side of the edges of the windows, also
+                # where the folded times are at the ends of the slide step
+                t1 = numpy.array([start])
+                t2 = start + numpy.array([-w - 1. / 64, -w, 0, w,
+                                          w + 1. / 64])
+                if slide_step:
+                    t2 = numpy.concatenate([t2 + 3, t2 - 2])
+                pairs = self.check(t1, t2, slide_step)
+                self.assertEqual([p[1] for p in pairs],
+                                 [1, 2] if not slide_step else
+                                 [1, 2, 6, 7])
+                self.check(t2, t1, slide_step)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestMultiRingBuffer))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestCoincExpireBuffer))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestBackgroundNLouder))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestChunkedNLouder))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestLiveCheckpoint))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+    TestClusterOverTime))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestLiveCoincs))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestLiveMultiifo))
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestTimeCoincidence))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
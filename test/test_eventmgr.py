@@ -0,0 +1,155 @@
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import h5py
+
+from utils import parse_args_cpu_only, simple_exit
+
+from pycbc.events import EventManager
+
+parse_args_cpu_only("events.eventmgr")
+
+
+class _Template(object):
+    def __init__(self, template_hash, template_duration):
+        self.template_hash = template_hash
+        self.template_duration = template_duration
+
+
+class TestEventManager(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(6)
+        self.directory = tempfile.mkdtemp()
+        self.opt = argparse.Namespace(
+            channel_name='H1:STRAIN', sample_rate=2048,
+            gps_start_time=1000000000, gps_end_time=1000000512,
+            segment_start_pad=64, segment_end_pad=16,
+            trig_start_time=None, trig_end_time=None,
+            chisq_threshold=None, chisq_bins='16', chisq_delta=0,
+            newsnr_threshold=5.0, keep_loudest_interval=None,
+            injection_window=None, psdvar_segment=8,
+            autochi_number_points=0, autochi_onesided=None,
+            autochi_two_phase=False, autochi_max_valued_dof=None)
+        self.out_types = {
+            'time_index': int,
+            'snr': numpy.complex64,
+            'chisq': numpy.float32,
+            'chisq_dof': int,
+            'bank_chisq': numpy.float32,
+            'bank_chisq_dof': int,
+            'cont_chisq': numpy.float32,
+            'psd_var_val': numpy.float32,
+            'sg_chisq': numpy.float32,
+        }
+        self.names = sorted(self.out_types.keys())
+
+        # The triggers of each template, with some templates without any
+        self.templates = []
+        for i in range(23):
+            num = numpy.random.choice([0, 1, 5, 40])
+            vals = {
+                'time_index': numpy.random.randint(0, 2048 * 512, num),
+                'snr': (numpy.random.uniform(4, 10, num) *
+                        numpy.exp(1j * numpy.random.uniform(0, 6, num))),
+                'chisq': numpy.random.uniform(10, 60, num),
+                'chisq_dof': numpy.repeat(30, num),
+                'bank_chisq': numpy.random.uniform(0, 20, num),
+                'bank_chisq_dof': numpy.repeat(10, num),
+                'cont_chisq': numpy.random.uniform(0, 5, num),
+                'psd_var_val': numpy.random.uniform(0.9, 1.1, num),
+                'sg_chisq': numpy.random.uniform(1, 2, num),
+            }
+            params = {'tmplt': _Template(numpy.random.randint(2 ** 62),
+                                         numpy.random.uniform(0.1, 100)),
+                      'sigmasq': numpy.random.uniform(1e3, 1e5)}
+            self.templates.append((params, vals))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def manager(self):
+        return EventManager(self.opt, self.names,
+                            [self.out_types[n] for n in self.names])
+
+    def filter_templates(self, mgr, templates):
+        for params, vals in templates:
+            mgr.new_template(**params)
+            if len(vals['snr']):
+                mgr.add_template_events(self.names,
+                                        [vals[n] for n in self.names])
+            mgr.finalize_template_events()
+
+    def write(self, mgr, name):
+        filename = os.path.join(self.directory, name)
+        mgr.consolidate_events(self.opt)
+        mgr.finalize_events()
+        mgr.write_events(filename)
+        return filename
+
+    def assert_files_equal(self, name1, name2):
+        with h5py.File(name1, 'r') as f1, h5py.File(name2, 'r') as f2:
+            names1, names2 = [], []
+            f1.visit(names1.append)
+            f2.visit(names2.append)
+            self.assertEqual(sorted(names1), sorted(names2))
+            for name in names1:
+                if isinstance(f1[name], h5py.Dataset):
+                    self.assertEqual(f1[name].dtype, f2[name].dtype)
+                    numpy.testing.assert_array_equal(f1[name][:],
+                                                     f2[name][:])
+
+    def serial_file(self):
+        mgr = self.manager()
+        self.filter_templates(mgr, self.templates)
+        return self.write(mgr, 'serial.hdf')
+
+    def test_merge_events(self):
+        serial = self.serial_file()
+
+        # Filter uneven, contiguous blocks of the bank in separate
+        # managers, as the worker processes of pycbc_inspiral do, and
+        # merge them back in bank order
+        mgr = self.manager()
+        for shard in numpy.array_split(numpy.arange(len(self.templates)),
+                                       [1, 2, 9, 17]):
+            shard_mgr = self.manager()
+            self.filter_templates(shard_mgr,
+                                  [self.templates[i] for i in shard])
+            shard_mgr.finalize_events()
+            mgr.merge_events(shard_mgr)
+        self.assertEqual(mgr.template_index, len(self.templates) - 1)
+        merged = self.write(mgr, 'merged.hdf')
+
+        self.assert_files_equal(serial, merged)
+        with h5py.File(serial, 'r') as f:
+            self.assertTrue(len(f['H1/snr']) > 50)
+            self.assertTrue(len(numpy.unique(f['H1/template_hash'][:])) > 5)
+
+    def test_stream_events(self):
+        serial = self.serial_file()
+
+        for interval in [1, 4, 100]:
+            mgr = self.manager()
+            streamed = os.path.join(self.directory,
+                                    'streamed%s.hdf' % interval)
+            mgr.stream_events(streamed, interval)
+            self.filter_templates(mgr, self.templates)
+            # Only the triggers since the last write are held in memory
+            self.assertTrue(len(mgr.accumulate) <= interval + 1)
+            self.assertTrue(os.path.exists(streamed + '.partial'))
+            self.assertFalse(os.path.exists(streamed))
+            self.write(mgr, os.path.basename(streamed))
+
+            self.assertFalse(os.path.exists(streamed + '.partial'))
+            self.assert_files_equal(serial, streamed)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestEventManager))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
@@ -141,6 +141,129 @@ class TestMatchedFilter(unittest.TestCase):
 
             self.assertRaises(ValueError,match,self.filt,self.filt[0:len(self.filt)-1])
 
+    def test_batch_matched_filter_control(self):
+        if self.scheme != 'cpu':
+            return
+        with self.context:
+            # Filter a few noise templates against a noise segment, both one
+            # at a time and as a batch, and check the triggers agree
+            numpy.random.seed(1)
+            tlen = 4096 * 4
+            delta_t = 1.0 / 4096
+            data = TimeSeries(numpy.random.normal(size=tlen), dtype=float32,
+                              delta_t=delta_t)
+            stilde = make_frequency_series(data)
+            stilde.analyze = slice(1024, tlen - 1024)
+            delta_f = stilde.delta_f
+            flen = len(stilde)
+
+            templates = []
+            for _ in range(3):
+                h = TimeSeries(numpy.random.normal(size=tlen), dtype=float32,
+                               delta_t=delta_t)
+                templates.append(make_frequency_series(h))
+
+            template_mem = zeros(tlen, dtype=complex64)
+            single = MatchedFilterControl(20, None, 4.0, tlen, delta_f,
+                                          complex64, [stilde], template_mem,
+                                          True, cluster_function='findchirp')
+            batch = BatchMatchedFilterControl(20, None, 4.0, tlen, delta_f,
+                                              complex64, [stilde], 4, True,
+                                              cluster_function='findchirp')
+            for row, htilde in enumerate(templates):
+                batch.template_output[row][:flen] = htilde
+            batch.set_templates(len(templates))
+
+            norms = [sigmasq(h, low_frequency_cutoff=20) for h in templates]
+            results = batch.matched_filter_and_cluster(0, norms,
+                                                       [256] * len(templates))
+            for htilde, norm, result in zip(templates, norms, results):
+                template_mem[:flen] = htilde
+                _, snorm, _, sidx, ssnrv = \
+                    single.matched_filter_and_cluster(0, norm, 256)
+                _, bnorm, _, bidx, bsnrv = result
+                self.assertEqual(len(sidx), len(bidx))
+                if len(sidx):
+                    self.assertAlmostEqual(snorm, bnorm)
+                    numpy.testing.assert_array_equal(sidx, bidx)
+                    numpy.testing.assert_allclose(abs(ssnrv), abs(bsnrv),
+                                                  rtol=1e-4)
+
+    def test_adaptive_heirarchical_matched_filter(self):
+        if self.scheme != 'cpu':
+            return
+        from pycbc.waveform import get_fd_waveform
+        with self.context:
+            # Add a loud signal to white noise, and check that the adaptive
+            # heirarchical filter finds the same trigger as the full rate
+            # filter
+            numpy.random.seed(2)
+            sample_rate = 4096
+            tlen = sample_rate * 16
+            delta_t = 1.0 / sample_rate
+            flow = 30.0
+            data = TimeSeries(numpy.random.normal(size=tlen), dtype=float32,
+                              delta_t=delta_t)
+            stilde = make_frequency_series(data)
+            delta_f = stilde.delta_f
+            flen = len(stilde)
+            psd = FrequencySeries(numpy.ones(flen) * 2 * delta_t,
+                                  delta_f=delta_f, dtype=float32)
+
+            hp, _ = get_fd_waveform(approximant='TaylorF2', mass1=10,
+                                    mass2=10, f_lower=flow, delta_f=delta_f)
+            hp.resize(flen)
+            htilde = FrequencySeries(hp, delta_f=delta_f, dtype=complex64)
+            htilde.end_idx = numpy.flatnonzero(htilde.numpy())[-1] + 1
+            norm = sigmasq(htilde, psd, low_frequency_cutoff=flow)
+
+            # Place the signal 9.3 s into the segment with an SNR of 20
+            shift = numpy.exp(-2j * numpy.pi * 9.3 *
+                              htilde.sample_frequencies.numpy())
+            signal = 20 / norm ** 0.5 * htilde.numpy() * shift
+            stilde = FrequencySeries((stilde.numpy() + signal) / psd.numpy(),
+                                     delta_f=delta_f, dtype=complex64)
+            stilde.analyze = slice(sample_rate * 2, tlen - sample_rate * 2)
+            stilde.psd = psd
+
+            full_mem = zeros(tlen, dtype=complex64)
+            full_mem[:flen] = htilde
+            full = MatchedFilterControl(flow, None, 8.0, tlen, delta_f,
+                                        complex64, [stilde], full_mem,
+                                        True, cluster_function='findchirp')
+            _, fnorm, _, fidx, fsnrv = \
+                full.matched_filter_and_cluster(0, norm, sample_rate)
+
+            red_mem = zeros(tlen, dtype=complex64)
+            red_mem[:flen] = htilde
+            template = FrequencySeries(red_mem[:flen], delta_f=delta_f,
+                                       copy=False)
+            template.end_idx = htilde.end_idx
+            adaptive = MatchedFilterControl(flow, None, 8.0, tlen, delta_f,
+                                            complex64, [stilde], red_mem,
+                                            True, downsample_factor=32,
+                                            upsample_threshold=0.7,
+                                            adaptive_downsample=True)
+            _, anorm, _, aidx, asnrv = \
+                adaptive.matched_filter_and_cluster(0, norm, sample_rate,
+                                                    htilde=template)
+
+            # The template ends below 256 Hz, so a reduced rate of 256 Hz
+            # keeps all of its sigmasq but 128 Hz does not
+            factor, fraction = adaptive.choose_downsample_factor(template,
+                                                                 psd)
+            self.assertEqual(factor, 16)
+            self.assertEqual(fraction, 1.0)
+            self.assertEqual(adaptive.downsample_counts, {16: 1})
+
+            self.assertEqual(len(fidx), 1)
+            self.assertAlmostEqual(fnorm, anorm)
+            numpy.testing.assert_array_equal(fidx, aidx)
+            numpy.testing.assert_allclose(abs(fsnrv), abs(asnrv), rtol=1e-4)
+            self.assertAlmostEqual(abs(fsnrv[0]) * fnorm, 20, delta=1)
+            self.assertEqual(fidx[0] + stilde.analyze.start,
+                             int(9.3 * sample_rate))
+
 
 suite = unittest.TestSuite()
 suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestMatchedFilter))
@@ -125,6 +125,80 @@ class TestPSD(unittest.TestCase):
                                 msg='seg_len=%d max_len=%d -> rms=%.3f' \
                                 % (seg_len, max_len, err_rms))
 
+    def test_incremental_welch(self):
+        """Test the incremental Welch estimate against welch on a stream"""
+        seg_len = 4096
+        window_len = 16 * seg_len // 2
+        step = seg_len
+        for method in ('mean', 'median', 'median-mean'):
+            with self.context:
+                estimator = pycbc.psd.IncrementalWelch(
+                        seg_len=seg_len, seg_stride=seg_len//2,
+                        avg_method=method)
+                noise = self.noise.copy()
+                for end in range(window_len, len(noise), step):
+                    if end == 4 * window_len:
+                        # Change data the estimator has already seen
+                        noise[end - 3 * step:end - 2 * step] *= 2
+                        estimator.invalidate(noise.start_time +
+                                             (end - 3 * step) * noise.delta_t)
+                    data = noise[end - window_len:end]
+                    psd = estimator.estimate(data)
+                    expected = pycbc.psd.welch(data, seg_len=seg_len,
+                                               seg_stride=seg_len//2,
+                                               avg_method=method)
+                    self.assertEqual(psd.delta_f, expected.delta_f)
+                    self.assertEqual(psd.start_time, expected.start_time)
+                    numpy.testing.assert_allclose(psd.numpy(),
+                                                  expected.numpy(),
+                                                  rtol=1e-6)
+            # Only the new segments are Fourier transformed
+            self.assertTrue(estimator.num_computed < 3 * len(noise) // step)
+
+    def test_psd_cache(self):
+        """Test the cache of interpolated and truncated PSDs"""
+        with self.context:
+            psd = pycbc.psd.welch(self.noise, seg_len=4096, seg_stride=2048)
+            cache = pycbc.psd.PSDCache(1024, low_frequency_cutoff=10.)
+            self.assertRaises(ValueError, cache.get, 0.25)
+            cache.update(psd)
+            for delta_f in (0.25, 0.125):
+                derived = cache.get(delta_f)
+                expected = pycbc.psd.interpolate(psd, delta_f)
+                expected = pycbc.psd.inverse_spectrum_truncation(expected,
+                        1024, low_frequency_cutoff=10.)
+                self.assertEqual(derived.delta_f, delta_f)
+                numpy.testing.assert_allclose(derived.numpy(),
+                                              expected.numpy())
+                self.assertTrue(cache.get(delta_f) is derived)
+
+            # A new PSD replaces all the derived forms at once
+            cache.update(psd * 2)
+            self.assertEqual(len(cache.cache), 2)
+            self.assertFalse(cache.get(0.25) is derived)
+            numpy.testing.assert_allclose(cache.get(0.125).numpy(),
+                                          2 * derived.numpy())
+
+    def test_mean_square(self):
+        """Test the PSD variation mean square, in full and as a stream"""
+        srate = 64
+        data = self.noise.numpy()[:100 * srate]
+        short_ms = numpy.mean(data.reshape(-1, srate // 4) ** 2, axis=1)
+        ave = 0.5 * (short_ms[2:] + short_ms[:-2])
+        outliers = short_ms[1:-1] > 2. * ave
+        short_ms[1:-1][outliers] = ave[outliers]
+        expected = [numpy.mean(short_ms[4 * i:4 * i + 32])
+                    for i in range(93)]
+        m_s = pycbc.psd.mean_square(data, 100, srate, 0.25, 8)
+        numpy.testing.assert_allclose(m_s, expected)
+
+        # The last window is only known once the stream goes past it
+        stream = pycbc.psd.StreamingMeanSquare(srate, 0.25, 8)
+        m_s = numpy.concatenate([stream.update(data[i:i + 300])
+                                 for i in range(0, len(data), 300)])
+        self.assertEqual(len(m_s), 92)
+        numpy.testing.assert_allclose(m_s, expected[:92])
+
 suite = unittest.TestSuite()
 suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestPSD))
 
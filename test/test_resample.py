@@ -31,6 +31,7 @@ from pycbc.filter import *
 from pycbc.scheme import *
 from utils import parse_args_all_schemes, simple_exit
 from numpy.random import uniform
+import numpy
 import scipy.signal
 from pycbc.filter.resample import lfilter
 
@@ -85,6 +86,27 @@ class TestUtils(unittest.TestCase):
 
         self.assertTrue(maxreldiff < 1e-7)
 
+    def test_streaming_fir(self):
+        "Check filtering a stream in blocks against the whole stream"
+        ts = TimeSeries(uniform(-1, 1, size=4096 * 16), delta_t=self.delta_t)
+        highpassed = highpass_fir(ts, 30, 256)
+        resampled = resample_to_delta_t(ts, self.target_delta_t,
+                                        method='ldas')
+        for stream, ref in \
+                [(streaming_highpass_fir(self.delta_t, 30, 256), highpassed),
+                 (streaming_resampler(self.delta_t, self.target_delta_t),
+                  resampled)]:
+            blocks = [stream.process(ts.numpy()[i:i + 1000])
+                      for i in range(0, len(ts), 1000)]
+            test = numpy.concatenate(blocks)
+            self.assertEqual(len(test), stream.num_output)
+
+            # The whole stream is only corrupted at its ends
+            half = len(stream.coefficients) // 2
+            skip = half // stream.factor + 1
+            numpy.testing.assert_allclose(test[skip:], ref[skip:len(test)],
+                                          atol=1e-10)
+
 suite = unittest.TestSuite()
 suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestUtils))
 
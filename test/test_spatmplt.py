@@ -71,6 +71,31 @@ class TestSPAtmplt(unittest.TestCase):
 
                             print("checked m1: %s m2:: %s s1z: %s s2z: %s] overlap = %s, diff = %s" % (m1, m2, s1, s2, o, diff))
 
+    def test_spatmplt_bulk(self):
+        if self.scheme != 'cpu':
+            return
+        from pycbc.waveform.spa_tmplt import spa_tmplt_bulk
+        fl = 25
+        delta_f = 1.0 / 256
+        flen = int(1024 / delta_f) + 1
+        params = [(1.4, 1.4, 0, 0), (1.2, 1.8, 0.3, -0.2), (3.0, 1.4, -0.5, 0.4)]
+
+        with self.context:
+            outs = [zeros(flen, dtype=complex64) for _ in params]
+            m1, m2, s1, s2 = zip(*params)
+            bulk = spa_tmplt_bulk(outs, m1, m2, s1, s2, fl, delta_f)
+
+            # Each template of the block should match one generated alone
+            for hb, (m1, m2, s1, s2) in zip(bulk, params):
+                out = zeros(flen, dtype=complex64)
+                hp = get_waveform_filter(out, mass1=m1, mass2=m2, spin1z=s1,
+                                         spin2z=s2, delta_f=delta_f,
+                                         f_lower=fl, approximant="SPAtmplt",
+                                         spin_order=-1, phase_order=-1,
+                                         distance=1.0)
+                self.assertEqual(len(hb), len(hp))
+                self.assertEqual(abs((hb - hp).numpy()).max(), 0)
+
 
 suite = unittest.TestSuite()
 suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestSPAtmplt))
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import h5py
+
+from utils import parse_args_cpu_only, simple_exit
+
+from pycbc.events.stat import SparseBinIndex
+
+parse_args_cpu_only("events.stat")
+
+
+class TestSparseBinIndex(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(4)
+        self.directory = tempfile.mkdtemp()
+        self.dtype = [('c%s' % i, numpy.int8) for i in range(6)]
+
+        # Sparse, sorted and unique histogram bins, as in the statistic files
+        bins = numpy.zeros(5000, dtype=self.dtype)
+        for i, (col, _) in enumerate(self.dtype):
+            bins[col] = numpy.random.randint(-10 - i, 12, size=len(bins))
+        self.param_bin = numpy.unique(bins)
+
+        # Look up every bin, and as many bins which are missing, some of
+        # them outside of the range of the indexed bins
+        missing = numpy.zeros(len(self.param_bin), dtype=self.dtype)
+        for col, _ in self.dtype:
+            missing[col] = numpy.random.randint(-30, 30, size=len(missing))
+        queries = numpy.concatenate([self.param_bin, missing])
+        self.queries = queries[numpy.random.permutation(len(queries))]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def searchsorted_lookup(self, bins):
+        """The position of each bin as found by the searchsorted path of
+        PhaseTDStatistic, or -1 if it is missing
+        """
+        loc = numpy.searchsorted(self.param_bin, bins)
+        loc[loc == len(self.param_bin)] = 0
+        loc[self.param_bin[loc] != bins] = -1
+        return loc
+
+    def test_lookup(self):
+        index = SparseBinIndex(self.param_bin)
+        loc = index.lookup(self.queries)
+        expected = self.searchsorted_lookup(self.queries)
+        numpy.testing.assert_array_equal(loc, expected)
+        self.assertTrue((loc < 0).sum() > len(self.queries) // 4)
+        self.assertTrue((loc >= 0).sum() >= len(self.param_bin))
+        self.assertEqual(len(index.lookup(self.queries[:0])), 0)
+
+    def test_from_group(self):
+        filename = os.path.join(self.directory, 'stat.hdf')
+        with h5py.File(filename, 'w') as f:
+            f.create_group('H1')['param_bin'] = self.param_bin
+            SparseBinIndex(self.param_bin).save(f['H1'])
+            f.create_group('L1')['param_bin'] = self.param_bin
+
+        expected = self.searchsorted_lookup(self.queries)
+        with h5py.File(filename, 'r') as f:
+            # The stored table is memory mapped
+            index = SparseBinIndex.from_group(self.param_bin, f['H1'])
+            self.assertIsInstance(index.table, numpy.memmap)
+            numpy.testing.assert_array_equal(index.lookup(self.queries),
+                                             expected)
+
+            # Without a stored table it is made from the bins
+            index = SparseBinIndex.from_group(self.param_bin, f['L1'])
+            numpy.testing.assert_array_equal(index.lookup(self.queries),
+                                             expected)
+
+            # A table made for other bins is rejected
+            self.assertRaises(ValueError, SparseBinIndex.from_group,
+                              self.param_bin[:len(self.param_bin) // 4],
+                              f['H1'])
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestSparseBinIndex))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
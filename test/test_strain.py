@@ -0,0 +1,77 @@
+import unittest
+import numpy
+
+from utils import parse_args_cpu_only, simple_exit
+
+from pycbc.types import TimeSeries
+from pycbc.strain.strain import _StrainStore
+
+parse_args_cpu_only("strain.StrainBuffer store")
+
+
+class TestStrainStore(unittest.TestCase):
+    def setUp(self):
+        numpy.random.seed(22)
+        self.delta_t = 1. / 256
+        self.epoch = 1000000000
+
+    def check_advance(self, length, steps):
+        store = _StrainStore(length, self.delta_t, self.epoch)
+        data = numpy.random.normal(size=length).astype(numpy.float32)
+        store.series.numpy()[:] = data
+        ref = TimeSeries(data.copy(), delta_t=self.delta_t,
+                         epoch=self.epoch)
+
+        wraps = 0
+        for num in steps:
+            offset = store.offset
+            start_time = store.series.start_time
+            series = store.advance(num)
+            if store.offset < offset + num:
+                wraps += 1
+
+            # The series is a view of the store, which keeps the epoch and
+            # the samples which were not dropped
+            self.assertIs(series, store.series)
+            self.assertEqual(len(series), length)
+            self.assertEqual(series.start_time, start_time)
+            self.assertEqual(series.delta_t, self.delta_t)
+            self.assertTrue(numpy.may_share_memory(series.numpy(),
+                                                   store.store.numpy()))
+            ref.roll(-num)
+            keep = max(length - num, 0)
+            numpy.testing.assert_array_equal(series.numpy()[:keep],
+                                             ref.numpy()[:keep])
+
+            # Fill in the new samples as StrainBuffer does
+            new = numpy.random.normal(size=min(num, length))
+            series.start_time += num * self.delta_t
+            series.numpy()[keep:] = new
+            ref.start_time += num * self.delta_t
+            ref.numpy()[keep:] = new
+            numpy.testing.assert_array_equal(series.numpy(), ref.numpy())
+            self.assertEqual(series.start_time, ref.start_time)
+        return wraps
+
+    def test_random_steps(self):
+        length = 1000
+        steps = numpy.random.randint(1, 300, 60)
+        self.assertTrue(self.check_advance(length, steps) >= 5)
+
+    def test_long_steps(self):
+        # Steps of at least the length of the series replace all the data
+        length = 64
+        steps = [1, 64, 3, 100, 63, 200, 64, 64, 5, 127, 128, 129, 30, 40]
+        self.assertTrue(self.check_advance(length, steps) >= 5)
+
+    def test_zero_step(self):
+        steps = [0, 10, 0, 30, 0, 50, 0, 45]
+        self.check_advance(50, steps)
+
+
+suite = unittest.TestSuite()
+suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestStrainStore))
+
+if __name__ == '__main__':
+    results = unittest.TextTestRunner(verbosity=2).run(suite)
+    simple_exit(results)
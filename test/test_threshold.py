@@ -58,6 +58,23 @@ class TestThreshold(unittest.TestCase):
             self.assertTrue((locs == self.locs).all())
             self.assertTrue((vals == self.vals).all())
             print(len(locs), len(vals))
+
+    def test_cluster_reduce_segmented(self):
+        # Clustering several series at once should match clustering each
+        # series on its own
+        idxs = []
+        snrs = []
+        for n in [0, 10, 500, 1]:
+            idx = numpy.sort(numpy.random.choice(2**16, n, replace=False))
+            idxs.append(idx.astype(numpy.uint32))
+            snrs.append(numpy.random.uniform(size=n).astype(complex64))
+        windows = [16, 100, 1000, 1]
+        cidxs, csnrs = cluster_reduce_segmented(idxs, snrs, windows)
+        for i, cidx, csnr in zip(range(len(idxs)), cidxs, csnrs):
+            idx, snr = cluster_reduce(idxs[i], snrs[i], windows[i])
+            self.assertTrue((idx == cidx).all())
+            self.assertTrue((snr == csnr).all())
+
 suite = unittest.TestSuite()
 suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestThreshold))
 
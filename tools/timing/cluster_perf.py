@@ -0,0 +1,49 @@
+from pycbc.events import cluster_reduce, cluster_reduce_segmented
+from pycbc.events.coinc import cluster_over_time
+from time import time
+import numpy
+niter = 20
+
+# FindChirp clustering of the triggers of many templates, one call per
+# template against a single segmented call
+for ntemplates in [16, 256]:
+    for nabove in [100, 10000]:
+        idxs = []
+        snrs = []
+        for _ in range(ntemplates):
+            idx = numpy.sort(numpy.random.choice(2**20, nabove, replace=False))
+            idxs.append(idx.astype(numpy.uint32))
+            snrs.append((numpy.random.normal(size=nabove) +
+                         1j * numpy.random.normal(size=nabove))
+                        .astype(numpy.complex64))
+        windows = [4096] * ntemplates
+
+        t1 = time()
+        for i in range(niter):
+            for idx, snr, window in zip(idxs, snrs, windows):
+                cluster_reduce(idx, snr, window)
+        t2 = time()
+        for i in range(niter):
+            cluster_reduce_segmented(idxs, snrs, windows)
+        t3 = time()
+        print("Cluster Perf Templates:{} Triggers:{} Loop:{:3.3f} "
+              "Segmented:{:3.3f}".format(ntemplates, nabove,
+                                         (t2-t1)*1000 / niter,
+                                         (t3-t2)*1000 / niter))
+
+
+def loop_argmax(v):
+    return numpy.argmax(v)
+
+# Clustering of coincidences over time, the vectorized window test against
+# the scan that is still used for a custom argmax
+for N in [10**4, 10**5, 10**6]:
+    time_vec = numpy.random.uniform(0, 10**6, size=N)
+    stat = numpy.random.normal(size=N)
+    t1 = time()
+    cluster_over_time(stat, time_vec, 10.0)
+    t2 = time()
+    cluster_over_time(stat, time_vec, 10.0, argmax=loop_argmax)
+    t3 = time()
+    print("Cluster Over Time Perf Size:{} Vectorized:{:3.3f} "
+          "Scan:{:3.3f}".format(N, (t2-t1)*1000, (t3-t2)*1000))
@@ -0,0 +1,59 @@
+from pycbc.events.coinc import time_coincidence, time_coincidence_chunks
+from time import time
+import numpy
+import tracemalloc
+
+
+def time_coincidence_list(t1, t2, window, slide_step=0):
+    # The previous implementation, which copied the folded times for the
+    # slides and expanded the matches with a list comprehension
+    fold1 = t1 % slide_step
+    fold2 = t2 % slide_step
+    sort1 = fold1.argsort()
+    sort2 = fold2.argsort()
+    fold1 = fold1[sort1]
+    fold2 = fold2[sort2]
+    fold2 = numpy.concatenate([fold2 - slide_step, fold2, fold2 + slide_step])
+    sort2 = numpy.concatenate([sort2, sort2, sort2])
+    left = numpy.searchsorted(fold2, fold1 - window)
+    right = numpy.searchsorted(fold2, fold1 + window)
+    idx1 = numpy.repeat(sort1, right - left)
+    idx2 = numpy.concatenate([sort2[l:r] for l, r in zip(left, right)])
+    diff = ((t1 / slide_step)[idx1] - (t2 / slide_step)[idx2])
+    slide = numpy.rint(diff)
+    return idx1.astype(numpy.uint32), idx2.astype(numpy.uint32), slide.astype(numpy.int32)
+
+# Triggers of a single template over a day of data, slid by 0.1s
+duration = 86400.
+window = 0.015
+slide_step = 0.1
+
+numpy.random.seed(0)
+for ntrigs in [1000, 3000, 10000]:
+    t1 = 1e9 + numpy.random.uniform(0, duration, size=ntrigs)
+    t2 = 1e9 + numpy.random.uniform(0, duration, size=ntrigs)
+
+    def run(func):
+        # Return the run time and the peak memory in MB
+        tracemalloc.start()
+        t = time()
+        func()
+        t = time() - t
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        return t, peak
+
+    def chunked():
+        for _ in time_coincidence_chunks(t1, t2, window, slide_step,
+                                         max_pairs=2**20):
+            pass
+
+    ncoincs = len(time_coincidence(t1, t2, window, slide_step)[0])
+    tlist, mlist = run(lambda: time_coincidence_list(t1, t2, window,
+                                                     slide_step))
+    tvec, mvec = run(lambda: time_coincidence(t1, t2, window, slide_step))
+    tchunk, mchunk = run(chunked)
+
+    print("Time Coinc Perf Triggers:{} Coincs:{} List:{:3.3f}s {:.0f}MB "
+          "Vectorized:{:3.3f}s {:.0f}MB Chunked:{:3.3f}s {:.0f}MB".format(
+              ntrigs, ncoincs, tlist, mlist, tvec, mvec, tchunk, mchunk))
@@ -0,0 +1,43 @@
+from pycbc.events.coinc import LiveCoincTimeslideBackgroundEstimator
+from time import time
+import numpy
+
+# Replay a synthetic stream of single detector triggers through the live
+# coincidence and background estimator, with a glitch in one block
+ntemplates = 100000
+block = 8
+nblocks = 100
+glitch_block = nblocks // 2
+ifos = ['H1', 'L1']
+
+numpy.random.seed(0)
+est = LiveCoincTimeslideBackgroundEstimator(ntemplates, block, 'newsnr', [],
+                                            ifos, ifar_limit=10)
+
+
+def singles(num, start):
+    return {'snr': numpy.random.uniform(5.5, 8, size=num).astype(numpy.float32),
+            'end_time': start + numpy.random.uniform(0, block, size=num),
+            'template_id': numpy.random.randint(0, ntemplates, size=num),
+            'chisq': numpy.random.uniform(0.5, 2, size=num).astype(numpy.float32),
+            'chisq_dof': numpy.zeros(num, dtype=numpy.int32) + 30,
+            'coa_phase': numpy.random.uniform(0, 2 * numpy.pi, size=num)
+                              .astype(numpy.float32),
+            'sigmasq': numpy.ones(num, dtype=numpy.float32)}
+
+for nsingles in [10, 100, 1000]:
+    times = []
+    for i in range(nblocks):
+        start = 1e9 + i * block
+        results = {}
+        for ifo in ifos:
+            num = nsingles * 10 if i == glitch_block else nsingles
+            results[ifo] = singles(num, start)
+        t1 = time()
+        est.add_singles(results)
+        times.append(time() - t1)
+
+    print("Live Coinc Perf Singles:{} Mean:{:3.3f} Glitch:{:3.3f} "
+          "Background:{}".format(nsingles, numpy.mean(times) * 1000,
+                                 times[glitch_block] * 1000,
+                                 len(est.coincs)))
@@ -0,0 +1,46 @@
+from pycbc.types import TimeSeries, zeros
+from pycbc.strain.strain import _StrainStore
+from time import time
+import numpy
+import tracemalloc
+
+# Advance the strain of a live analysis by 8s blocks and write the new
+# data, with the previous roll of the whole buffer and with the store
+sample_rate = 4096
+block = 8
+niter = 100
+sample_step = block * sample_rate
+new_data = numpy.random.normal(size=sample_step).astype(numpy.float32)
+
+
+def run(func):
+    # Return the time per block in ms and the peak memory in MB
+    tracemalloc.start()
+    t = time()
+    for _ in range(niter):
+        func()
+    t = (time() - t) / niter * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return t, peak
+
+for duration in [64, 256, 1024]:
+    length = duration * sample_rate
+    strain = TimeSeries(zeros(length, dtype=numpy.float32),
+                        delta_t=1.0 / sample_rate)
+    store = _StrainStore(length, 1.0 / sample_rate, 0)
+
+    def roll():
+        strain.roll(-sample_step)
+        strain[length - sample_step:] = new_data
+
+    def advance():
+        series = store.advance(sample_step)
+        series[length - sample_step:] = new_data
+
+    troll, mroll = run(roll)
+    tstore, mstore = run(advance)
+
+    print("Strain Buffer Perf Buffer:{}s Roll:{:3.3f}ms {:.0f}MB "
+          "Store:{:3.3f}ms {:.0f}MB".format(duration, troll, mroll,
+                                            tstore, mstore))